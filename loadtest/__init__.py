@@ -0,0 +1,10 @@
+"""
+Load testing for the Slack Events, Zendesk comment and email webhooks.
+
+The fakes module runs local stand-ins for the Slack, Zendesk and PagerDuty APIs
+the bot talks to. The generate module drives a running webapp with synthetic
+Slack events and Zendesk triggers and reports how it coped.
+
+See the "Load Testing" section of the README.
+
+"""
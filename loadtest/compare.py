@@ -0,0 +1,102 @@
+"""
+Run the same load against the webapp served in different ways and compare.
+
+Each target is given as name=url, e.g. the webapp under WSGI and ASGI both
+talking to the same fakes (see loadtest.fakes). loadtest.generate is run
+against each in turn with the same options, and the throughput and latency
+of each are printed side by side.
+
+    python -m loadtest.compare wsgi=http://127.0.0.1:8000 \\
+        asgi=http://127.0.0.1:8001 -- --rate 50 --duration 60
+
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+
+from loadtest import generate
+
+
+def parse_target(target):
+    """Turn 'wsgi=http://127.0.0.1:8000' into ('wsgi', 'http://...')."""
+    name, _, url = target.partition('=')
+    if not url:
+        raise argparse.ArgumentTypeError(
+            f"Expected name=url and not '{target}'"
+        )
+
+    return name, url
+
+
+def run(url, generate_args):
+    """Run loadtest.generate against the url and return its report."""
+    fd, path = tempfile.mkstemp(suffix='.json')
+    os.close(fd)
+    try:
+        generate.main(list(generate_args) + ['--target', url, '--json', path])
+        with open(path) as fd:
+            return json.load(fd)
+
+    finally:
+        os.remove(path)
+
+
+def print_comparison(results):
+    """Print a row per named report from run()."""
+    def ms(value):
+        return '-' if value is None else f"{value * 1000:.1f}ms"
+
+    print(
+        f"\n{'target':<10}{'sent':>8}{'req/s':>10}{'errors':>8}"
+        f"{'p50':>12}{'p95':>12}{'p99':>12}{'max':>12}"
+    )
+    for name, result in results.items():
+        latency = result['latency']
+        errors = sum(
+            count for status, count in result['statuses'].items()
+            if not status.startswith('2')
+        )
+        print(
+            f"{name:<10}{result['sent']:>8}{result['throughput']:>10.1f}"
+            f"{errors:>8}{ms(latency['p50']):>12}{ms(latency['p95']):>12}"
+            f"{ms(latency['p99']):>12}{ms(latency['max']):>12}"
+        )
+
+
+def split_argv(argv=None):
+    """Split the arguments before and after '--'."""
+    argv = list(sys.argv[1:] if argv is None else argv)
+    if '--' in argv:
+        index = argv.index('--')
+        return argv[:index], argv[index + 1:]
+
+    return argv, []
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description=__doc__.split('\n\n')[1],
+        epilog='Options after -- are passed to loadtest.generate.',
+    )
+    parser.add_argument('targets', nargs='+', type=parse_target,
+                        help='name=url of each running webapp.')
+    parser.add_argument('--json', help='Also write the reports to this file.')
+    argv, generate_args = split_argv(argv)
+    args = parser.parse_args(argv)
+
+    results = {}
+    for name, url in args.targets:
+        print(f"\n== {name} ({url}) ==")
+        results[name] = run(url, generate_args)
+
+    print_comparison(results)
+
+    if args.json:
+        with open(args.json, 'w') as fd:
+            json.dump(results, fd, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,541 @@
+"""
+Local stand-ins for the Slack, Zendesk and PagerDuty APIs.
+
+Each fake is a small threaded HTTP server which understands just the calls the
+bot makes. Every response can be delayed and a token bucket rate limit applied,
+answering with 429 and Retry-After like the real services do. Random 429s can
+also be injected.
+
+GET /_stats on any fake returns the calls it received, per endpoint, and how
+many were throttled. POST /_reset clears the counts. The other /_ paths are
+for the load generator to set up conversations and are not counted.
+
+Run all three with:
+
+    python -m loadtest.fakes --latency 0.05 --rate-limit 50
+
+"""
+import argparse
+import itertools
+import json
+import logging
+import random
+import re
+import threading
+import time
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler
+from http.server import ThreadingHTTPServer
+from urllib.parse import parse_qs
+from urllib.parse import urlencode
+from urllib.parse import urlparse
+
+
+class Behaviour(object):
+    """How a fake service should misbehave.
+
+    :param latency: Seconds to wait before answering each call.
+
+    :param jitter: Up to this many seconds are randomly added to the latency.
+
+    :param rate_limit: Calls per second allowed, 0 for no limit.
+
+    :param burst: The calls allowed at once before the rate limit applies.
+
+    :param error_rate: The fraction (0.0 - 1.0) of calls answered with a 429.
+
+    :param retry_after: The Retry-After seconds given with a 429.
+
+    """
+    def __init__(
+        self, latency=0.0, jitter=0.0, rate_limit=0, burst=None,
+        error_rate=0.0, retry_after=1
+    ):
+        self.latency = latency
+        self.jitter = jitter
+        self.rate_limit = rate_limit
+        self.burst = burst if burst is not None else max(rate_limit, 1)
+        self.error_rate = error_rate
+        self.retry_after = retry_after
+
+
+class FakeService(object):
+    """The behaviour and statistics common to all the fakes.
+
+    Sub-classes implement route() for the endpoints they understand.
+
+    """
+    name = 'fake'
+
+    def __init__(self, behaviour=None):
+        self.behaviour = behaviour or Behaviour()
+        # Set by serve(), for the links to further pages:
+        self.base_url = None
+        self._lock = threading.Lock()
+        self._tokens = float(self.behaviour.burst)
+        self._last = time.monotonic()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.calls = Counter()
+            self.throttled = Counter()
+
+    def stats(self):
+        with self._lock:
+            return dict(
+                service=self.name,
+                total=sum(self.calls.values()),
+                throttled=sum(self.throttled.values()),
+                calls=dict(self.calls),
+                throttled_calls=dict(self.throttled),
+            )
+
+    def admit(self):
+        """Take a token from the bucket, False if the call is rate limited."""
+        if not self.behaviour.rate_limit:
+            return True
+
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(
+                float(self.behaviour.burst),
+                self._tokens + (now - self._last) * self.behaviour.rate_limit
+            )
+            self._last = now
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return True
+
+        return False
+
+    def endpoint(self, method, path):
+        """The name to count calls under, ids are removed from the path."""
+        return f"{method} {re.sub(r'/[0-9]+', '/{id}', path)}"
+
+    def rate_limited(self):
+        """Return the (status, data) for a 429 response."""
+        return 429, dict(error='Rate limited')
+
+    def handle(self, method, path, query, body):
+        """Apply the behaviour, count the call and route it.
+
+        :returns: (status, data, headers)
+
+        """
+        if path == '/_stats':
+            return 200, self.stats(), {}
+
+        if path == '/_reset':
+            self.reset()
+            return 200, self.stats(), {}
+
+        if path.startswith('/_'):
+            # Load generator set up, not a call the bot made:
+            status, data = self.route(method, path, query, body)
+            return status, data, {}
+
+        endpoint = self.endpoint(method, path)
+        with self._lock:
+            self.calls[endpoint] += 1
+
+        delay = self.behaviour.latency + random.uniform(
+            0, self.behaviour.jitter
+        )
+        if delay > 0:
+            time.sleep(delay)
+
+        if not self.admit() or random.random() < self.behaviour.error_rate:
+            with self._lock:
+                self.throttled[endpoint] += 1
+            status, data = self.rate_limited()
+            return status, data, {
+                'Retry-After': str(self.behaviour.retry_after)
+            }
+
+        status, data = self.route(method, path, query, body)
+        return status, data, {}
+
+    def route(self, method, path, query, body):
+        """Over-ridden to answer the calls.
+
+        :param method: GET, POST, PUT.
+
+        :param path: The URL path.
+
+        :param query: A dict of the query string parameters.
+
+        :param body: A dict of the JSON or form encoded body.
+
+        :returns: (status, data)
+
+        """
+        return 404, dict(error='Not found')
+
+    def serve(self, host='127.0.0.1', port=0):
+        """Start serving on a background thread.
+
+        :returns: The ThreadingHTTPServer, its server_address has the port.
+
+        """
+        server = ThreadingHTTPServer((host, port), handler_for(self))
+        self.base_url = f"http://{host}:{server.server_address[1]}"
+        server.daemon_threads = True
+        thread = threading.Thread(target=server.serve_forever, daemon=True)
+        thread.start()
+        logging.getLogger(__name__).info(
+            f"{self.name} listening on http://{host}:{server.server_address[1]}"
+        )
+        return server
+
+
+def handler_for(service):
+    """Return a request handler class for the given FakeService."""
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def log_message(self, format, *args):
+            logging.getLogger(__name__).debug(
+                f"{service.name}: {format % args}"
+            )
+
+        def _body(self):
+            length = int(self.headers.get('Content-Length') or 0)
+            if not length:
+                return {}
+
+            raw = self.rfile.read(length).decode()
+            if 'json' in (self.headers.get('Content-Type') or ''):
+                return json.loads(raw or '{}')
+
+            return {k: v[-1] for k, v in parse_qs(raw).items()}
+
+        def _handle(self):
+            url = urlparse(self.path)
+            query = {k: v[-1] for k, v in parse_qs(url.query).items()}
+            status, data, headers = service.handle(
+                self.command, url.path, query, self._body()
+            )
+            payload = json.dumps(data).encode()
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(payload)))
+            for key, value in headers.items():
+                self.send_header(key, value)
+            self.end_headers()
+            self.wfile.write(payload)
+
+        do_GET = _handle
+        do_POST = _handle
+        do_PUT = _handle
+
+    return Handler
+
+
+class FakeSlack(FakeService):
+    """The Slack Web API calls made through slack.WebClient.
+
+    Point settings.SLACK_API_URL at http://<host>:<port>/api/
+
+    """
+    name = 'slack'
+
+    def __init__(self, behaviour=None):
+        super().__init__(behaviour)
+        self._ts = itertools.count(int(time.time() * 1000000))
+        # (channel, thread ts) -> list of messages
+        self.threads = {}
+
+    def new_ts(self):
+        ts = str(next(self._ts))
+        return f"{ts[:-6]}.{ts[-6:]}"
+
+    def rate_limited(self):
+        return 429, dict(ok=False, error='ratelimited')
+
+    def route(self, method, path, query, body):
+        if path == '/_message':
+            # A message the load generator sent to the bot in an event:
+            self.record(body['channel'], body)
+            return 200, dict(ok=True)
+
+        params = dict(query, **body)
+        method_name = path.rsplit('/', 1)[-1]
+
+        if method_name == 'chat.postMessage':
+            ts = self.new_ts()
+            message = dict(
+                type='message', text=params.get('text', ''), ts=ts,
+                user='UFAKEBOT', bot_id='BFAKEBOT',
+            )
+            thread_ts = params.get('thread_ts') or ts
+            message['thread_ts'] = thread_ts
+            with self._lock:
+                self.threads.setdefault(
+                    (params.get('channel'), thread_ts), []
+                ).append(message)
+            return 200, dict(
+                ok=True, channel=params.get('channel'), ts=ts, message=message
+            )
+
+        if method_name == 'conversations.replies':
+            oldest = float(params.get('oldest') or 0)
+            with self._lock:
+                messages = list(
+                    self.threads.get((params.get('channel'), params.get('ts')), [])
+                )
+            messages = [
+                message for i, message in enumerate(messages)
+                if i == 0 or float(message['ts']) > oldest
+            ]
+            return 200, dict(ok=True, messages=messages, has_more=False)
+
+        if method_name == 'users.info':
+            user = params.get('user', 'UNKNOWN')
+            return 200, dict(ok=True, user=dict(
+                id=user,
+                real_name=f"Load Test {user}",
+                profile=dict(email=f"{user.lower()}@example.com"),
+            ))
+
+        return 200, dict(ok=True)
+
+    def record(self, channel, message):
+        """Remember a message sent to the bot so replies include it."""
+        thread_ts = message.get('thread_ts') or message['ts']
+        with self._lock:
+            self.threads.setdefault((channel, thread_ts), []).append(
+                dict(message, thread_ts=thread_ts)
+            )
+
+
+class FakeZendesk(FakeService):
+    """The Zendesk API v2 calls made through Zenpy.
+
+    Zenpy only talks https to <subdomain>.zendesk.com. Point it here by
+    setting the environment variables ZENPY_FORCE_SCHEME=http and
+    ZENPY_FORCE_NETLOC=<host>:<port>
+
+    POST /_ticket and /_comment let the load generator act as the customer
+    emailing in or an agent commenting on the ticket.
+
+    """
+    name = 'zendesk'
+
+    def __init__(self, behaviour=None):
+        super().__init__(behaviour)
+        self._ids = itertools.count(1000)
+        self.tickets = {}
+        self.comments = {}
+
+    def rate_limited(self):
+        return 429, dict(error='APIRateLimitExceeded')
+
+    def _now(self):
+        return datetime.now(timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ')
+
+    def add_ticket(self, ticket, channel='api'):
+        with self._lock:
+            ticket_id = next(self._ids)
+            ticket = dict(ticket, id=ticket_id, status='new')
+            ticket.setdefault('subject', 'Load test ticket')
+            comment = ticket.pop('comment', None) or dict(
+                body=ticket.get('description') or ticket['subject']
+            )
+            self.tickets[ticket_id] = ticket
+            self.comments[ticket_id] = []
+        self.add_comment(ticket_id, comment, channel)
+        return ticket
+
+    def add_comment(self, ticket_id, comment, channel='api'):
+        with self._lock:
+            comment = dict(
+                id=next(self._ids),
+                type='Comment',
+                body=comment.get('body', ''),
+                author_id=comment.get('author_id', 1),
+                public=True,
+                created_at=self._now(),
+                via=dict(channel=channel, source=dict(to={}, rel=None)),
+            )
+            self.comments[ticket_id].append(comment)
+        return comment
+
+    def _comments_page(self, ticket_id, path, query):
+        """A page of the ticket's comments with cursor pagination.
+
+        Like Zendesk, "sort=-created_at" gives them newest first and
+        "sort_order" is ignored. The cursor is the index to carry on from.
+
+        """
+        with self._lock:
+            comments = list(self.comments[ticket_id])
+        if query.get('sort') == '-created_at':
+            comments.reverse()
+
+        size = int(query.get('page[size]', 100))
+        start = int(query.get('page[after]', 0))
+        page = comments[start:start + size]
+        has_more = start + size < len(comments)
+        after = str(start + size) if has_more else None
+        next_url = None
+        if has_more:
+            params = dict(query, **{'page[after]': after})
+            next_url = f"{self.base_url}{path}?{urlencode(params)}"
+
+        return dict(
+            comments=page,
+            meta=dict(has_more=has_more, after_cursor=after, before_cursor=None),
+            links=dict(next=next_url, prev=None),
+        )
+
+    def _audit(self, ticket):
+        return dict(
+            ticket=ticket,
+            audit=dict(id=next(self._ids), ticket_id=ticket['id'], events=[]),
+        )
+
+    def route(self, method, path, query, body):
+        if method == 'POST' and path == '/_ticket':
+            return 201, dict(ticket=self.add_ticket(body, channel='email'))
+
+        if method == 'POST' and path == '/_comment':
+            ticket_id = int(body['ticket_id'])
+            if ticket_id not in self.tickets:
+                return 404, dict(error='RecordNotFound')
+            return 201, dict(
+                comment=self.add_comment(ticket_id, body, channel='web')
+            )
+
+        if path == '/_tickets':
+            external_id = query.get('external_id')
+            with self._lock:
+                found = [
+                    t for t in self.tickets.values()
+                    if t.get('external_id') == external_id
+                ]
+            return 200, dict(tickets=found)
+
+        if path == '/api/v2/users/me.json':
+            return 200, dict(user=dict(
+                id=1, name='ZenSlackChat', email='zenslackchat@example.com'
+            ))
+
+        if method == 'POST' and path == '/api/v2/tickets.json':
+            ticket = self.add_ticket(body.get('ticket', {}))
+            return 201, self._audit(ticket)
+
+        match = re.match(r'^/api/v2/tickets/([0-9]+)(/comments)?\.json$', path)
+        if not match:
+            return 404, dict(error='InvalidEndpoint')
+
+        ticket_id = int(match.group(1))
+        if ticket_id not in self.tickets:
+            return 404, dict(
+                error='RecordNotFound', description='Not found'
+            )
+
+        if match.group(2):
+            return 200, self._comments_page(ticket_id, path, query)
+
+        if method == 'PUT':
+            update = dict(body.get('ticket', {}))
+            comment = update.pop('comment', None)
+            with self._lock:
+                self.tickets[ticket_id].update(update)
+            if comment:
+                self.add_comment(ticket_id, comment)
+            return 200, self._audit(self.tickets[ticket_id])
+
+        return 200, dict(ticket=self.tickets[ticket_id])
+
+
+class FakePagerDuty(FakeService):
+    """The PagerDuty token and /oncalls calls made by PagerDutyApp.
+
+    Point settings.PAGERDUTY_API_URL at http://<host>:<port> and
+    settings.PD_TOKEN_END_POINT at http://<host>:<port>/oauth/token
+
+    """
+    name = 'pagerduty'
+
+    def rate_limited(self):
+        return 429, dict(error=dict(message='Too Many Requests', code=2020))
+
+    def route(self, method, path, query, body):
+        if path == '/oauth/token':
+            return 200, dict(
+                access_token='fake-pagerduty-token',
+                token_type='bearer',
+                expires_in=3600,
+                scope=body.get('scope', ''),
+            )
+
+        if path == '/oncalls':
+            end = (
+                datetime.now(timezone.utc) + timedelta(hours=8)
+            ).strftime('%Y-%m-%dT%H:%M:%SZ')
+            return 200, dict(oncalls=[
+                dict(escalation_level=1, end=end, user=dict(summary='Primary')),
+                dict(escalation_level=2, end=end, user=dict(summary='Secondary')),
+            ])
+
+        return 404, dict(error=dict(message='Not Found', code=2100))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[1])
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--slack-port', type=int, default=8301)
+    parser.add_argument('--zendesk-port', type=int, default=8302)
+    parser.add_argument('--pagerduty-port', type=int, default=8303)
+    parser.add_argument('--latency', type=float, default=0.05,
+                        help='Seconds before answering each call.')
+    parser.add_argument('--jitter', type=float, default=0.02,
+                        help='Up to this many seconds randomly added.')
+    parser.add_argument('--rate-limit', type=float, default=0,
+                        help='Calls per second per service, 0 for no limit.')
+    parser.add_argument('--burst', type=int, default=None)
+    parser.add_argument('--error-rate', type=float, default=0.0,
+                        help='Fraction of calls answered with a 429.')
+    parser.add_argument('--retry-after', type=int, default=1)
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format='%(message)s')
+
+    def behaviour():
+        return Behaviour(
+            latency=args.latency, jitter=args.jitter,
+            rate_limit=args.rate_limit, burst=args.burst,
+            error_rate=args.error_rate, retry_after=args.retry_after,
+        )
+
+    servers = [
+        FakeSlack(behaviour()).serve(args.host, args.slack_port),
+        FakeZendesk(behaviour()).serve(args.host, args.zendesk_port),
+        FakePagerDuty(behaviour()).serve(args.host, args.pagerduty_port),
+    ]
+
+    host = args.host
+    print(
+        "\nRun the webapp with:\n\n"
+        f"  export SLACK_API_URL=http://{host}:{args.slack_port}/api/\n"
+        "  export ZENPY_FORCE_SCHEME=http\n"
+        f"  export ZENPY_FORCE_NETLOC={host}:{args.zendesk_port}\n"
+        f"  export PAGERDUTY_API_URL=http://{host}:{args.pagerduty_port}\n"
+        f"  export PD_TOKEN_END_POINT=http://{host}:{args.pagerduty_port}/oauth/token\n"
+    )
+
+    try:
+        while True:
+            time.sleep(3600)
+
+    except KeyboardInterrupt:
+        for server in servers:
+            server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
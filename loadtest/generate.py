@@ -0,0 +1,327 @@
+"""
+Drive a running webapp with synthetic Slack events and Zendesk triggers.
+
+New issues, thread replies and resolves are POSTed to /slack/events/. Agent
+comments and inbound emails are added to the fake Zendesk and the matching
+trigger is POSTed to /zendesk/webhook/ or /zendesk/email/webhook/. Requests
+are sent at the target rate whether or not earlier ones have finished.
+
+The webapp must be talking to the fakes (see loadtest.fakes) so the outbound
+calls made for each event can be counted.
+
+    python -m loadtest.generate --rate 20 --duration 60
+
+"""
+import argparse
+import itertools
+import json
+import math
+import random
+import threading
+import time
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+
+def percentile(samples, percent):
+    """Return the nearest-rank percentile of the samples or None if empty."""
+    if not samples:
+        return None
+
+    ordered = sorted(samples)
+    rank = max(math.ceil(percent / 100 * len(ordered)), 1)
+    return ordered[rank - 1]
+
+
+def parse_mix(mix):
+    """Turn 'message=5,reply=3' into dict(message=5, reply=3)."""
+    weights = {}
+    for part in mix.split(','):
+        kind, weight = part.split('=')
+        if kind not in Generator.KINDS:
+            raise argparse.ArgumentTypeError(
+                f"Unknown kind '{kind}', choose from {Generator.KINDS}"
+            )
+        weights[kind] = float(weight)
+
+    return weights
+
+
+class Generator(object):
+    """Builds and sends the synthetic events.
+
+    Threads the bot has opened are remembered so replies, resolves and
+    Zendesk comments go to conversations the webapp knows about.
+
+    """
+    KINDS = ('message', 'reply', 'resolve', 'comment', 'email')
+
+    def __init__(self, args):
+        self.args = args
+        self.session = requests.Session()
+        self._lock = threading.Lock()
+        self._ts = itertools.count(int(time.time() * 1000000))
+        self._event_ids = itertools.count(1)
+        self.threads = []
+        self.latencies = defaultdict(list)
+        self.statuses = Counter()
+        self.skipped = Counter()
+
+    def new_ts(self):
+        ts = str(next(self._ts))
+        return f"{ts[:-6]}.{ts[-6:]}"
+
+    def slack_event(self, text, thread_ts=None):
+        ts = self.new_ts()
+        event = dict(
+            type='message',
+            channel=self.args.channel,
+            user=f"ULOAD{random.randint(1, self.args.users)}",
+            text=text,
+            ts=ts,
+            event_ts=ts,
+        )
+        if thread_ts:
+            event['thread_ts'] = thread_ts
+
+        # So the bot sees it when recovering the conversation from slack:
+        self.session.post(f"{self.args.slack}/_message", json=event)
+
+        return 'slack/events/', dict(
+            token=self.args.slack_token,
+            type='event_callback',
+            event_id=f"Ev{next(self._event_ids):010d}",
+            event=event,
+        ), ts
+
+    def zendesk_ticket_id(self, chat_id):
+        """The ticket the bot created for a thread, if it has done yet."""
+        resp = self.session.get(
+            f"{self.args.zendesk}/_tickets", params=dict(external_id=chat_id)
+        )
+        tickets = resp.json()['tickets']
+        return tickets[0]['id'] if tickets else None
+
+    def pick_thread(self, remove=False):
+        with self._lock:
+            if not self.threads:
+                return None
+            index = random.randrange(len(self.threads))
+            return self.threads.pop(index) if remove else self.threads[index]
+
+    def build(self, kind):
+        """Return (path, body) for the request or None if it can't be made."""
+        if kind == 'message':
+            path, body, ts = self.slack_event(f"Load test issue {ts_label()}")
+            with self._lock:
+                self.threads.append(ts)
+            return path, body
+
+        if kind in ('reply', 'resolve'):
+            chat_id = self.pick_thread(remove=(kind == 'resolve'))
+            if chat_id is None:
+                return None
+            text = 'resolve' if kind == 'resolve' else f"More detail {ts_label()}"
+            path, body, _ = self.slack_event(text, thread_ts=chat_id)
+            return path, body
+
+        if kind == 'comment':
+            chat_id = self.pick_thread()
+            ticket_id = chat_id and self.zendesk_ticket_id(chat_id)
+            if not ticket_id:
+                return None
+            self.session.post(f"{self.args.zendesk}/_comment", json=dict(
+                ticket_id=ticket_id, body=f"Agent comment {ts_label()}"
+            ))
+            return 'zendesk/webhook/', dict(
+                token=self.args.zendesk_token,
+                chat_id=chat_id,
+                ticket_id=str(ticket_id),
+            )
+
+        if kind == 'email':
+            resp = self.session.post(f"{self.args.zendesk}/_ticket", json=dict(
+                subject=f"Emailed issue {ts_label()}"
+            ))
+            return 'zendesk/email/webhook/', dict(
+                token=self.args.zendesk_token,
+                ticket_id=str(resp.json()['ticket']['id']),
+            )
+
+    def send(self, kind):
+        try:
+            request = self.build(kind)
+        except requests.RequestException:
+            request = None
+
+        if request is None:
+            with self._lock:
+                self.skipped[kind] += 1
+            return
+
+        path, body = request
+        started = time.perf_counter()
+        try:
+            resp = self.session.post(
+                f"{self.args.target.rstrip('/')}/{path}", json=body,
+                timeout=self.args.timeout,
+            )
+            status = resp.status_code
+
+        except requests.RequestException as error:
+            status = type(error).__name__
+
+        elapsed = time.perf_counter() - started
+        with self._lock:
+            self.latencies[kind].append(elapsed)
+            self.statuses[status] += 1
+
+
+def ts_label():
+    return time.strftime('%H:%M:%S')
+
+
+def fake_stats(urls, reset=False):
+    """Recover (or reset) the call counts from the fakes."""
+    stats = {}
+    for url in urls:
+        try:
+            if reset:
+                requests.post(f"{url}/_reset", timeout=5)
+            data = requests.get(f"{url}/_stats", timeout=5).json()
+            stats[data['service']] = data
+
+        except requests.RequestException:
+            pass
+
+    return stats
+
+
+def report(generator, elapsed, stats):
+    """Summarise the run as a dict."""
+    everything = [
+        latency for samples in generator.latencies.values()
+        for latency in samples
+    ]
+    sent = len(everything)
+
+    def summary(samples):
+        return dict(
+            count=len(samples),
+            p50=percentile(samples, 50),
+            p95=percentile(samples, 95),
+            p99=percentile(samples, 99),
+            max=max(samples) if samples else None,
+        )
+
+    outbound = sum(service['total'] for service in stats.values())
+
+    return dict(
+        sent=sent,
+        elapsed=elapsed,
+        throughput=sent / elapsed if elapsed else 0,
+        latency=summary(everything),
+        by_kind={
+            kind: summary(samples)
+            for kind, samples in sorted(generator.latencies.items())
+        },
+        statuses={str(k): v for k, v in generator.statuses.items()},
+        skipped=dict(generator.skipped),
+        outbound_calls=outbound,
+        outbound_calls_per_event=outbound / sent if sent else None,
+        throttled=sum(service['throttled'] for service in stats.values()),
+        services=stats,
+    )
+
+
+def print_report(result):
+    def ms(value):
+        return '-' if value is None else f"{value * 1000:.1f}ms"
+
+    print(
+        f"\nSent {result['sent']} in {result['elapsed']:.1f}s "
+        f"({result['throughput']:.1f}/s) statuses {result['statuses']}"
+    )
+    if result['skipped']:
+        print(f"Skipped (nothing to act on yet): {result['skipped']}")
+
+    print(f"\n{'kind':<10}{'count':>8}{'p50':>12}{'p95':>12}{'p99':>12}{'max':>12}")
+    rows = list(result['by_kind'].items()) + [('all', result['latency'])]
+    for kind, row in rows:
+        print(
+            f"{kind:<10}{row['count']:>8}{ms(row['p50']):>12}"
+            f"{ms(row['p95']):>12}{ms(row['p99']):>12}{ms(row['max']):>12}"
+        )
+
+    per_event = result['outbound_calls_per_event']
+    print(
+        f"\nOutbound calls {result['outbound_calls']} "
+        f"({'-' if per_event is None else f'{per_event:.2f}'} per event), "
+        f"throttled {result['throttled']}"
+    )
+    for name, service in result['services'].items():
+        for endpoint, count in sorted(service['calls'].items()):
+            print(f"  {name:<10}{endpoint:<50}{count:>8}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[1])
+    parser.add_argument('--target', default='http://localhost:8000')
+    parser.add_argument('--rate', type=float, default=10,
+                        help='Requests per second to send.')
+    parser.add_argument('--duration', type=float, default=30,
+                        help='Seconds to send for.')
+    parser.add_argument('--concurrency', type=int, default=32,
+                        help='Most requests in flight at once.')
+    parser.add_argument('--timeout', type=float, default=30)
+    parser.add_argument('--settle', type=float, default=5,
+                        help='Seconds to wait for queued work before counting '
+                        'outbound calls.')
+    parser.add_argument('--mix', type=parse_mix,
+                        default='message=4,reply=4,resolve=1,comment=3,email=1',
+                        help='Relative weights of ' + ', '.join(Generator.KINDS))
+    parser.add_argument('--channel', default='CLOADTEST',
+                        help='SRE_SUPPORT_CHANNEL of the webapp.')
+    parser.add_argument('--users', type=int, default=50,
+                        help='Distinct slack users to send as.')
+    parser.add_argument('--slack-token', default='YOUR VERIFICATION TOKEN',
+                        help='SLACK_VERIFICATION_TOKEN of the webapp.')
+    parser.add_argument('--zendesk-token',
+                        default='<shared secret random string>',
+                        help='ZENDESK_WEBHOOK_TOKEN of the webapp.')
+    parser.add_argument('--slack', default='http://127.0.0.1:8301')
+    parser.add_argument('--zendesk', default='http://127.0.0.1:8302')
+    parser.add_argument('--pagerduty', default='http://127.0.0.1:8303')
+    parser.add_argument('--json', help='Also write the report to this file.')
+    args = parser.parse_args(argv)
+
+    fakes = [args.slack, args.zendesk, args.pagerduty]
+    generator = Generator(args)
+    kinds = list(args.mix)
+    weights = [args.mix[kind] for kind in kinds]
+    total = int(args.rate * args.duration)
+
+    fake_stats(fakes, reset=True)
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        for index in range(total):
+            # Open loop: keep to the schedule regardless of response times.
+            delay = started + index / args.rate - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            pool.submit(generator.send, random.choices(kinds, weights)[0])
+    elapsed = time.perf_counter() - started
+
+    time.sleep(args.settle)
+    result = report(generator, elapsed, fake_stats(fakes))
+    print_report(result)
+
+    if args.json:
+        with open(args.json, 'w') as fd:
+            json.dump(result, fd, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,40 @@
+"""
+Store the Slack and Zendesk app details the webapp needs to talk to the fakes.
+
+    python -m loadtest.seed
+
+This uses the webapp's DATABASE_URL and does nothing if they are present.
+
+"""
+import os
+
+import django
+
+
+def main():
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'webapp.settings')
+    django.setup()
+
+    from zenslackchat.models import SlackApp
+    from zenslackchat.models import ZendeskApp
+
+    if not SlackApp.objects.exists():
+        SlackApp.objects.create(
+            team_name='Load Test',
+            team_id='TLOADTEST',
+            bot_user_id='UFAKEBOT',
+            bot_access_token='xoxb-fake',
+        )
+        print('Created SlackApp for the fakes.')
+
+    if not ZendeskApp.objects.exists():
+        ZendeskApp.objects.create(
+            access_token='fake',
+            token_type='bearer',
+            scope='read write',
+        )
+        print('Created ZendeskApp for the fakes.')
+
+
+if __name__ == '__main__':
+    main()
@@ -10,3 +10,40 @@ def log():
     """Set up logging as a pytest fixture."""
     log_setup()
     return logging.getLogger('zenslackchat')
+
+
+@pytest.fixture(autouse=True)
+def local_cache(settings):
+    """Use an empty in-process cache rather than redis for each test."""
+    from django.core.cache import cache
+    from zenslackchat.user_cache import profiles
+
+    settings.CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        }
+    }
+    cache.clear()
+    profiles.clear()
+    yield cache
+
+
+@pytest.fixture(autouse=True)
+def local_metrics(settings):
+    """Keep the /metrics counters in-process rather than in redis."""
+    from zenslackchat.metrics import exporter
+
+    settings.METRICS_BACKEND = "local"
+    exporter.clear()
+    yield exporter
+
+
+@pytest.fixture(autouse=True)
+def no_slack_rate_limits(settings):
+    """Don't hold back the Slack calls tests make to the same channel."""
+    from zenslackchat.slack_dispatcher import dispatcher
+
+    settings.SLACK_RATE_LIMITS = False
+    dispatcher.reset()
+    yield dispatcher
+    dispatcher.reset()
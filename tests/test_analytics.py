@@ -0,0 +1,149 @@
+import datetime
+import io
+import json
+from unittest.mock import patch
+
+import numpy as np
+import pytest
+from django.contrib.auth.models import Permission
+from django.core.management import call_command
+
+from zenslackchat import analytics
+from zenslackchat.models import ZenSlackChat
+from zenslackchat.models import resolve_percentiles
+
+
+UTC = datetime.timezone.utc
+# A Monday:
+MONDAY = datetime.datetime(2020, 1, 6, 0, 30, tzinfo=UTC)
+HOUR = datetime.timedelta(hours=1)
+DAY = datetime.timedelta(days=1)
+
+
+def add_issues():
+    issues = []
+    for week in range(4):
+        for hours in (0, 9, 24 + 9):
+            opened = MONDAY + week * 7 * DAY + hours * HOUR
+            issues.append(ZenSlackChat(
+                channel_id="C1",
+                chat_id=f"{opened.timestamp():.6f}",
+                ticket_id=len(issues),
+                opened=opened,
+                active=False,
+                closed=opened + (len(issues) + 1) * HOUR,
+            ))
+    # Still open, on another channel:
+    issues.append(ZenSlackChat(
+        channel_id="C2", chat_id="2.0", ticket_id=99, opened=MONDAY
+    ))
+    ZenSlackChat.objects.bulk_create(issues)
+
+
+def test_arrivals_by_hour_of_week():
+    opened = np.array([
+        MONDAY.timestamp(),
+        (MONDAY + 7 * DAY + 9 * HOUR).timestamp(),
+        (MONDAY + 13 * DAY + 23 * HOUR).timestamp(),
+    ])
+    rates = analytics.arrivals(opened)
+
+    assert rates.shape == (168,)
+    # Two weeks of history, so each issue is half an issue a week:
+    assert rates[0] == rates[9] == rates[167] == rates.sum() / 3
+    assert rates.sum() * 2 == 3
+    assert analytics.arrivals(np.array([])).sum() == 0
+
+
+def test_report(db):
+    add_issues()
+    now = MONDAY + 30 * DAY
+
+    report = analytics.compute(now=now)
+    assert report["issues"] == 13
+    assert report["open"] == 1
+    monday, tuesday = report["arrivals"][:2]
+    # Four weeks of history, with the open issue also on Monday at 00:30:
+    assert monday["rates"][0] == 1.25
+    assert monday["rates"][9] == tuesday["rates"][9] == 1
+    # 1 to 12 hours to resolve:
+    assert report["resolve"]["p50"] == 6.5 * 3600
+    assert report["backlog"]["7-30d"] == 0
+    assert report["backlog"]["30-90d"] == 1
+
+    report = analytics.compute("C1", now=now)
+    assert (report["issues"], report["open"]) == (12, 0)
+    assert sum(report["backlog"].values()) == 0
+
+    report = analytics.compute("C3", now=now)
+    assert report["issues"] == 0
+    assert report["resolve"]["p99"] is None
+
+
+def test_report_is_cached_for_the_day(db):
+    now = MONDAY + 30 * DAY
+    assert analytics.report(now=now)["issues"] == 0
+
+    add_issues()
+    assert analytics.report(now=now)["issues"] == 0
+    assert analytics.report(now=now, refresh=True)["issues"] == 13
+    assert analytics.report(now=now + DAY)["issues"] == 13
+
+
+def test_command_and_admin_view(admin_client, db):
+    add_issues()
+
+    out = io.StringIO()
+    call_command("analytics", "--json", stdout=out)
+    assert json.loads(out.getvalue())["issues"] == 13
+
+    out = io.StringIO()
+    call_command("analytics", "--channel", "C1", "--refresh", stdout=out)
+    assert "12 issues, 0 open" in out.getvalue()
+
+    response = admin_client.get("/admin/zenslackchat/zenslackchat/analytics/")
+    assert response.status_code == 200
+    assert b"13 issues" in response.content
+
+
+def test_admin_analytics_permissions(client, django_user_model, db):
+    url = "/admin/zenslackchat/zenslackchat/analytics/"
+    user = django_user_model.objects.create_user(
+        "staff", password="secret", is_staff=True
+    )
+    client.force_login(user)
+    assert client.get(url).status_code == 403
+
+    user.user_permissions.add(
+        Permission.objects.get(codename="view_zenslackchat")
+    )
+    with patch("zenslackchat.analytics.report") as report:
+        report.return_value = analytics.compute()
+        assert client.get(url, {"refresh": "1"}).status_code == 200
+        report.assert_called_once_with(None)
+        assert client.post(url).status_code == 403
+
+        user.user_permissions.add(
+            Permission.objects.get(codename="change_zenslackchat")
+        )
+        user = django_user_model.objects.get(pk=user.pk)
+        client.force_login(user)
+        response = client.post(f"{url}?channel=C1")
+        assert response.status_code == 302
+        assert response["Location"] == f"{url}?channel=C1"
+        report.assert_called_with("C1", refresh=True)
+
+
+def test_resolve_percentiles_match_the_daily_stats():
+    rng = np.random.default_rng(1)
+    seconds = rng.exponential(4 * 3600, 101)
+    opened = np.zeros(seconds.size + 1)
+    closed = np.append(seconds, np.nan)
+
+    found = analytics.resolve_percentiles(opened, closed)
+
+    assert found == pytest.approx(np.percentile(seconds, analytics.PERCENTILES))
+    p50, p90 = resolve_percentiles(
+        datetime.timedelta(seconds=value) for value in seconds
+    )
+    assert (found[0], found[2]) == pytest.approx((p50, p90))
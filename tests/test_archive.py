@@ -0,0 +1,141 @@
+import datetime
+import io
+import json
+
+import pytest
+from django.core.management import call_command
+
+from zenslackchat import analytics
+from zenslackchat import export
+from zenslackchat.archive import archive
+from zenslackchat.models import ArchivedChat
+from zenslackchat.models import MessageHash
+from zenslackchat.models import NotFoundError
+from zenslackchat.models import ZenSlackChat
+
+
+UTC = datetime.timezone.utc
+NOW = datetime.datetime(2020, 6, 1, 9, 0, tzinfo=UTC)
+DAY = datetime.timedelta(days=1)
+
+
+@pytest.fixture
+def issues(db):
+    """Three resolved 100 days ago, one resolved yesterday and one open."""
+    for index in range(3):
+        ZenSlackChat.open("C1", f"1.{index}", ticket_id=index, opened=NOW - 101 * DAY)
+        ZenSlackChat.resolve("C1", f"1.{index}", closed=NOW - 100 * DAY)
+    ZenSlackChat.open("C1", "2.0", ticket_id=20, opened=NOW - 2 * DAY)
+    ZenSlackChat.resolve("C1", "2.0", closed=NOW - DAY)
+    ZenSlackChat.open("C1", "3.0", ticket_id=30, opened=NOW - DAY)
+    ZenSlackChat.get("C1", "1.0").remember_hashes({"digest1": "1.5", "digest2": ""})
+
+
+def chat_ids(model):
+    return sorted(model.objects.values_list("chat_id", flat=True))
+
+
+def test_archive_moves_the_old_resolved_conversations(log, issues):
+    issue = ZenSlackChat.objects.get(chat_id="1.0")
+    slept = []
+
+    assert archive(days=90, size=2, pause=0.1, now=NOW, sleep=slept.append) == 3
+
+    # Two batches with a pause between them:
+    assert slept == [0.1]
+    assert chat_ids(ZenSlackChat) == ["2.0", "3.0"]
+    assert chat_ids(ArchivedChat) == ["1.0", "1.1", "1.2"]
+    assert not MessageHash.objects.exists()
+    archived = ArchivedChat.objects.get(chat_id="1.0")
+    assert archived.id == issue.id
+    assert archived.closed == NOW - 100 * DAY
+    assert sorted(archived.hashes) == [["digest1", "1.5"], ["digest2", ""]]
+
+    # Nothing left to do:
+    assert archive(days=90, now=NOW) == 0
+
+
+def test_lookups_restore_archived_conversations(log, issues):
+    archive(days=90, now=NOW)
+
+    issue = ZenSlackChat.get("C1", "1.0")
+    assert issue.active is False
+    assert issue.hash_index() == ({"digest1", "digest2"}, {"1.5"})
+    assert chat_ids(ArchivedChat) == ["1.1", "1.2"]
+
+    issue = ZenSlackChat.get_by_ticket("1.1", "1")
+    assert issue.chat_id == "1.1"
+    assert chat_ids(ArchivedChat) == ["1.2"]
+
+    # Resolving it again changes nothing:
+    issue = ZenSlackChat.resolve("C1", "1.2")
+    assert issue.closed == NOW - 100 * DAY
+    assert chat_ids(ArchivedChat) == []
+
+    with pytest.raises(NotFoundError):
+        ZenSlackChat.get("C1", "9.9")
+    with pytest.raises(NotFoundError):
+        ZenSlackChat.get_by_ticket("9.9", 99)
+
+
+def test_a_miss_looks_in_the_archive_once(issues, django_assert_num_queries):
+    with django_assert_num_queries(2):
+        with pytest.raises(NotFoundError):
+            ZenSlackChat.get("C1", "9.9")
+
+    with django_assert_num_queries(1):
+        ZenSlackChat.get("C1", "3.0")
+
+
+def exported():
+    return [
+        json.loads(line)["chat_id"]
+        for line in "".join(export.stream("ndjson")).splitlines()
+    ]
+
+
+def test_archived_conversations_are_still_in_the_history(log, issues):
+    expected = analytics.compute(now=NOW)
+    archive(days=90, now=NOW)
+
+    assert analytics.compute(now=NOW) == expected
+    assert exported() == ["1.0", "1.1", "1.2", "2.0", "3.0"]
+
+    out = io.StringIO()
+    call_command("daily_stats", check=True, stdout=out)
+    assert "match" in out.getvalue()
+
+
+def test_archiving_during_an_export_sends_each_conversation_once(log, issues):
+    chunks = export.stream("ndjson", size=1)
+    sent = [json.loads(next(chunks))["chat_id"]]
+
+    archive(days=90, now=NOW)
+    sent.extend(json.loads(chunk)["chat_id"] for chunk in chunks)
+
+    assert sent == ["1.0", "1.1", "1.2", "2.0", "3.0"]
+
+
+def test_archive_command(log, issues, settings):
+    settings.ARCHIVE_BATCH_PAUSE = 0
+    out = io.StringIO()
+
+    call_command("archive_conversations", days=0, stdout=out)
+
+    assert out.getvalue() == "Archived 4 conversations.\n"
+    assert chat_ids(ZenSlackChat) == ["3.0"]
+
+
+def test_archive_admin(admin_client, issues, settings):
+    settings.SLACK_WORKSPACE_URI = "https://s.l.a.c.k"
+    settings.ZENDESK_TICKET_URI = "https://z.e.n.d.e.s.k"
+    archive(days=90, now=NOW)
+
+    response = admin_client.get("/admin/zenslackchat/archivedchat/")
+
+    assert response.status_code == 200
+    assert b"https://s.l.a.c.k/C1/p10" in response.content
+    assert b"https://z.e.n.d.e.s.k/1" in response.content
+    assert admin_client.get(
+        "/admin/zenslackchat/archivedchat/add/"
+    ).status_code == 403
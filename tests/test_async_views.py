@@ -0,0 +1,186 @@
+import asyncio
+import json
+import threading
+import time
+from unittest.mock import patch
+
+from asgiref.sync import async_to_sync
+from django.test import AsyncRequestFactory
+
+from zenslackchat import async_views
+from zenslackchat import metrics
+from zenslackchat.metrics import QueryCountMiddleware
+
+
+EVENT = {
+    'channel': 'C0192NP3TFG',
+    'text': 'hello there!',
+    'ts': '1603983778.011500',
+    'type': 'message',
+    'user': 'UGF7MRWMS'
+}
+
+
+def post(view, data, **headers):
+    request = AsyncRequestFactory().post(
+        '/', json.dumps(data), content_type='application/json', **headers
+    )
+    return async_to_sync(view)(request)
+
+
+def wait_for_backlog(timeout=5):
+    """Wait for the events acknowledged so far to be handled."""
+    stop = time.monotonic() + timeout
+    while async_views._backlog and time.monotonic() < stop:
+        time.sleep(0.01)
+
+    assert async_views._backlog == 0
+
+
+@patch('zenslackchat.eventsview.handler')
+def test_slack_events_are_handled_on_the_pool(handler, settings):
+    settings.SLACK_EVENTS_ASYNC = False
+    settings.SLACK_VERIFICATION_TOKEN = 'the-token'
+    threads = []
+    handler.side_effect = lambda *args, **kwargs: threads.append(
+        threading.current_thread().name
+    )
+
+    with patch('zenslackchat.eventsview.SlackApp'):
+        with patch('zenslackchat.eventsview.ZendeskApp'):
+            response = post(
+                async_views.slack_events,
+                dict(token='the-token', event=EVENT)
+            )
+            wait_for_backlog()
+
+    assert response.status_code == 200
+    assert threads[0].startswith('async-handler')
+    assert metrics.metrics.snapshot()['view:slack_events']['calls'] == 1
+
+    response = post(async_views.slack_events, dict(token='wrong'))
+    assert response.status_code == 403
+
+    response = post(
+        async_views.slack_events,
+        dict(token='the-token', type='url_verification', challenge='abc')
+    )
+    assert json.loads(response.content)['challenge'] == 'abc'
+
+
+def test_bad_requests_are_refused():
+    request = AsyncRequestFactory().post(
+        '/', 'not json', content_type='application/json'
+    )
+    assert async_to_sync(async_views.slack_events)(request).status_code == 400
+
+    request = AsyncRequestFactory().get('/')
+    response = async_to_sync(async_views.email_webhook)(request)
+    assert response.status_code == 405
+
+
+@patch('zenslackchat.zendesk_webhooks.comments_from_zendesk')
+def test_zendesk_webhooks(comments_from_zendesk):
+    override = {'ZENDESK_WEBHOOK_TOKEN': 'the-token'}
+    with patch.dict('webapp.settings.__dict__', override):
+        with patch('zenslackchat.zendesk_base_webhook.SlackApp'):
+            with patch('zenslackchat.zendesk_base_webhook.ZendeskApp'):
+                response = post(
+                    async_views.comments_webhook,
+                    dict(token='the-token', ticket_id='1')
+                )
+                wait_for_backlog()
+
+    assert response.status_code == 200
+    assert json.loads(response.content) == 'OK, Thanks'
+    comments_from_zendesk.assert_called_once()
+
+    response = post(async_views.comments_webhook, dict(token='wrong'))
+    assert response.status_code == 403
+
+
+@patch('zenslackchat.eventsview.handler')
+def test_slow_handlers_do_not_hold_up_responses(handler, settings):
+    """Events are acknowledged before the pool gets round to them."""
+    settings.SLACK_EVENTS_ASYNC = False
+    settings.SLACK_VERIFICATION_TOKEN = 'the-token'
+    settings.ASYNC_BACKLOG = 500
+    handled = threading.Event()
+    handler.side_effect = lambda *args, **kwargs: handled.wait(5)
+
+    async def many():
+        requests = [
+            AsyncRequestFactory().post(
+                '/', json.dumps(dict(token='the-token', event=EVENT)),
+                content_type='application/json',
+            )
+            for _ in range(200)
+        ]
+        return await asyncio.gather(*[
+            async_views.slack_events(request) for request in requests
+        ])
+
+    with patch('zenslackchat.eventsview.SlackApp'):
+        with patch('zenslackchat.eventsview.ZendeskApp'):
+            # Every request is answered while the handlers are all stuck:
+            responses = async_to_sync(many)()
+            assert [r.status_code for r in responses] == [200] * 200
+            assert 'zenslackchat_async_backlog{view="slack_events"} 200' in (
+                metrics.render()
+            )
+
+            handled.set()
+            wait_for_backlog()
+
+    assert handler.call_count == 200
+    assert 'zenslackchat_async_backlog{view="slack_events"} 0' in (
+        metrics.render()
+    )
+
+
+@patch('zenslackchat.eventsview.handler')
+def test_a_full_backlog_waits_for_the_handler(handler, settings):
+    settings.SLACK_EVENTS_ASYNC = False
+    settings.SLACK_VERIFICATION_TOKEN = 'the-token'
+    settings.ASYNC_BACKLOG = 0
+
+    with patch('zenslackchat.eventsview.SlackApp'):
+        with patch('zenslackchat.eventsview.ZendeskApp'):
+            response = post(
+                async_views.slack_events,
+                dict(token='the-token', event=EVENT)
+            )
+
+    assert response.status_code == 200
+    handler.assert_called_once()
+    assert async_views._backlog == 0
+
+
+@patch('zenslackchat.zendesk_webhooks.comments_from_zendesk')
+def test_webhook_errors_are_logged_off_the_request(comments_from_zendesk):
+    comments_from_zendesk.side_effect = ValueError('broken')
+    override = {'ZENDESK_WEBHOOK_TOKEN': 'the-token'}
+    with patch.dict('webapp.settings.__dict__', override):
+        with patch('zenslackchat.zendesk_base_webhook.SlackApp'):
+            with patch('zenslackchat.zendesk_base_webhook.ZendeskApp'):
+                with patch('zenslackchat.zendesk_base_webhook.logging') as log:
+                    response = post(
+                        async_views.comments_webhook,
+                        dict(token='the-token', ticket_id='1')
+                    )
+                    wait_for_backlog()
+
+    assert response.status_code == 200
+    log.getLogger().exception.assert_called_once()
+
+
+def test_query_count_middleware_can_be_async():
+    async def get_response(request):
+        return 'response'
+
+    middleware = QueryCountMiddleware(get_response)
+    assert asyncio.iscoroutinefunction(middleware)
+    assert async_to_sync(middleware)(None) == 'response'
+
+    middleware = QueryCountMiddleware(lambda request: 'response')
+    assert not asyncio.iscoroutinefunction(middleware)
@@ -0,0 +1,178 @@
+import datetime
+from unittest.mock import patch
+
+import pytest
+
+from zenslackchat import atlassian_api
+from zenslackchat.atlassian_api import get_oncall_support
+from zenslackchat.atlassian_api import rotation_calendar
+from zenslackchat.atlassian_api import RotationCalendar
+
+
+UTC = datetime.timezone.utc
+
+PAGE = """
+<table>
+<tr><th>Dates</th><th>Primary</th><th></th><th>Secondary</th><th></th></tr>
+<tr><td>14/12/20 - 20/12/20</td><td>Tony Tiger</td><td></td><td>Fred Sprocket</td><td></td></tr>
+<tr><td>TBC</td><td>Nobody</td><td></td><td>Nobody</td><td></td></tr>
+<tr><td>30/11/20 - 06/12/20</td><td>Fred Sprocket</td><td></td><td>Tony Tiger</td><td></td></tr>
+<tr><td>07/12/20 - 13/12/20</td><td>Bob Bobson</td><td></td><td>Tony Tiger</td><td></td></tr>
+</table>
+"""
+
+
+@pytest.fixture(autouse=True)
+def no_process_calendar(monkeypatch):
+    """Don't let the calendar parsed in one test leak into the next."""
+    monkeypatch.setattr(atlassian_api, '_calendar', None)
+
+
+def test_rotation_calendar_lookup():
+    """Test the rotations are recovered in date order and looked up by day.
+    """
+    calendar = RotationCalendar.from_content(PAGE, version=3)
+
+    assert calendar.version == 3
+    assert [r.primary for r in calendar.rotations] == [
+        'Fred Sprocket', 'Bob Bobson', 'Tony Tiger'
+    ]
+
+    # Start and end days are both included:
+    assert calendar.on_call(datetime.date(2020, 11, 30)) == (
+        'Fred Sprocket', 'Tony Tiger'
+    )
+    assert calendar.on_call(datetime.datetime(2020, 12, 6, 23, 59)) == (
+        'Fred Sprocket', 'Tony Tiger'
+    )
+    assert calendar.on_call(datetime.date(2020, 12, 7)) == (
+        'Bob Bobson', 'Tony Tiger'
+    )
+    assert calendar.hand_over(datetime.date(2020, 12, 7)) == (
+        datetime.datetime(2020, 12, 14, tzinfo=UTC)
+    )
+
+    # Outside the rota:
+    assert calendar.on_call(datetime.date(2020, 11, 29)) == (None, None)
+    assert calendar.on_call(datetime.date(2020, 12, 21)) == (None, None)
+    assert calendar.hand_over(datetime.date(2020, 12, 21)) is None
+
+    assert get_oncall_support(PAGE, datetime.date(2020, 12, 15)) == (
+        'Tony Tiger', 'Fred Sprocket'
+    )
+    assert get_oncall_support('<p>No table</p>') == (None, None)
+
+
+def row(dates, primary, secondary):
+    return (
+        f"<tr><td>{dates}</td><td>{primary}</td><td></td>"
+        f"<td>{secondary}</td><td></td></tr>"
+    )
+
+
+def table(*rows):
+    return "<table>" + "".join(rows) + "</table>"
+
+
+def test_rotation_calendar_duplicate_rows():
+    """Test the first row wins for rotations with the same dates."""
+    calendar = RotationCalendar.from_content(table(
+        row("07/12/20 - 13/12/20", "A", "B"),
+        row("07/12/20 - 13/12/20", "C", "D"),
+    ))
+
+    assert calendar.on_call(datetime.date(2020, 12, 7)) == ("A", "B")
+    assert calendar.on_call(datetime.date(2020, 12, 13)) == ("A", "B")
+    assert calendar.on_call(datetime.date(2020, 12, 14)) == (None, None)
+
+
+def test_rotation_calendar_overlapping_rows():
+    """Test days in an earlier, longer rotation are found past later ones.
+    """
+    calendar = RotationCalendar.from_content(table(
+        row("01/12/20 - 31/12/20", "A", "B"),
+        row("07/12/20 - 13/12/20", "C", "D"),
+        row("07/12/20 - 20/12/20", "E", "F"),
+        row("02/01/21 - 08/01/21", "G", "H"),
+    ))
+
+    # Both cover the day, the one starting first wins as it is first in the
+    # table:
+    assert calendar.on_call(datetime.date(2020, 12, 10)) == ("A", "B")
+    # Only the first covers these, though later ones start nearer:
+    assert calendar.on_call(datetime.date(2020, 12, 25)) == ("A", "B")
+    assert calendar.hand_over(datetime.date(2020, 12, 25)) == (
+        datetime.datetime(2021, 1, 1, tzinfo=UTC)
+    )
+    assert calendar.on_call(datetime.date(2021, 1, 1)) == (None, None)
+    assert calendar.on_call(datetime.date(2021, 1, 2)) == ("G", "H")
+
+    # The row with a later start but longer reach is found when it is the
+    # only one covering the day:
+    calendar = RotationCalendar.from_content(table(
+        row("07/12/20 - 13/12/20", "C", "D"),
+        row("07/12/20 - 20/12/20", "E", "F"),
+    ))
+    assert calendar.on_call(datetime.date(2020, 12, 10)) == ("C", "D")
+    assert calendar.on_call(datetime.date(2020, 12, 15)) == ("E", "F")
+
+
+@patch('zenslackchat.atlassian_api._get_page')
+def test_page_is_only_parsed_when_its_version_changes(get_page):
+    """Test the page body is only fetched when the version number changes.
+    """
+    pages = {'version': dict(version=dict(number=1))}
+
+    def page(expand):
+        if expand == 'version':
+            return pages['version']
+        return dict(
+            body=dict(storage=dict(value=PAGE)),
+            version=pages['version']['version'],
+        )
+
+    get_page.side_effect = page
+
+    first = rotation_calendar()
+    assert first.version == 1
+    assert rotation_calendar() is first
+    assert [c.args for c in get_page.call_args_list] == [
+        ('version',), ('body.storage,version',), ('version',)
+    ]
+
+    # Other processes recover the parsed calendar from the cache:
+    atlassian_api._calendar = None
+    get_page.reset_mock()
+    assert rotation_calendar().rotations == first.rotations
+    assert [c.args for c in get_page.call_args_list] == [('version',)]
+
+    # Someone edits the page:
+    pages['version'] = dict(version=dict(number=2))
+    get_page.reset_mock()
+    assert rotation_calendar().version == 2
+    assert [c.args for c in get_page.call_args_list] == [
+        ('version',), ('body.storage,version',)
+    ]
+
+
+@patch('zenslackchat.oncall.rotation_calendar')
+def test_atlassian_roster_is_kept_until_the_rotation_ends(
+    rotation_calendar, settings
+):
+    """Test the Confluence roster is held until the end of the rotation.
+    """
+    from zenslackchat.oncall import fetch_roster
+
+    settings.USE_ATLASSIAN = True
+    rotation_calendar.return_value = RotationCalendar.from_content(PAGE)
+
+    now = datetime.datetime(2020, 12, 9, 9, 0, tzinfo=UTC)
+    roster, until = fetch_roster(now)
+    assert roster == dict(primary='Bob Bobson', secondary='Tony Tiger')
+    assert until == datetime.datetime(2020, 12, 14, tzinfo=UTC)
+
+    # Outside the rota, check again tomorrow:
+    now = datetime.datetime(2021, 1, 9, 9, 0, tzinfo=UTC)
+    roster, until = fetch_roster(now)
+    assert roster == dict(primary=None, secondary=None)
+    assert until == datetime.datetime(2021, 1, 10, tzinfo=UTC)
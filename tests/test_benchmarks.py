@@ -0,0 +1,227 @@
+"""
+Benchmarks for the message pipeline hot paths.
+
+These run as ordinary tests (once, untimed) as part of the normal test run. To
+time them and compare against the saved JSON baseline see "make benchmark".
+
+"""
+import copy
+import datetime
+import itertools
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+from zenslackchat import message_tools
+from zenslackchat.message import handler
+from zenslackchat.models import ZenSlackChat
+
+
+UTC = datetime.timezone.utc
+
+CHANNEL = "C019JUGAGTS"
+
+EMAIL_PARAGRAPH = (
+    "Hello SRE team,\n\n"
+    "Our **deploys** are failing with the error below, see "
+    "<https://QUAY.IO/repository/uktrade/app|QUAY.IO> and the _build log_ at "
+    "<http://ci.example.com/job/123|ci.example.com>. Please contact "
+    "<mailto:MAILER-DAEMON@eu-west-2.amazonses.com|MAILER-DAEMON@eu-west-2.amazonses.com>"
+    " if this persists.\n\n"
+    "- step one failed\n- step two was skipped\n\n"
+    "    Traceback (most recent call last):\n"
+    "      File \"app.py\", line 1\n\n"
+    "Thanks & regards 🔥 :palm_tree:\n\n"
+)
+
+
+class FakeClients(object):
+    """Slack and Zendesk clients that answer immediately."""
+
+    def __init__(self):
+        ids = itertools.count(1)
+        self.slack = MagicMock()
+        self.slack.users_info.return_value = MagicMock(data={
+            "user": {
+                "real_name": "Bob Sprocket",
+                "profile": {"email": "bob@example.com"},
+            }
+        })
+        self.zendesk = MagicMock()
+        self.zendesk.tickets.create.side_effect = lambda ticket: MagicMock(
+            ticket=MagicMock(id=next(ids))
+        )
+        self.zendesk.tickets.return_value = MagicMock(status="open")
+        self.zendesk.users.me.return_value = MagicMock(id=100000000001)
+
+
+@pytest.fixture
+def clients():
+    with patch("zenslackchat.message.on_call_roster") as on_call_roster:
+        on_call_roster.return_value = dict(primary="Fred", secondary="Tony")
+        yield FakeClients()
+
+
+def handle(event, clients):
+    return handler(
+        event,
+        our_channel=CHANNEL,
+        workspace_uri="https://s.l.a.c.k",
+        zendesk_uri="https://z.e.n.d.e.s.k",
+        slack_client=clients.slack,
+        zendesk_client=clients.zendesk,
+        user_id="100000000001",
+        group_id="200000000002",
+    )
+
+
+_ts = itertools.count(1600000000000000)
+
+
+def new_ts():
+    ts = str(next(_ts))
+    return f"{ts[:-6]}.{ts[-6:]}"
+
+
+def message_event(text, thread_ts=None):
+    event = dict(
+        type="message", channel=CHANNEL, user="UGF7MRWMS", text=text, ts=new_ts()
+    )
+    if thread_ts:
+        event["thread_ts"] = thread_ts
+
+    return event
+
+
+def test_handler_new_message(benchmark, clients, db):
+    """A new message on the channel raising a ticket."""
+    def setup():
+        return (message_event("My 🖨 is on 🔥"), clients), {}
+
+    result = benchmark.pedantic(handle, setup=setup, rounds=50)
+    assert result is True
+
+
+def test_handler_thread_reply(benchmark, clients, db):
+    """A reply in the thread sent on to the ticket as a comment."""
+    issue = ZenSlackChat.open(CHANNEL, new_ts(), ticket_id="1")
+
+    def setup():
+        event = message_event("Oh, wait, its ok now.", issue.chat_id)
+        return (event, clients), {}
+
+    result = benchmark.pedantic(handle, setup=setup, rounds=50)
+    assert result is True
+
+
+def test_handler_resolve(benchmark, clients, db):
+    """A resolve command closing the ticket."""
+    def setup():
+        issue = ZenSlackChat.open(CHANNEL, new_ts(), ticket_id="1")
+        return (message_event("resolve", issue.chat_id), clients), {}
+
+    result = benchmark.pedantic(handle, setup=setup, rounds=50)
+    assert result is True
+
+
+def thread(size):
+    """A conversation of size slack messages mirrored on Zendesk."""
+    slack, zendesk = [], []
+    for index in range(size):
+        text = f"Message {index} with a <https://example.com/{index}|link>"
+        if index % 2:
+            slack.append(dict(text=text, ts=new_ts()))
+            zendesk.append(dict(
+                body=f"Bob Sprocket (Slack): {text}", via=dict(channel="api")
+            ))
+        else:
+            slack.append(dict(text=f"(Zendesk): {text}", ts=new_ts()))
+            zendesk.append(dict(body=text, via=dict(channel="web")))
+
+    # One new comment to find:
+    zendesk.append(dict(body="Anything else?", via=dict(channel="web")))
+
+    return slack, zendesk
+
+
+@pytest.mark.parametrize("size", [10, 100, 1000])
+def test_messages_for_slack(benchmark, size):
+    """Work out what's new on a thread with nothing memoized."""
+    slack, zendesk = thread(size)
+
+    def setup():
+        message_tools.strip_formatting.cache_clear()
+        return (slack, copy.deepcopy(zendesk)), {}
+
+    result = benchmark.pedantic(
+        message_tools.messages_for_slack, setup=setup, rounds=5
+    )
+    assert [message["body"] for message in result] == ["Anything else?"]
+
+
+# Plain replies as most thread messages are, which strip_formatting() answers
+# without the markdown conversion:
+PLAIN_REPLIES = [
+    f"Reply {index} on the thread, is there any news on this?\n\nThanks"
+    for index in range(100)
+]
+
+
+@pytest.mark.parametrize("name", ["strip_formatting", "markdown_to_text"])
+def test_normalize_plain_replies(benchmark, name):
+    """Compare the fast path with the markdown conversion it replaces."""
+    normalize = getattr(message_tools, name)
+
+    def run():
+        message_tools.strip_formatting.cache_clear()
+        return [normalize(text) for text in PLAIN_REPLIES]
+
+    result = benchmark.pedantic(run, rounds=5)
+    assert result[0] == "Reply 0 on the thread, is there any news on this?\nThanks"
+
+
+@pytest.fixture
+def large_email():
+    # About 20KB
+    return EMAIL_PARAGRAPH * 40
+
+
+def test_strip_large_email(benchmark, large_email):
+    def setup():
+        message_tools.strip_formatting.cache_clear()
+        return (large_email,), {}
+
+    result = benchmark.pedantic(message_tools.strip, setup=setup, rounds=20)
+    assert "QUAY.IO" in result
+
+
+def test_strip_formatting_large_email(benchmark, large_email):
+    def setup():
+        message_tools.strip_formatting.cache_clear()
+        return (large_email,), {}
+
+    result = benchmark.pedantic(
+        message_tools.strip_formatting, setup=setup, rounds=20
+    )
+    assert "MAILER-DAEMON@eu-west-2.amazonses.com" in result
+
+
+def test_daily_summary_10k(benchmark, db):
+    """The daily report over 10k conversations."""
+    when = datetime.datetime(2020, 1, 2, 9, 0, tzinfo=UTC)
+    yesterday = datetime.datetime(2020, 1, 1, 9, 0, tzinfo=UTC)
+    ZenSlackChat.objects.bulk_create([
+        ZenSlackChat(
+            channel_id=CHANNEL,
+            chat_id=f"1577836800.{index:06d}",
+            ticket_id=str(index),
+            active=bool(index % 10),
+            opened=yesterday,
+            closed=None if index % 10 else yesterday,
+        )
+        for index in range(10000)
+    ])
+
+    report = benchmark(ZenSlackChat.daily_summary, "https://s.l.a.c.k", when)
+    assert len(report["open"]) == 9000
+    assert report["closed"] == 1000
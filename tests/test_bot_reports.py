@@ -1,10 +1,13 @@
 import datetime
+from unittest.mock import MagicMock
+from unittest.mock import patch
 
 import pytest
 from django.test import TestCase
 
 from zenslackchat.models import ZenSlackChat
 from zenslackchat.models import NotFoundError
+from zenslackchat.slack_api import chunked
 
 
 UTC = datetime.timezone.utc
@@ -14,7 +17,7 @@ ISSUE_FIXTURES = [
     # Old open issue on 31 Dec 2019
     dict(
         chat_id="slack-chat-0", 
-        ticket_id="zendesk-ticket-0", 
+        ticket_id="1000", 
         opened=datetime.datetime(2019, 12, 28, 13, 51, tzinfo=UTC),
         closed=None,
     ),
@@ -27,32 +30,32 @@ ISSUE_FIXTURES = [
     # closed on 1 Jan 2020
     dict(
         chat_id="slack-chat-1", 
-        ticket_id="zendesk-ticket-1", 
+        ticket_id="1001", 
         opened=datetime.datetime(2020, 1, 1, 12, 30, tzinfo=UTC),
         closed=datetime.datetime(2020, 1, 1, 13, 42, tzinfo=UTC),
     ),
     dict(
         chat_id="slack-chat-2", 
-        ticket_id="zendesk-ticket-2", 
+        ticket_id="1002", 
         opened=datetime.datetime(2020, 1, 1, 12, 30, tzinfo=UTC),
         closed=datetime.datetime(2020, 1, 1, 17, 11, tzinfo=UTC),
     ),
     # open 1 Jan 2020
     dict(
         chat_id="slack-chat-3", 
-        ticket_id="zendesk-ticket-3", 
+        ticket_id="1003", 
         opened=datetime.datetime(2020, 1, 1, 8, 7, tzinfo=UTC),
         closed=None
     ),
     dict(
         chat_id="slack-chat-4", 
-        ticket_id="zendesk-ticket-4", 
+        ticket_id="1004", 
         opened=datetime.datetime(2020, 1, 1, 22, 44, tzinfo=UTC),
         closed=None
     ),
     dict(
         chat_id="slack-chat-5", 
-        ticket_id="zendesk-ticket-5", 
+        ticket_id="1005", 
         opened=datetime.datetime(2020, 1, 1, 12, 30, tzinfo=UTC),
         closed=None
     )
@@ -141,4 +144,85 @@ Cheers,
 🤖 ZenSlackChat
     """.strip()
 
-    assert plain_text == expected    
\ No newline at end of file
+    assert plain_text == expected    
+
+
+def test_chunked():
+    assert list(chunked([], 10)) == []
+    assert list(chunked(["abc", "def", "ghi"], 7)) == ["abc\ndef", "ghi"]
+    # Too long for one message:
+    assert list(chunked(["ab", "cdefghij", "k"], 4)) == [
+        "ab", "cdef", "ghij", "k"
+    ]
+    pieces = [f"- link {index}" for index in range(100)]
+    assert "\n".join(chunked(pieces, 50)) == "\n".join(pieces)
+    # Blank lines are kept, including at the start of a message:
+    assert list(chunked(["aaaa", "", "b"], 4)) == ["aaaa", "\nb"]
+    assert list(chunked(["a", "", "", "b"], 10)) == ["a\n\n\nb"]
+    pieces = ["Title", "", "- one", "- two", "", "", "Cheers,", "", "Bob"]
+    for limit in range(7, 40):
+        messages = list(chunked(pieces, limit))
+        assert all(0 < len(message) <= limit for message in messages)
+        assert "\n".join(messages) == "\n".join(pieces)
+    # Unless they would be a message on their own:
+    assert list(chunked(["aaaa", "", "bbbb"], 4)) == ["aaaa", "bbbb"]
+
+
+def test_long_daily_report_is_posted_as_a_thread(log, db, settings):
+    """Each message is under the limit and the report isn't changed."""
+    settings.DAILY_REPORT_MESSAGE_SIZE = 500
+    settings.SRE_SUPPORT_CHANNEL = "C019JUGAGTS"
+    opened = datetime.datetime(2020, 1, 1, 9, 0, tzinfo=UTC)
+    ZenSlackChat.objects.bulk_create([
+        ZenSlackChat(
+            channel_id="C019JUGAGTS",
+            chat_id=f"1577836800.{index:06d}",
+            ticket_id=index,
+            opened=opened,
+        )
+        for index in range(100)
+    ])
+
+    slack_client = MagicMock()
+    slack_client.chat_postMessage.return_value = dict(
+        message=dict(ts="1577923200.000100")
+    )
+    with patch("zenslackchat.models.SlackApp.client", return_value=slack_client):
+        from webapp.celery import run_daily_summary
+        run_daily_summary()
+
+    calls = slack_client.chat_postMessage.call_args_list
+    assert len(calls) > 1
+    assert "thread_ts" not in calls[0].kwargs
+    assert all(
+        call.kwargs["thread_ts"] == "1577923200.000100" for call in calls[1:]
+    )
+    texts = [call.kwargs["text"] for call in calls]
+    assert all(len(text) <= 500 for text in texts)
+
+    report = ZenSlackChat.daily_report(
+        ZenSlackChat.daily_summary(settings.SLACK_WORKSPACE_URI)
+    )
+    assert "\n".join(texts) == report
+    assert report.count("\n- ") == 100
+
+
+@pytest.mark.parametrize("size", [60, 97, 150, 333])
+def test_daily_report_messages_keep_the_blank_lines(db, settings, size):
+    settings.DAILY_REPORT_MESSAGE_SIZE = size
+    opened = datetime.datetime(2020, 1, 1, 9, 0, tzinfo=UTC)
+    ZenSlackChat.objects.bulk_create([
+        ZenSlackChat(
+            channel_id="C019JUGAGTS",
+            chat_id=f"1577836800.{index:06d}",
+            ticket_id=index,
+            opened=opened,
+        )
+        for index in range(20)
+    ])
+    summary = ZenSlackChat.daily_summary("https://s.l.a.c.k")
+
+    messages = list(ZenSlackChat.daily_report_messages(summary))
+
+    assert all(0 < len(message) <= size for message in messages)
+    assert "\n".join(messages) == ZenSlackChat.daily_report(summary)
@@ -0,0 +1,89 @@
+from unittest.mock import MagicMock
+from unittest.mock import patch
+
+from zenslackchat.client_registry import ClientRegistry
+from zenslackchat.client_registry import LazyClient
+from zenslackchat.client_registry import registry
+from zenslackchat.models import SlackApp
+from zenslackchat.models import ZendeskApp
+
+
+def test_client_is_built_once(settings):
+    """Test the same client is returned until the registry is invalidated.
+    """
+    settings.CLIENT_REGISTRY_CHECK_SECONDS = 0
+    clients = ClientRegistry()
+    factory = MagicMock(side_effect=lambda: object())
+
+    first = clients.get('slack', factory)
+    assert clients.get('slack', factory) is first
+    assert factory.call_count == 1
+
+    clients.invalidate()
+    second = clients.get('slack', factory)
+    assert second is not first
+    assert factory.call_count == 2
+
+
+def test_other_processes_notice_invalidation(settings):
+    """Test a registry rebuilds its client when another process saves a token.
+    """
+    settings.CLIENT_REGISTRY_CHECK_SECONDS = 0
+    web = ClientRegistry()
+    worker = ClientRegistry()
+    factory = MagicMock(side_effect=lambda: object())
+
+    first = worker.get('zendesk', factory)
+    web.invalidate()
+    assert worker.get('zendesk', factory) is not first
+
+
+def test_lazy_client_only_builds_on_use():
+    """Test the factory is not called until an attribute is used.
+    """
+    factory = MagicMock()
+    client = LazyClient(factory)
+    factory.assert_not_called()
+
+    client.chat_postMessage(channel='C1', text='hello')
+    client.chat_postMessage(channel='C1', text='there')
+    factory.assert_called_once()
+    factory.return_value.chat_postMessage.assert_called_with(
+        channel='C1', text='there'
+    )
+
+
+@patch('zenslackchat.models.WebClient')
+def test_new_token_replaces_cached_client(WebClient, log, db, settings):
+    """Test saving a new SlackApp rebuilds the client with its token.
+    """
+    settings.CLIENT_REGISTRY_CHECK_SECONDS = 0
+    registry.invalidate()
+    WebClient.side_effect = lambda token, **kwargs: MagicMock(token=token)
+
+    SlackApp.objects.create(
+        team_name='t', team_id='T1', bot_user_id='B1', bot_access_token='old'
+    )
+    client = SlackApp.client()
+    assert client.token == 'old'
+    assert SlackApp.client() is client
+
+    SlackApp.objects.create(
+        team_name='t', team_id='T1', bot_user_id='B1', bot_access_token='new'
+    )
+    assert SlackApp.client().token == 'new'
+
+
+@patch('zenslackchat.models.Zenpy')
+def test_zendesk_client_reuses_its_session(Zenpy, log, db, settings):
+    """Test the Zendesk client and HTTP session are not rebuilt each time.
+    """
+    settings.CLIENT_REGISTRY_CHECK_SECONDS = 0
+    registry.invalidate()
+    Zenpy.http_adapter_kwargs.return_value = {}
+
+    ZendeskApp.objects.create(
+        access_token='token', token_type='bearer', scope='read'
+    )
+    assert ZendeskApp.client() is ZendeskApp.client()
+    assert Zenpy.call_count == 1
@@ -0,0 +1,93 @@
+import datetime
+import io
+
+import pytest
+from django.core.management import call_command
+from django.core.management.base import CommandError
+
+from zenslackchat.models import DailyStats
+from zenslackchat.models import resolve_percentiles
+from zenslackchat.models import ZenSlackChat
+
+
+UTC = datetime.timezone.utc
+DAY1 = datetime.datetime(2020, 1, 1, 9, 0, tzinfo=UTC)
+DAY2 = datetime.datetime(2020, 1, 2, 9, 0, tzinfo=UTC)
+HOUR = datetime.timedelta(hours=1)
+
+
+def stats():
+    return {
+        (row.channel_id, row.day.isoformat()): (
+            row.opened, row.closed, row.backlog, row.resolve_p50,
+            row.resolve_p90
+        )
+        for row in DailyStats.objects.all()
+    }
+
+
+def check():
+    out = io.StringIO()
+    call_command("daily_stats", check=True, stdout=out)
+    return out.getvalue()
+
+
+def test_resolve_percentiles():
+    assert resolve_percentiles([]) == (None, None)
+    hours = [datetime.timedelta(hours=hours) for hours in range(1, 11)]
+    assert resolve_percentiles(hours) == pytest.approx((5.5 * 3600, 9.1 * 3600))
+
+
+def test_stats_are_kept_as_issues_open_and_resolve(log, db):
+    for index in range(3):
+        ZenSlackChat.open("C1", f"1.{index}", ticket_id=index, opened=DAY1)
+    ZenSlackChat.open("C2", "2.0", ticket_id=10, opened=DAY1)
+
+    ZenSlackChat.resolve("C1", "1.0", closed=DAY1 + 2 * HOUR)
+    ZenSlackChat.resolve("C1", "1.1", closed=DAY2)
+    # Already resolved, so nothing changes:
+    ZenSlackChat.resolve("C1", "1.1", closed=DAY2 + HOUR)
+    ZenSlackChat.open("C1", "1.3", ticket_id=3, opened=DAY2)
+
+    assert stats() == {
+        ("C1", "2020-01-01"): (3, 1, 2, 7200.0, 7200.0),
+        ("C1", "2020-01-02"): (1, 1, 2, 86400.0, 86400.0),
+        ("C2", "2020-01-01"): (1, 0, 1, None, None),
+    }
+    assert "match" in check()
+
+
+def test_an_issue_opened_earlier_is_in_later_backlogs(log, db):
+    ZenSlackChat.open("C1", "1.0", ticket_id=1, opened=DAY2)
+    ZenSlackChat.open("C1", "1.1", ticket_id=2, opened=DAY1)
+
+    assert stats() == {
+        ("C1", "2020-01-01"): (1, 0, 1, None, None),
+        ("C1", "2020-01-02"): (1, 0, 2, None, None),
+    }
+
+
+def test_rebuild_and_check(log, db):
+    # Added without going through open() and resolve():
+    ZenSlackChat.objects.bulk_create([
+        ZenSlackChat(channel_id="C1", chat_id="1.0", ticket_id=1, opened=DAY1),
+        ZenSlackChat(
+            channel_id="C1", chat_id="1.1", ticket_id=2, opened=DAY1,
+            active=False, closed=DAY2,
+        ),
+    ])
+    with pytest.raises(CommandError):
+        check()
+
+    call_command("daily_stats", stdout=io.StringIO())
+    assert stats() == {
+        ("C1", "2020-01-01"): (2, 0, 2, None, None),
+        ("C1", "2020-01-02"): (0, 1, 1, 86400.0, 86400.0),
+    }
+    assert "match" in check()
+
+    DailyStats.objects.filter(day=DAY2.date()).update(backlog=5)
+    out = io.StringIO()
+    with pytest.raises(CommandError):
+        call_command("daily_stats", check=True, stdout=out)
+    assert "backlog is 5 and should be 1" in out.getvalue()
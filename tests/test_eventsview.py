@@ -10,6 +10,7 @@ from django.contrib.auth.models import AnonymousUser
 
 from zenslackchat import views
 from zenslackchat import eventsview
+from zenslackchat.idempotency import first_delivery
 
 
 @patch('zenslackchat.eventsview.handler')
@@ -42,4 +43,150 @@ def test_request_is_rejected_with_missing_token_field(handler):
     # Forbidden
     assert response.status_code == 403
     # this should not have been called.
-    handler.assert_not_called()
\ No newline at end of file
+    handler.assert_not_called()
+
+EVENT = {
+    'channel': 'C0192NP3TFG',
+    'event_ts': '1603983778.011500',
+    'text': 'hello there!',
+    'thread_ts': '1603982476.010000',
+    'ts': '1603983778.011500',
+    'type': 'message',
+    'user': 'UGF7MRWMS'
+}
+
+
+@patch('zenslackchat.eventsview.process_slack_event')
+@patch('zenslackchat.eventsview.handler')
+def test_event_is_handled_in_the_request(
+    handler, process_slack_event, settings
+):
+    """Test the handler is called inline when async mode is off.
+    """
+    settings.SLACK_EVENTS_ASYNC = False
+    settings.SLACK_VERIFICATION_TOKEN = 'the-token'
+
+    factory = APIRequestFactory()
+    request = factory.post(
+        '/slack/events/',
+        dict(token='the-token', event=EVENT),
+        format='json'
+    )
+    with patch('zenslackchat.eventsview.SlackApp'):
+        with patch('zenslackchat.eventsview.ZendeskApp'):
+            response = eventsview.Events.as_view()(request)
+
+    assert response.status_code == 200
+    handler.assert_called()
+    process_slack_event.apply_async.assert_not_called()
+
+
+@patch('zenslackchat.eventsview.process_slack_event')
+@patch('zenslackchat.eventsview.handler')
+def test_event_is_queued_in_async_mode(handler, process_slack_event, settings):
+    """Test the event is queued for the worker and not handled inline.
+    """
+    settings.SLACK_EVENTS_ASYNC = True
+    settings.SLACK_EVENT_QUEUES = 1
+    settings.SLACK_VERIFICATION_TOKEN = 'the-token'
+
+    factory = APIRequestFactory()
+    request = factory.post(
+        '/slack/events/',
+        dict(token='the-token', event=EVENT),
+        format='json'
+    )
+    response = eventsview.Events.as_view()(request)
+
+    assert response.status_code == 200
+    handler.assert_not_called()
+    process_slack_event.apply_async.assert_called_with(
+        args=(EVENT,), queue='slack-events-0'
+    )
+
+
+@patch('zenslackchat.eventsview.process_slack_event')
+@patch('zenslackchat.eventsview.handler')
+def test_event_is_handled_if_it_cannot_be_queued(
+    handler, process_slack_event, settings
+):
+    """Test the event is not lost if the broker is unavailable.
+    """
+    settings.SLACK_EVENTS_ASYNC = True
+    settings.SLACK_VERIFICATION_TOKEN = 'the-token'
+    process_slack_event.apply_async.side_effect = ConnectionError('no redis')
+
+    factory = APIRequestFactory()
+    request = factory.post(
+        '/slack/events/',
+        dict(token='the-token', event=EVENT),
+        format='json'
+    )
+    with patch('zenslackchat.eventsview.SlackApp'):
+        with patch('zenslackchat.eventsview.ZendeskApp'):
+            response = eventsview.Events.as_view()(request)
+
+    assert response.status_code == 200
+    handler.assert_called()
+
+
+def test_thread_replies_use_the_same_queue(settings):
+    """Test a top-level message and its replies go to the same queue.
+    """
+    settings.SLACK_EVENT_QUEUES = 8
+
+    parent = dict(ts='1603982476.010000')
+    reply = dict(ts='1603983778.011500', thread_ts='1603982476.010000')
+
+    assert eventsview.event_queue(parent) == eventsview.event_queue(reply)
+    assert eventsview.event_queue(parent).startswith('slack-events-')
+
+
+@patch('zenslackchat.eventsview.process_slack_event')
+@patch('zenslackchat.eventsview.handler')
+def test_slack_retries_are_only_handled_once(
+    handler, process_slack_event, settings
+):
+    """Test a resent event with the same event_id is ignored.
+    """
+    settings.SLACK_EVENTS_ASYNC = False
+    settings.SLACK_VERIFICATION_TOKEN = 'the-token'
+
+    factory = APIRequestFactory()
+    view = eventsview.Events.as_view()
+
+    def post(event_id, **headers):
+        request = factory.post(
+            '/slack/events/',
+            dict(token='the-token', event_id=event_id, event=EVENT),
+            format='json',
+            **headers
+        )
+        with patch('zenslackchat.eventsview.SlackApp'):
+            with patch('zenslackchat.eventsview.ZendeskApp'):
+                return view(request)
+
+    assert post('Ev01').status_code == 200
+    assert handler.call_count == 1
+
+    # Slack resends the event as it thinks we timed out:
+    response = post(
+        'Ev01',
+        HTTP_X_SLACK_RETRY_NUM='1',
+        HTTP_X_SLACK_RETRY_REASON='http_timeout'
+    )
+    assert response.status_code == 200
+    assert handler.call_count == 1
+
+    # A different event is handled as normal:
+    assert post('Ev02').status_code == 200
+    assert handler.call_count == 2
+
+
+def test_first_delivery_when_cache_is_down():
+    """Test events are still handled if the cache cannot be reached.
+    """
+    with patch('zenslackchat.idempotency.cache') as cache:
+        cache.add.side_effect = ConnectionError('no redis')
+        assert first_delivery('slack-event', 'Ev01', 60) is True
+        assert first_delivery('slack-event', 'Ev01', 60) is True
@@ -0,0 +1,138 @@
+import csv
+import datetime
+import io
+import json
+from unittest.mock import patch
+
+import pytest
+from asgiref.sync import async_to_sync
+from asgiref.sync import sync_to_async
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.core.management.base import CommandError
+
+from zenslackchat import export
+from zenslackchat.models import ZenSlackChat
+
+
+UTC = datetime.timezone.utc
+DAY1 = datetime.datetime(2020, 1, 1, 9, 0, tzinfo=UTC)
+DAY2 = datetime.datetime(2020, 1, 2, 9, 0, tzinfo=UTC)
+
+
+@pytest.fixture
+def issues(settings, db):
+    settings.SLACK_WORKSPACE_URI = "https://s.l.a.c.k"
+    settings.ZENDESK_TICKET_URI = "https://z.e.n.d.e.s.k"
+    ZenSlackChat.open("C1", "1.0", ticket_id=10, opened=DAY1)
+    ZenSlackChat.open("C1", "1.1", ticket_id=11, opened=DAY2)
+    ZenSlackChat.open("C2", "2.0", opened=DAY2)
+    ZenSlackChat.resolve("C1", "1.0", closed=DAY2)
+
+
+def content(response):
+    return b"".join(response.streaming_content).decode()
+
+
+def test_export_csv(admin_client, issues):
+    response = admin_client.get("/export/")
+
+    assert response.status_code == 200
+    assert response["Content-Type"] == "text/csv"
+    assert "conversations.csv" in response["Content-Disposition"]
+    rows = list(csv.DictReader(io.StringIO(content(response))))
+    assert [row["chat_id"] for row in rows] == ["1.0", "1.1", "2.0"]
+    assert rows[0]["ticket_id"] == "10"
+    assert rows[0]["active"] == "False"
+    assert rows[0]["opened"] == "2020-01-01T09:00:00+00:00"
+    assert rows[0]["closed"] == "2020-01-02T09:00:00+00:00"
+    assert rows[0]["slack_url"] == "https://s.l.a.c.k/C1/p10"
+    assert rows[0]["zendesk_url"] == "https://z.e.n.d.e.s.k/10"
+    assert rows[2]["zendesk_url"] == ""
+
+
+def test_export_ndjson_with_filters(admin_client, issues):
+    response = admin_client.get(
+        "/export/", dict(format="ndjson", since="2020-01-02", channel="C1")
+    )
+
+    assert response.status_code == 200
+    assert response["Content-Type"] == "application/x-ndjson"
+    rows = [json.loads(line) for line in content(response).splitlines()]
+    assert len(rows) == 1
+    assert rows[0]["chat_id"] == "1.1"
+    assert rows[0]["active"] is True
+    assert rows[0]["closed"] is None
+
+    response = admin_client.get("/export/", dict(until="2020-01-02"))
+    assert content(response).count("\n") == 2
+
+
+def test_export_bad_requests(admin_client, db):
+    assert admin_client.get("/export/?format=xml").status_code == 400
+    assert admin_client.get("/export/?since=yesterday").status_code == 400
+
+
+def test_export_bad_requests_are_not_html(admin_client, db):
+    """The value sent back in the error mustn't run as script."""
+    for query in (
+        "?format=<script>alert(1)</script>",
+        "?since=<img src=x onerror=alert(1)>",
+    ):
+        response = admin_client.get("/export/" + query)
+
+        assert response.status_code == 400
+        assert response["Content-Type"] == "text/plain"
+
+
+def test_export_needs_the_view_permission(client, db):
+    assert client.get("/export/").status_code == 302
+
+    user = User.objects.create_user("someone", password="secret")
+    client.force_login(user)
+    assert client.get("/export/").status_code == 403
+
+
+def test_stream_reads_a_page_at_a_time(issues, django_assert_num_queries):
+    # Three pages of one row and the empty one that ends them:
+    with django_assert_num_queries(4):
+        chunks = list(export.stream("ndjson", size=1))
+
+    assert len(chunks) == 3
+    assert [json.loads(chunk)["chat_id"] for chunk in chunks] == [
+        "1.0", "1.1", "2.0"
+    ]
+
+
+async def on_this_thread(name, func, *args):
+    """Read the pages here rather than on the pool, to see the test's rows."""
+    return await sync_to_async(func)(*args)
+
+
+@patch("zenslackchat.async_views.run_blocking", on_this_thread)
+def test_astream_matches_stream(issues):
+    async def read():
+        return [chunk async for chunk in export.astream("csv", size=2)]
+
+    chunks = async_to_sync(read)()
+
+    assert len(chunks) == 3
+    assert "".join(chunks) == "".join(export.stream("csv"))
+
+
+def test_export_command(issues, tmp_path):
+    output = tmp_path / "all.ndjson"
+    call_command(
+        "export_conversations", format="ndjson", output=str(output), batch=2
+    )
+    lines = output.read_text().splitlines()
+    assert [json.loads(line)["ticket_id"] for line in lines] == [10, 11, None]
+
+    out = io.StringIO()
+    call_command("export_conversations", channel="C2", stdout=out)
+    assert out.getvalue().splitlines()[1].startswith(
+        str(ZenSlackChat.objects.get(chat_id="2.0").id) + ",C2,2.0,"
+    )
+
+    with pytest.raises(CommandError):
+        call_command("export_conversations", since="never")
@@ -0,0 +1,130 @@
+import threading
+from unittest.mock import MagicMock
+from unittest.mock import patch
+
+import pytest
+
+from zenslackchat import tracing
+from zenslackchat.follow_ups import in_background
+from zenslackchat.follow_ups import result
+from zenslackchat.message import handler
+from zenslackchat.zendesk_budget import BACKGROUND
+from zenslackchat.zendesk_budget import current_priority
+from zenslackchat.zendesk_budget import priority
+
+
+def test_work_runs_in_the_callers_context(settings):
+    settings.TRACING_ENABLED = True
+    tracing.traces.clear()
+
+    def work():
+        with tracing.span("oncall.fetch_roster"):
+            return current_priority(), threading.current_thread().name
+
+    with tracing.trace("outer"):
+        with priority(BACKGROUND):
+            found = in_background(work)
+            level, thread_name = result(found, None)
+
+    assert level == BACKGROUND
+    assert thread_name.startswith("follow-up")
+    [trace] = tracing.traces.recent()
+    assert [span.name for _, span in trace.walk()] == [
+        "outer", "oncall.fetch_roster"
+    ]
+    tracing.traces.clear()
+
+
+@pytest.mark.parametrize("workers", [0, 2])
+def test_failures_and_timeouts_give_the_default(settings, workers):
+    settings.FOLLOW_UP_WORKERS = workers
+    settings.FOLLOW_UP_TIMEOUT = 0.1
+
+    def broken():
+        raise ValueError("no")
+
+    assert result(in_background(broken), {}) == {}
+    assert result(in_background(lambda: 42), {}) == 42
+    # Nothing was started:
+    assert result(None, {}) == {}
+
+    if workers:
+        release = threading.Event()
+        assert result(in_background(release.wait, 5), "slow") == "slow"
+        release.set()
+
+
+def test_on_call_is_found_while_the_issue_is_announced(log, db):
+    """The roster lookup waits on the first post, so it has to overlap."""
+    announced = threading.Event()
+    posted = []
+
+    def chat_postMessage(channel, text, thread_ts=None):
+        posted.append(text)
+        announced.set()
+        return dict(ts="1608291472.001700")
+
+    def on_call_roster(source):
+        assert source == "pagerduty"
+        assert announced.wait(5)
+        return dict(primary="Fred", secondary="Tony")
+
+    slack_client = MagicMock()
+    slack_client.chat_postMessage.side_effect = chat_postMessage
+    slack_client.users_info.return_value = MagicMock(data=dict(
+        user=dict(real_name="Bob Sprocket", profile=dict(email="bob@example.com"))
+    ))
+    zendesk_client = MagicMock()
+    zendesk_client.tickets.create.return_value = MagicMock(
+        ticket=MagicMock(id=1430)
+    )
+
+    with patch("zenslackchat.message.on_call_roster", on_call_roster):
+        assert handler(
+            dict(
+                type="message", channel="C019JUGAGTS", user="UGF7MRWMS",
+                text="My 🖨 is on 🔥", ts="1608291472.001600",
+            ),
+            our_channel="C019JUGAGTS",
+            workspace_uri="https://s.l.a.c.k",
+            zendesk_uri="https://z.e.n.d.e.s.k",
+            slack_client=slack_client,
+            zendesk_client=zendesk_client,
+            user_id="100000000001",
+            group_id="200000000002",
+        ) is True
+
+    # The messages are still in the usual order:
+    assert posted[0].startswith("Hello, your new support request is")
+    assert posted[1].startswith("📧 Primary on call: Fred")
+
+
+def test_on_call_is_not_looked_up_with_atlassian(log, db):
+    """Only PagerDuty's roster is posted, so there is nothing to look up."""
+    slack_client = MagicMock()
+    slack_client.chat_postMessage.return_value = dict(ts="1608291472.001700")
+    slack_client.users_info.return_value = MagicMock(data=dict(
+        user=dict(real_name="Bob Sprocket", profile=dict(email="bob@example.com"))
+    ))
+    zendesk_client = MagicMock()
+    zendesk_client.tickets.create.return_value = MagicMock(
+        ticket=MagicMock(id=1430)
+    )
+
+    with patch("webapp.settings.USE_ATLASSIAN", True), \
+            patch("zenslackchat.message.on_call_roster") as on_call_roster:
+        assert handler(
+            dict(
+                type="message", channel="C019JUGAGTS", user="UGF7MRWMS",
+                text="My 🖨 is on 🔥", ts="1608291472.001600",
+            ),
+            our_channel="C019JUGAGTS",
+            workspace_uri="https://s.l.a.c.k",
+            zendesk_uri="https://z.e.n.d.e.s.k",
+            slack_client=slack_client,
+            zendesk_client=zendesk_client,
+            user_id="100000000001",
+            group_id="200000000002",
+        ) is True
+
+    on_call_roster.assert_not_called()
@@ -0,0 +1,179 @@
+from unittest.mock import patch
+from urllib.parse import parse_qs
+from urllib.parse import urlparse
+
+import pytest
+import requests
+from slack import WebClient
+from slack.errors import SlackApiError
+from zenpy import Zenpy
+
+from loadtest.fakes import Behaviour
+from loadtest.fakes import FakePagerDuty
+from loadtest.fakes import FakeSlack
+from loadtest.fakes import FakeZendesk
+from loadtest.compare import parse_target
+from loadtest.compare import print_comparison
+from loadtest.compare import split_argv
+from loadtest.generate import percentile
+from zenslackchat import zendesk_api
+from zenslackchat.models import PagerDutyApp
+
+
+@pytest.fixture
+def serve():
+    """Start fake services on a free port, returning their base URL."""
+    servers = []
+
+    def _serve(service):
+        server = service.serve(port=0)
+        servers.append(server)
+        return f"http://127.0.0.1:{server.server_address[1]}"
+
+    yield _serve
+
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+
+def test_slack_web_client_against_the_fake(serve):
+    """Check the WebClient calls the bot makes are understood."""
+    slack = FakeSlack()
+    url = serve(slack)
+    client = WebClient(token='xoxb-fake', base_url=f"{url}/api/")
+
+    resp = client.chat_postMessage(channel='C1', text='new issue')
+    chat_id = resp['ts']
+    client.chat_postMessage(channel='C1', text='reply', thread_ts=chat_id)
+
+    replies = client.conversations_replies(channel='C1', ts=chat_id)
+    assert [m['text'] for m in replies.data['messages']] == [
+        'new issue', 'reply'
+    ]
+
+    user = client.users_info(user='UBOB')
+    assert user['user']['profile']['email'] == 'ubob@example.com'
+
+    stats = requests.get(f"{url}/_stats").json()
+    assert stats['total'] == 4
+    assert stats['calls']['POST /api/chat.postMessage'] == 2
+
+
+def test_fake_rate_limits_with_retry_after(serve):
+    """Calls beyond the rate limit get a 429 and Retry-After."""
+    slack = FakeSlack(Behaviour(rate_limit=1, burst=1, retry_after=7))
+    url = serve(slack)
+    client = WebClient(token='xoxb-fake', base_url=f"{url}/api/")
+
+    client.chat_postMessage(channel='C1', text='first')
+    with pytest.raises(SlackApiError) as error:
+        client.chat_postMessage(channel='C1', text='second')
+    assert error.value.response.status_code == 429
+    assert error.value.response.headers['Retry-After'] == '7'
+
+    stats = requests.get(f"{url}/_stats").json()
+    assert stats['throttled'] == 1
+
+    requests.post(f"{url}/_reset")
+    assert requests.get(f"{url}/_stats").json()['total'] == 0
+
+
+def test_zenpy_against_the_fake(serve, monkeypatch):
+    """Check the Zenpy calls the bot makes are understood."""
+    zendesk = FakeZendesk()
+    url = serve(zendesk)
+    monkeypatch.setenv('ZENPY_FORCE_SCHEME', 'http')
+    monkeypatch.setenv('ZENPY_FORCE_NETLOC', url.split('//')[1])
+    client = Zenpy(subdomain='fake', oauth_token='fake', disable_cache=True)
+
+    ticket = zendesk_api.create_ticket(
+        client, chat_id='1.1', user_id=1, group_id=2,
+        recipient_email='bob@example.com', subject='help',
+        slack_message_url='https://s.l.a.c.k/C1/p11',
+    )
+    ticket = zendesk_api.get_ticket(client, ticket.id)
+    assert ticket.external_id == '1.1'
+
+    zendesk_api.add_comment(client, ticket, 'Bob (Slack): more detail')
+    requests.post(
+        f"{url}/_comment", json=dict(ticket_id=ticket.id, body='from agent')
+    )
+
+    comments = zendesk_api.comments_since(client, ticket.id)
+    assert [c.body for c in comments] == [
+        'This is the message on slack https://s.l.a.c.k/C1/p11.',
+        'Bob (Slack): more detail',
+        'from agent',
+    ]
+    assert [
+        c.body for c in zendesk_api.comments_since(
+            client, ticket.id, comments[1].id
+        )
+    ] == ['from agent']
+
+    zendesk_api.close_ticket(client, ticket.id)
+    assert zendesk.tickets[ticket.id]['status'] == 'closed'
+
+
+def test_comments_since_only_reads_the_newest_page(serve, monkeypatch):
+    """The cursor pagination sort is sent, so older pages aren't read."""
+    zendesk = FakeZendesk()
+    url = serve(zendesk)
+    monkeypatch.setenv('ZENPY_FORCE_SCHEME', 'http')
+    monkeypatch.setenv('ZENPY_FORCE_NETLOC', url.split('//')[1])
+    client = Zenpy(subdomain='fake', oauth_token='fake', disable_cache=True)
+    ticket = zendesk.add_ticket(dict(subject='help'))
+    comments = [
+        zendesk.add_comment(ticket['id'], dict(body=f'comment {index}'))
+        for index in range(250)
+    ]
+    requests.post(f"{url}/_reset")
+
+    with patch.object(client.tickets, '_get', wraps=client.tickets._get) as get:
+        found = zendesk_api.comments_since(
+            client, ticket['id'], comments[-3]['id']
+        )
+
+    assert [c.body for c in found] == ['comment 248', 'comment 249']
+    query = parse_qs(urlparse(get.call_args_list[0].args[0]).query)
+    assert query == {'page[size]': ['100'], 'sort': ['-created_at']}
+    assert requests.get(f"{url}/_stats").json()['total'] == 1
+
+    # All of them over three pages:
+    found = zendesk_api.comments_since(client, ticket['id'], 0)
+    assert len(found) == 251
+
+
+def test_pagerduty_against_the_fake(serve, settings):
+    """Check PagerDutyApp can recover who is on call from the fake."""
+    url = serve(FakePagerDuty())
+    settings.PAGERDUTY_API_URL = url
+    settings.PD_TOKEN_END_POINT = f"{url}/oauth/token"
+
+    app_token = PagerDutyApp.client()
+    on_call, until = PagerDutyApp.on_call_until(app_token)
+    assert on_call == dict(primary='Primary', secondary='Secondary')
+    assert until is not None
+
+
+def test_percentile():
+    assert percentile([], 50) is None
+    assert percentile([3.0], 99) == 3.0
+    samples = list(range(1, 101))
+    assert percentile(samples, 50) == 50
+    assert percentile(samples, 95) == 95
+    assert percentile(samples, 99) == 99
+
+
+def test_compare_arguments_and_table(capsys):
+    assert parse_target('asgi=http://h:1') == ('asgi', 'http://h:1')
+    assert split_argv(['a=b', '--', '--rate', '5']) == (['a=b'], ['--rate', '5'])
+
+    latency = dict(p50=0.01, p95=0.02, p99=0.03, max=0.05)
+    print_comparison(dict(
+        wsgi=dict(sent=10, throughput=5.0, latency=latency,
+                  statuses={'200': 8, '503': 2}),
+    ))
+    row = capsys.readouterr().out.splitlines()[-1].split()
+    assert row == ['wsgi', '10', '5.0', '2', '10.0ms', '20.0ms', '30.0ms', '50.0ms']
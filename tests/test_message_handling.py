@@ -4,6 +4,7 @@ from unittest.mock import MagicMock, patch
 import pytest
 
 from zenslackchat.message import IGNORED_SUBTYPES, handler, is_resolved
+from zenslackchat.message_tools import message_hash
 from zenslackchat.models import ZenSlackChat
 from zenslackchat.zendesk_email_to_slack import email_from_zendesk
 
@@ -99,7 +100,7 @@ def test_new_support_message_creates_ticket(
     assert issue.closed is None
     assert issue.channel_id == "C019JUGAGTS"
     assert issue.chat_id == "1597940362.013100"
-    assert issue.ticket_id == "32"
+    assert issue.ticket_id == 32
 
     # Verify the calls to the various mock are as I expect:
 
@@ -122,6 +123,11 @@ def test_new_support_message_creates_ticket(
         slack_client, "https://z.e.n.d.e.s.k", "32", "1597940362.013100", "C019JUGAGTS"
     )
 
+    # The parent message is the first entry in the index:
+    assert issue.hash_index() == (
+        {message_hash("My 🖨 is on 🔥")}, {"1597940362.013100"}
+    )
+
 
 @pytest.mark.parametrize(
     ("resolve_command", "expected"),
@@ -211,7 +217,7 @@ def test_zendesk_comment_and_resolve_ticket_command_closes_the_issue(
     assert issue.closed is None
     assert issue.channel_id == "C0192NP3TFG"
     assert issue.chat_id == "1602064330.001600"
-    assert issue.ticket_id == "77"
+    assert issue.ticket_id == 77
 
     # Check a new comment is sent over to zendesk:
     #
@@ -243,7 +249,7 @@ def test_zendesk_comment_and_resolve_ticket_command_closes_the_issue(
     assert issue.closed is None
     assert issue.channel_id == "C0192NP3TFG"
     assert issue.chat_id == "1602064330.001600"
-    assert issue.ticket_id == "77"
+    assert issue.ticket_id == 77
 
     # No ticket should be created here
     create_ticket.assert_not_called()
@@ -287,7 +293,7 @@ def test_zendesk_comment_and_resolve_ticket_command_closes_the_issue(
     assert issue.closed is not None
     assert issue.channel_id == "C0192NP3TFG"
     assert issue.chat_id == "1602064330.001600"
-    assert issue.ticket_id == "77"
+    assert issue.ticket_id == 77
 
     slack_client.users_info.assert_called_with(user="UGF7MRWMS")
     create_ticket.assert_not_called()
@@ -388,7 +394,7 @@ def test_message_with_existing_support_ticket_in_zendesk(
     assert issue.closed is None
     assert issue.channel_id == "C019JUGAGTS"
     assert issue.chat_id == "1598022004.004900"
-    assert issue.ticket_id == "21"
+    assert issue.ticket_id == 21
 
     # Verify the calls to the various mock are as I expect:
 
@@ -491,7 +497,7 @@ def test_thread_message_with_support_ticket_in_zendesk(
     assert issue.closed is None
     assert issue.channel_id == "C019JUGAGTS"
     assert issue.chat_id == "1598021907.003600"
-    assert issue.ticket_id == "83"
+    assert issue.ticket_id == 83
 
     # Verify the calls to the various mock are as I expect. The only thing that
     # should happen here is the comment gets shipped to Zendesk
@@ -500,13 +506,19 @@ def test_thread_message_with_support_ticket_in_zendesk(
     slack_client.users_info.assert_called_with(user="UGF7MRWMS")
 
     # Check the ticket is "recovered" and the comment is "added" to it:
-    get_ticket.assert_called_with(zendesk_client, "83")
+    get_ticket.assert_called_with(zendesk_client, 83)
     add_comment.assert_called_with(
         zendesk_client,
         ticket,
         "Bob Sprocket (Slack): Oh, wait, my bad 🤦‍♀️, its ok now.",
     )
 
+    # The mirrored message is in the index so it won't be hashed again:
+    assert issue.hash_index() == (
+        {message_hash("Oh, wait, my bad 🤦‍♀️, its ok now.")},
+        {"1598022004.004900"},
+    )
+
     # These should not have been called:
     create_ticket.assert_not_called()
     post_message.assert_not_called()
@@ -334,3 +334,61 @@ def test_truncate_email(email_body, truncated, character_limit):
 def test_markdown_links_correctly_stripped(log, markdown, plain_text):
     """Regression test to make sure markdown links don't reappear."""
     assert message_tools.strip_formatting(markdown) == plain_text
+
+
+def _thread_corpus():
+    """Recover the slack 'text' and zendesk 'body' of the thread fixtures.
+    """
+    import ast
+    import pathlib
+
+    corpus = set()
+    for path in pathlib.Path(__file__).parent.glob("test_*.py"):
+        for node in ast.walk(ast.parse(path.read_text())):
+            if not isinstance(node, ast.Dict):
+                continue
+            for key, value in zip(node.keys, node.values):
+                if not isinstance(key, ast.Constant):
+                    continue
+                if key.value not in ("text", "body", "plain_body"):
+                    continue
+                if isinstance(value, ast.Constant) and isinstance(value.value, str):
+                    corpus.add(value.value)
+
+    return sorted(corpus)
+
+
+THREAD_CORPUS = _thread_corpus() + [
+    "Hello, your new support request is https://z.e.n.d.e.s.k/33686.",
+    "(Zendesk): first comment from zendesk",
+    "Hi\n\nCan you add me to the well-known group (ticket #123)?\n\nThanks!\nBob",
+    "My 🖨 is on 🔥 :fire:",
+    "- one\n- two",
+    "1. first\n2. second",
+    "*bold* and _italic_ with `code`",
+    "Title\n=====\nbody",
+    "a &amp; b < c",
+    "    indented code",
+    "tab\tseparated",
+    "trailing  \nbreak",
+]
+
+
+@pytest.mark.parametrize("text", THREAD_CORPUS)
+def test_strip_formatting_matches_markdown_to_text(text):
+    """The fast path must give the same result as the markdown conversion."""
+    assert message_tools.strip_formatting(text) == message_tools.markdown_to_text(
+        text
+    )
+
+
+def test_strip_formatting_is_memoized():
+    """Repeats are answered from the memo.
+
+    The timing against markdown_to_text() is in tests/test_benchmarks.py.
+
+    """
+    message_tools.strip_formatting.cache_clear()
+    message_tools.strip_formatting(THREAD_CORPUS[0])
+    message_tools.strip_formatting(THREAD_CORPUS[0])
+    assert message_tools.strip_formatting.cache_info().hits == 1
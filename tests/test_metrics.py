@@ -0,0 +1,209 @@
+from unittest.mock import MagicMock
+
+import pytest
+
+from zenslackchat import metrics
+from zenslackchat.message import handler
+from zenslackchat.metrics import api_call
+from zenslackchat.metrics import CACHE_REQUESTS
+from zenslackchat.metrics import Histogram
+from zenslackchat.metrics import RedisBackend
+
+
+class FakeRedis(object):
+    """Just enough of redis.Redis to share a hash between backends."""
+    def __init__(self):
+        self.hashes = {}
+        self.lists = {}
+        self.down = False
+
+    def pipeline(self, transaction=True):
+        return FakePipeline(self)
+
+    def hincrbyfloat(self, key, field, amount):
+        if self.down:
+            raise ConnectionError("redis is down")
+        found = self.hashes.setdefault(key, {})
+        found[field.encode()] = found.get(field.encode(), 0) + amount
+
+    def hgetall(self, key):
+        return {
+            field: str(value).encode()
+            for field, value in self.hashes.get(key, {}).items()
+        }
+
+    def llen(self, name):
+        return len(self.lists.get(name, []))
+
+
+class FakePipeline(object):
+    def __init__(self, client):
+        self.client = client
+        self.calls = []
+
+    def __getattr__(self, name):
+        def call(*args):
+            self.calls.append((name, args))
+        return call
+
+    def execute(self):
+        return [getattr(self.client, name)(*args) for name, args in self.calls]
+
+
+def samples(text):
+    """The 'name{labels}': value lines of the exposition."""
+    return {
+        line.rsplit(" ", 1)[0]: float(line.rsplit(" ", 1)[1])
+        for line in text.splitlines() if not line.startswith("#")
+    }
+
+
+def handle(event):
+    slack_client = MagicMock()
+    slack_client.users_info.return_value = MagicMock(data=dict(
+        user=dict(real_name="Bob Sprocket", profile=dict(email="bob@example.com"))
+    ))
+    return handler(
+        event,
+        our_channel="C019JUGAGTS",
+        workspace_uri="https://s.l.a.c.k",
+        zendesk_uri="https://z.e.n.d.e.s.k",
+        slack_client=slack_client,
+        zendesk_client=MagicMock(),
+        user_id="100000000001",
+        group_id="200000000002",
+    )
+
+
+def test_handler_events_are_counted(log, db):
+    event = dict(
+        type="message", channel="C019JUGAGTS", user="UGF7MRWMS", text="hi",
+        ts="1608291472.001600",
+    )
+    handle(dict(event, channel="COTHER"))
+    handle(dict(event, channel="COTHER"))
+    handle(dict(event, subtype="channel_join"))
+    handle(dict(event, bot_id="BSOMEBOT"))
+    handle(dict(event, thread_ts="1608291400.000100"))
+
+    found = samples(metrics.render())
+    assert found["zenslackchat_events_received_total"] == 5
+    assert found['zenslackchat_events_ignored_total{reason="channel"}'] == 2
+    assert found['zenslackchat_events_ignored_total{reason="subtype"}'] == 1
+    assert found['zenslackchat_events_ignored_total{reason="bot_id"}'] == 1
+    assert found['zenslackchat_events_handled_total{action="old_thread"}'] == 1
+    assert found[
+        'zenslackchat_duration_seconds_count{name="message.handler"}'
+    ] == 5
+    assert found[
+        'zenslackchat_api_duration_seconds_count'
+        '{method="users_info",service="slack"}'
+    ] == 1
+    assert found[
+        'zenslackchat_cache_requests_total{cache="slack_user",result="miss"}'
+    ] == 1
+
+
+def test_histogram_buckets_are_cumulative():
+    latency = Histogram("test_latency_seconds", "Test.", ("name",),
+                        buckets=(0.1, 1.0))
+    try:
+        latency.observe(0.05, name="a")
+        latency.observe(0.5, name="a")
+        latency.observe(5, name="a")
+
+        text = metrics.render()
+        lines = [line for line in text.splitlines() if "test_latency" in line]
+        assert lines == [
+            "# HELP test_latency_seconds Test.",
+            "# TYPE test_latency_seconds histogram",
+            'test_latency_seconds_bucket{name="a",le="0.1"} 1',
+            'test_latency_seconds_bucket{name="a",le="1.0"} 2',
+            'test_latency_seconds_bucket{name="a",le="+Inf"} 3',
+            'test_latency_seconds_count{name="a"} 3',
+            'test_latency_seconds_sum{name="a"} 5.55',
+        ]
+
+    finally:
+        metrics.exporter._metrics.remove(latency)
+
+
+def test_api_call_errors_are_counted():
+    @api_call("zendesk", "get_ticket")
+    def broken():
+        raise ValueError("no")
+
+    with pytest.raises(ValueError):
+        broken()
+
+    with api_call("pagerduty", "oncalls") as call:
+        call.error = "HTTP 500"
+
+    found = samples(metrics.render())
+    assert found[
+        'zenslackchat_api_errors_total'
+        '{error="ValueError",method="get_ticket",service="zendesk"}'
+    ] == 1
+    assert found[
+        'zenslackchat_api_errors_total'
+        '{error="HTTP 500",method="oncalls",service="pagerduty"}'
+    ] == 1
+
+
+def test_cache_hit_ratio():
+    CACHE_REQUESTS.inc(cache="oncall_roster", result="hit")
+    CACHE_REQUESTS.inc(3, cache="oncall_roster", result="miss")
+    CACHE_REQUESTS.inc(cache="slack_user", result="shared_hit")
+
+    found = samples(metrics.render())
+    assert found['zenslackchat_cache_hit_ratio{cache="oncall_roster"}'] == 0.25
+    assert found['zenslackchat_cache_hit_ratio{cache="slack_user"}'] == 1
+
+
+def test_processes_are_totalled_in_redis(monkeypatch):
+    shared = FakeRedis()
+    monkeypatch.setattr("redis.Redis.from_url", lambda url: shared)
+    web = RedisBackend("redis://", flush_seconds=60)
+    worker = RedisBackend("redis://", flush_seconds=0)
+    key = ("a_total", "a_total", (("reason", "x"),))
+
+    web.inc(key, 1)
+    worker.inc(key, 2)
+    assert shared.hashes  # the worker flushed straight away
+
+    # Reading flushes this process's pending counts first:
+    assert web.values() == {key: 3}
+
+    # Counts are kept for later if redis is down:
+    shared.down = True
+    worker.inc(key, 4)
+    shared.down = False
+    assert worker.values() == {key: 7}
+
+
+def test_celery_queue_length():
+    client = FakeRedis()
+    client.lists = {"celery": [1, 2], "celery\x06\x163": [3], "other": [4]}
+
+    assert metrics.queue_length(client, "celery") == 3
+
+
+def test_metrics_view(client, settings, db):
+    settings.CELERY_BROKER_URL = "redis://127.0.0.1:1/0"
+
+    # Off without a token:
+    settings.METRICS_TOKEN = ""
+    assert client.get("/metrics").status_code == 404
+
+    settings.METRICS_TOKEN = "sekret"
+    resp = client.get("/metrics", HTTP_AUTHORIZATION="Bearer sekret")
+    assert resp.status_code == 200
+    assert resp["Content-Type"].startswith("text/plain; version=0.0.4")
+    text = resp.content.decode()
+    assert "# TYPE zenslackchat_events_received_total counter" in text
+    assert "# TYPE zenslackchat_celery_queue_length gauge" in text
+
+    assert client.get("/metrics").status_code == 403
+    assert client.get(
+        "/metrics", HTTP_AUTHORIZATION="Bearer wrong"
+    ).status_code == 403
@@ -1,13 +1,16 @@
 import datetime
+import io
 from unittest.mock import patch
 from unittest.mock import MagicMock
 
 import pytest
+from django.core.management import call_command
 from django.test import TestCase
 
 from zenslackchat.models import ZenSlackChat
 from zenslackchat.models import NotFoundError
 from zenslackchat.models import OutOfHoursInformation
+from zenslackchat.models import PagerDutyApp
 
 
 UTC = datetime.timezone.utc
@@ -155,14 +158,14 @@ def test_basic_cru_functionality(log, db):
     ZenSlackChat.open(
         channel_id="slack-channel-id-1",
         chat_id="slack-chat-id-1",
-        ticket_id="zendesk-ticket-id-1",
+        ticket_id="1001",
         opened=datetime.datetime(2020, 1, 1, 12, 30, tzinfo=UTC)
     )
 
     ZenSlackChat.open(
         channel_id="slack-channel-id-2",
         chat_id="slack-chat-id-2",
-        ticket_id="zendesk-ticket-id-2",
+        ticket_id="1002",
         opened=datetime.datetime(2020, 7, 17, 14, 0, tzinfo=UTC)
     )
 
@@ -175,6 +178,10 @@ def test_basic_cru_functionality(log, db):
         2020, 1, 1, 12, 30, tzinfo=UTC
     )
 
+    # Zendesk sends the ticket ID as a string in the webhook data:
+    assert ZenSlackChat.get_by_ticket("slack-chat-id-1", "1001") == chat1
+    assert chat1.ticket_id == 1001
+
     chat2 = ZenSlackChat.get("slack-channel-id-2", "slack-chat-id-2")
     assert chat2.active is True
     assert chat2.closed is None
@@ -223,7 +230,78 @@ def test_not_found(db):
         ZenSlackChat.resolve("slack-channel-id-1", "slack-chat-id-1")
 
 
+def test_lookup_benchmark_uses_the_indexes(db):
+    out = io.StringIO()
+    call_command("benchmark_lookups", rows=2000, repeat=3, stdout=out)
+
+    found = out.getvalue()
+    assert "zenslackchat_ticket_idx" in found
+    assert "zenslackchat_open_idx" in found
+    assert "zenslackchat_closed_idx" in found
+    # The conversations are not kept:
+    assert ZenSlackChat.objects.count() == 0
+
+
 def test_no_open_issues(db):
     """Verify I get no open issues when DB is empty.
     """
     assert ZenSlackChat.open_issues() == []
+
+
+def fake_token_response(access_token, expires_in=3600):
+    response = MagicMock()
+    response.status_code = 200
+    response.json.return_value = dict(
+        access_token=access_token,
+        token_type='bearer',
+        expires_in=expires_in,
+    )
+    return response
+
+
+@patch('zenslackchat.models.PagerDutyApp.session')
+def test_pagerduty_token_is_reused(session, settings):
+    """Test a new PagerDuty token is not requested for every ticket.
+    """
+    settings.PAGERDUTY_TOKEN_EXPIRY_MARGIN = 60
+    settings.PAGERDUTY_TOKEN_REFRESH_AHEAD = 300
+    session.post.return_value = fake_token_response('token-1')
+
+    assert PagerDutyApp.client()['access_token'] == 'token-1'
+    assert PagerDutyApp.client()['access_token'] == 'token-1'
+    session.post.assert_called_once()
+
+
+@patch('zenslackchat.models.threading')
+@patch('zenslackchat.models.time')
+@patch('zenslackchat.models.PagerDutyApp.session')
+def test_pagerduty_token_is_refreshed_before_expiry(
+    session, time, threading, settings
+):
+    """Test the token is refreshed in the background near its expiry.
+    """
+    settings.PAGERDUTY_TOKEN_EXPIRY_MARGIN = 60
+    settings.PAGERDUTY_TOKEN_REFRESH_AHEAD = 300
+    session.post.return_value = fake_token_response('token-1')
+
+    time.time.return_value = 1000
+    PagerDutyApp.client()
+
+    # Not yet close to expiry:
+    time.time.return_value = 1000 + 3000
+    assert PagerDutyApp.client()['access_token'] == 'token-1'
+    threading.Thread.assert_not_called()
+
+    # Within the refresh window the current token is still returned while a
+    # refresh is started, but only once:
+    time.time.return_value = 1000 + 3300
+    assert PagerDutyApp.client()['access_token'] == 'token-1'
+    assert PagerDutyApp.client()['access_token'] == 'token-1'
+    threading.Thread.assert_called_once_with(
+        target=PagerDutyApp.refresh_token, daemon=True
+    )
+
+    # Run the refresh the thread would have done:
+    session.post.return_value = fake_token_response('token-2')
+    PagerDutyApp.refresh_token()
+    assert PagerDutyApp.client()['access_token'] == 'token-2'
@@ -0,0 +1,119 @@
+import datetime
+from unittest.mock import patch
+
+from zenslackchat.oncall import on_call_roster
+
+
+UTC = datetime.timezone.utc
+
+NOW = datetime.datetime(2020, 12, 3, 9, 0, tzinfo=UTC)
+
+ROSTER = dict(primary='Fred Sprocket', secondary='Tony Tiger')
+
+
+@patch('zenslackchat.oncall.fetch_roster')
+def test_roster_is_cached_until_hand_over(fetch_roster, settings, local_cache):
+    """Test who is on call is only recovered once until the hand over.
+    """
+    settings.ONCALL_ROSTER_MAX_AGE = 24 * 3600
+    hand_over = NOW + datetime.timedelta(hours=13)
+    fetch_roster.return_value = (ROSTER, hand_over)
+
+    with patch.object(local_cache, 'set', wraps=local_cache.set) as set:
+        assert on_call_roster(now=NOW) == ROSTER
+        set.assert_any_call('on-call-roster:pagerduty', ROSTER, timeout=13 * 3600)
+
+    # The cached roster is used from then on:
+    assert on_call_roster(now=NOW) == ROSTER
+    assert on_call_roster(now=NOW) == ROSTER
+    fetch_roster.assert_called_once()
+
+
+@patch('zenslackchat.oncall.fetch_roster')
+def test_roster_cache_age_is_limited(fetch_roster, settings):
+    """Test the roster is cached no longer than ONCALL_ROSTER_MAX_AGE.
+    """
+    settings.ONCALL_ROSTER_MAX_AGE = 3600
+
+    # Permanent on call with no end:
+    fetch_roster.return_value = (ROSTER, None)
+    with patch('zenslackchat.oncall.cache') as cache:
+        cache.get.return_value = None
+        on_call_roster(now=NOW)
+        cache.set.assert_any_call('on-call-roster:pagerduty', ROSTER, timeout=3600)
+
+
+@patch('zenslackchat.oncall.fetch_roster')
+def test_last_known_roster_used_on_failure(fetch_roster, settings):
+    """Test the last known roster is returned if PagerDuty is unavailable.
+    """
+    settings.ONCALL_ROSTER_MAX_AGE = 3600
+
+    # Nothing known and PagerDuty is down:
+    fetch_roster.side_effect = ConnectionError('PagerDuty is down')
+    assert on_call_roster(now=NOW) == {}
+
+    fetch_roster.side_effect = None
+    fetch_roster.return_value = (ROSTER, None)
+    assert on_call_roster(now=NOW) == ROSTER
+
+    # The pre-warm finds PagerDuty down again:
+    fetch_roster.side_effect = ConnectionError('PagerDuty is down')
+    assert on_call_roster(refresh=True, now=NOW) == ROSTER
+
+    # An empty answer is also treated as not known:
+    fetch_roster.side_effect = None
+    fetch_roster.return_value = ({}, None)
+    assert on_call_roster(refresh=True, now=NOW) == ROSTER
+
+
+@patch('zenslackchat.oncall.fetch_roster')
+def test_roster_sources_are_cached_apart(fetch_roster, settings, local_cache):
+    """Test the PagerDuty and Confluence rosters don't overwrite each other.
+    """
+    settings.ONCALL_ROSTER_MAX_AGE = 3600
+    settings.USE_ATLASSIAN = True
+    confluence = dict(primary='Bob Sprocket', secondary='Tony Tiger')
+    fetch_roster.side_effect = lambda now, source: (
+        confluence if source == 'confluence' else ROSTER, None
+    )
+
+    assert on_call_roster(now=NOW) == confluence
+    assert on_call_roster(now=NOW, source='pagerduty') == ROSTER
+    assert on_call_roster(now=NOW) == confluence
+    assert on_call_roster(now=NOW, source='pagerduty') == ROSTER
+    assert fetch_roster.call_count == 2
+
+
+@patch('zenslackchat.models.PagerDutyApp.get')
+def test_pagerduty_hand_over_time(get):
+    """Test the hand over is the earliest end of the primary and secondary.
+    """
+    from zenslackchat.models import PagerDutyApp
+
+    get.return_value = {
+        "oncalls": [
+            {
+                "escalation_level": 2,
+                "user": {"summary": "Tony Tiger"},
+                "start": "2020-12-02T08:00:00Z",
+                "end": "2020-12-04T08:00:00Z",
+            },
+            {
+                "escalation_level": 1,
+                "user": {"summary": "Fred Sprocket"},
+                "start": "2020-12-03T08:00:00Z",
+                "end": "2020-12-03T22:00:00Z",
+            },
+            {
+                "escalation_level": 3,
+                "user": {"summary": "Manager"},
+                "start": None,
+                "end": None,
+            },
+        ]
+    }
+
+    roster, until = PagerDutyApp.on_call_until(app_token={})
+    assert roster == ROSTER
+    assert until == datetime.datetime(2020, 12, 3, 22, 0, tzinfo=UTC)
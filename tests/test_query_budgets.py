@@ -0,0 +1,287 @@
+"""
+Fail when a code path makes more database queries than its budget.
+
+The budgets are zenslackchat.metrics.QUERY_BUDGETS, which also warn in the
+logs when they are exceeded in production.
+
+"""
+import datetime
+from unittest.mock import MagicMock
+from unittest.mock import patch
+
+import pytest
+
+from webapp.celery import count_task_queries
+from webapp.celery import record_task_queries
+from zenslackchat.client_registry import registry
+from zenslackchat.message import handler
+from zenslackchat.metrics import QUERY_BUDGETS
+from zenslackchat.metrics import QueryCounter
+from zenslackchat.metrics import metrics
+from zenslackchat.models import SlackApp
+from zenslackchat.models import ZenSlackChat
+from zenslackchat.zendesk_comments_to_slack import comments_from_zendesk
+from zenslackchat.zendesk_email_to_slack import email_from_zendesk
+
+
+UTC = datetime.timezone.utc
+
+
+class FakeTicket(object):
+    def __init__(self, ticket_id, subject=""):
+        self.id = ticket_id
+        self.status = "open"
+        self.subject = subject
+
+
+class FakeComment(object):
+    def __init__(self, id, body, channel='web'):
+        self.id = id
+        self.body = body
+        self.channel = channel
+
+    def to_dict(self):
+        return dict(id=self.id, body=self.body, via=dict(channel=self.channel))
+
+
+@pytest.fixture
+def clients():
+    slack_client = MagicMock()
+    slack_client.users_info.return_value = MagicMock(data=dict(
+        user=dict(real_name="Bob Sprocket", profile=dict(email="bob@example.com"))
+    ))
+    slack_client.chat_postMessage.return_value = dict(
+        ts="1608291480.001800", message=dict(ts="1608291480.001800")
+    )
+    zendesk_client = MagicMock()
+    zendesk_client.tickets.create.return_value = MagicMock(
+        ticket=FakeTicket(1430)
+    )
+    zendesk_client.tickets.return_value = FakeTicket(1430)
+    zendesk_client.users.me.return_value = MagicMock(id=1)
+
+    with patch("zenslackchat.message.on_call_roster") as on_call_roster:
+        on_call_roster.return_value = dict(primary="Fred", secondary="Tony")
+        with patch("zenslackchat.zendesk_email_to_slack.on_call_roster") as r:
+            r.return_value = on_call_roster.return_value
+            yield slack_client, zendesk_client
+
+
+@pytest.fixture
+def budget(django_assert_max_num_queries):
+    """Check a named code path keeps to its budget and was counted."""
+    metrics.reset()
+
+    def _budget(name):
+        return django_assert_max_num_queries(QUERY_BUDGETS[name])
+
+    yield _budget
+
+
+def handle(event, clients):
+    slack_client, zendesk_client = clients
+    return handler(
+        event,
+        our_channel="C019JUGAGTS",
+        workspace_uri="https://s.l.a.c.k",
+        zendesk_uri="https://z.e.n.d.e.s.k",
+        slack_client=slack_client,
+        zendesk_client=zendesk_client,
+        user_id="100000000001",
+        group_id="200000000002",
+    )
+
+
+@pytest.mark.parametrize("text, thread_ts", [
+    ("My 🖨 is on 🔥", None),
+    ("Oh, wait, its ok now.", "1608291472.001600"),
+    ("resolve", "1608291472.001600"),
+])
+def test_handler_query_budget(text, thread_ts, clients, budget, log, db):
+    """New messages, thread replies and resolves."""
+    ZenSlackChat.open("C019JUGAGTS", "1608291472.001600", ticket_id="1430")
+    event = dict(
+        type="message", channel="C019JUGAGTS", user="UGF7MRWMS", text=text,
+        ts="1608291475.001700",
+    )
+    if thread_ts:
+        event["thread_ts"] = thread_ts
+
+    with budget("message.handler"):
+        assert handle(event, clients) is True
+
+    assert metrics.snapshot()["message.handler"]["calls"] == 1
+
+
+@patch('zenslackchat.zendesk_comments_to_slack.post_message')
+def test_comments_from_zendesk_query_budget(
+    post_message, clients, budget, log, db
+):
+    slack_client, zendesk_client = clients
+    ZenSlackChat.open('C019JUGAGTS', '1608291472.001600', ticket_id='1430')
+    post_message.return_value = dict(ts='1608291480.001800')
+    zendesk_client.tickets.comments.return_value = [
+        FakeComment(100, 'This is the message on slack', channel='api'),
+        FakeComment(101, 'hello world'),
+        FakeComment(102, 'and again'),
+    ]
+    slack_client.conversations_replies.return_value = MagicMock(data=dict(
+        messages=[dict(ts='1608291472.001600', text='new issue')]
+    ))
+    event = dict(chat_id='1608291472.001600', ticket_id='1430')
+
+    with budget("zendesk.comments_from_zendesk"):
+        assert len(comments_from_zendesk(
+            event, slack_client, zendesk_client
+        )) == 2
+
+
+@patch("zenslackchat.zendesk_email_to_slack.message_issue_zendesk_url")
+@patch("zenslackchat.zendesk_email_to_slack.message_who_is_on_call")
+def test_email_from_zendesk_query_budget(_who, _url, clients, budget, log, db):
+    slack_client, zendesk_client = clients
+    zendesk_client.tickets.return_value = FakeTicket(32, subject="help")
+
+    with budget("zendesk.email_from_zendesk"):
+        email_from_zendesk(dict(ticket_id="32"), slack_client, zendesk_client)
+
+    assert ZenSlackChat.objects.count() == 1
+
+
+@pytest.mark.parametrize("rows", [1, 100])
+def test_daily_summary_query_budget(rows, budget, db):
+    """The query count doesn't grow with the number of issues."""
+    yesterday = datetime.datetime(2020, 1, 1, 9, 0, tzinfo=UTC)
+    ZenSlackChat.objects.bulk_create([
+        ZenSlackChat(
+            channel_id="C019JUGAGTS",
+            chat_id=f"1577836800.{index:06d}",
+            ticket_id=str(index),
+            active=bool(index % 2),
+            opened=yesterday,
+            closed=None if index % 2 else yesterday,
+        )
+        for index in range(rows)
+    ])
+
+    with budget("zenslackchat.daily_summary"):
+        ZenSlackChat.daily_summary(
+            "https://s.l.a.c.k", yesterday + datetime.timedelta(days=1)
+        )
+
+
+@pytest.mark.parametrize("search", [
+    "",
+    "?q=1577836800.000001",
+    "?q=https://x.slack.com/archives/C019JUGAGTS/p1577836800000001",
+])
+def test_admin_changelist_query_budget(search, admin_client, budget, db):
+    yesterday = datetime.datetime(2020, 1, 1, 9, 0, tzinfo=UTC)
+    ZenSlackChat.objects.bulk_create([
+        ZenSlackChat(
+            channel_id="C019JUGAGTS",
+            chat_id=f"1577836800.{index:06d}",
+            ticket_id=str(index),
+            opened=yesterday,
+        )
+        for index in range(50)
+    ])
+    name = "view:admin:zenslackchat_zenslackchat_changelist"
+
+    with budget(name):
+        resp = admin_client.get(f"/admin/zenslackchat/zenslackchat/{search}")
+    assert resp.status_code == 200
+    if search:
+        assert resp.context["cl"].result_count == 1
+
+    # The middleware counted it under the admin view's name:
+    assert metrics.snapshot()[name]["calls"] == 1
+
+
+def test_admin_search_keeps_the_filters(admin_client, db):
+    opened = datetime.datetime(2020, 1, 1, 9, 0, tzinfo=UTC)
+    ZenSlackChat.objects.bulk_create([
+        ZenSlackChat(
+            channel_id="C019JUGAGTS",
+            chat_id=f"1577836800.{index:06d}",
+            ticket_id=index,
+            active=bool(index % 2),
+            opened=opened,
+        )
+        for index in range(4)
+    ])
+    changelist = "/admin/zenslackchat/zenslackchat/"
+    url = "https://x.slack.com/archives/C019JUGAGTS/p1577836800000001"
+
+    def found(**query):
+        resp = admin_client.get(changelist, query)
+        assert resp.status_code == 200
+        return resp.context["cl"].result_count
+
+    assert found(q=url) == 1
+    assert found(q=f" {url}/ ") == 1
+    # The chat_id from the URL is only matched with the filters applied:
+    assert found(q=url, active__exact="1") == 1
+    assert found(q=url, active__exact="0") == 0
+    # Terms which aren't URLs are searched as they are:
+    assert found(q="  ") == 4
+    assert found(q="x/ ") == 0
+    assert found(q="000003") == 1
+
+
+@patch('zenslackchat.models.WebClient')
+def test_cached_client_makes_no_queries(
+    WebClient, django_assert_num_queries, settings, db
+):
+    settings.CLIENT_REGISTRY_CHECK_SECONDS = 60
+    SlackApp.objects.create(
+        team_name='t', team_id='T1', bot_user_id='B1', bot_access_token='x'
+    )
+    registry.invalidate()
+    client = SlackApp.client()
+
+    with django_assert_num_queries(0):
+        assert SlackApp.client() is client
+
+
+def test_query_counter_records_metrics(log, db):
+    metrics.reset()
+
+    with QueryCounter("test.counter") as counter:
+        ZenSlackChat.objects.count()
+        ZenSlackChat.objects.exists()
+    assert counter.queries == 2
+
+    with QueryCounter("test.counter"):
+        pass
+
+    stats = metrics.snapshot()["test.counter"]
+    assert stats["calls"] == 2
+    assert stats["queries"] == 2
+    assert stats["max"] == 2
+    assert stats["last"] == 0
+
+
+def test_over_budget_is_counted(log, db):
+    metrics.reset()
+    name = "zenslackchat.daily_summary"
+
+    with QueryCounter(name):
+        for _ in range(QUERY_BUDGETS[name] + 1):
+            ZenSlackChat.objects.count()
+
+    assert metrics.snapshot()[name]["over_budget"] == 1
+
+
+def test_task_queries_are_counted(log, db):
+    metrics.reset()
+    task = MagicMock()
+    task.name = "webapp.celery.run_daily_summary"
+
+    count_task_queries(task_id="task-1", task=task)
+    ZenSlackChat.objects.count()
+    record_task_queries(task_id="task-1")
+
+    stats = metrics.snapshot()["task:webapp.celery.run_daily_summary"]
+    assert stats["calls"] == 1
+    assert stats["queries"] == 1
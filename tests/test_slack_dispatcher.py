@@ -0,0 +1,191 @@
+import threading
+import time
+from unittest.mock import MagicMock
+
+import pytest
+import requests
+from slack import WebClient
+from slack.errors import SlackApiError
+
+from loadtest.fakes import Behaviour
+from loadtest.fakes import FakeSlack
+from zenslackchat import metrics
+from zenslackchat.slack_dispatcher import SlackDispatcher
+from zenslackchat.slack_dispatcher import TokenBucket
+
+
+class Clock(object):
+    """Time that only passes when something sleeps."""
+    def __init__(self):
+        self.now = 1000.0
+        self.slept = []
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.slept.append(round(seconds, 3))
+        self.now += seconds
+
+
+def rate_limited(retry_after):
+    return SlackApiError(
+        "ratelimited",
+        MagicMock(status_code=429, headers={'Retry-After': str(retry_after)}),
+    )
+
+
+@pytest.fixture
+def clock(settings):
+    settings.SLACK_RATE_LIMITS = True
+    settings.SLACK_CHANNEL_RATE = 1
+    settings.SLACK_CHANNEL_BURST = 2
+    settings.SLACK_METHOD_RATE = 600
+    settings.SLACK_METHOD_BURST = 10
+    return Clock()
+
+
+def test_token_bucket(clock):
+    bucket = TokenBucket(2, burst=2, clock=clock)
+
+    # The burst goes out straight away then one every 1/rate seconds:
+    assert [bucket.reserve() for _ in range(4)] == [0, 0, 0.5, 1.0]
+
+    clock.now += 10
+    bucket.pause(3)
+    assert bucket.reserve() == 3
+
+    assert TokenBucket(None, clock=clock).reserve() == 0
+
+
+def test_channel_rate_is_kept(clock):
+    client = MagicMock()
+    dispatcher = SlackDispatcher(sleep=clock.sleep, clock=clock)
+
+    for index in range(4):
+        dispatcher.call(client, 'chat_postMessage', 'C1', text=f"{index}")
+    dispatcher.call(client, 'chat_postMessage', 'C2', text="other")
+
+    # Two at once for the burst, then one a second. C2 has its own bucket:
+    assert clock.slept == [1.0, 1.0]
+    assert client.chat_postMessage.call_count == 5
+    client.chat_postMessage.assert_called_with(channel='C2', text='other')
+
+    stats = dispatcher.stats()
+    assert stats['calls'] == 5
+    assert stats['max_wait_seconds'] == 1.0
+    assert stats['queued'] == {}
+
+    found = metrics.render()
+    assert 'zenslackchat_slack_wait_seconds_count{method="chat_postMessage"} 5' in found
+    assert 'zenslackchat_slack_queued{method="chat_postMessage"} 0' in found
+
+
+def test_retry_after_is_honoured(clock, settings):
+    client = MagicMock()
+    client.chat_postMessage.side_effect = [
+        rate_limited(5), rate_limited(2), dict(ok=True, ts="1.2")
+    ]
+    dispatcher = SlackDispatcher(sleep=clock.sleep, clock=clock)
+
+    resp = dispatcher.call(
+        client, 'chat_postMessage', 'C1', thread_ts="1.1", text="hi"
+    )
+
+    assert resp['ts'] == "1.2"
+    assert clock.slept == [5, 2]
+    assert dispatcher.stats()['rate_limited'] == 2
+    client.chat_postMessage.assert_called_with(
+        channel='C1', thread_ts="1.1", text="hi"
+    )
+
+    # Other processes are told to hold off the channel too:
+    assert SlackDispatcher().shared_pause('C1') > 0
+
+    # Give up once the retries are used up:
+    settings.SLACK_RATE_RETRIES = 1
+    client.chat_postMessage.side_effect = rate_limited(1)
+    with pytest.raises(SlackApiError):
+        dispatcher.call(client, 'chat_postMessage', 'C2', text="hi")
+    assert client.chat_postMessage.call_count == 5
+
+
+def test_other_errors_are_not_retried(clock):
+    client = MagicMock()
+    client.chat_postMessage.side_effect = SlackApiError(
+        "channel_not_found", MagicMock(status_code=200, headers={})
+    )
+    dispatcher = SlackDispatcher(sleep=clock.sleep, clock=clock)
+
+    with pytest.raises(SlackApiError):
+        dispatcher.call(client, 'chat_postMessage', 'C1', text="hi")
+
+    assert client.chat_postMessage.call_count == 1
+    assert dispatcher.stats()['queued'] == {}
+
+
+def test_thread_order_is_kept():
+    """A later reply waits for the one before it in the same thread."""
+    first_started = threading.Event()
+    release_first = threading.Event()
+    sent = []
+
+    def post(channel, text, thread_ts=None):
+        if text == "first":
+            first_started.set()
+            release_first.wait(5)
+        sent.append(text)
+
+    client = MagicMock()
+    client.chat_postMessage.side_effect = post
+    dispatcher = SlackDispatcher()
+
+    def send(text, thread_ts):
+        dispatcher.call(
+            client, 'chat_postMessage', 'C1', thread_ts=thread_ts, text=text
+        )
+
+    first = threading.Thread(target=send, args=("first", "1.1"))
+    first.start()
+    first_started.wait(5)
+    second = threading.Thread(target=send, args=("second", "1.1"))
+    second.start()
+    for _ in range(500):
+        if dispatcher.stats()['queued'] == {'C1': 2}:
+            break
+        time.sleep(0.01)
+
+    # Another thread isn't held up:
+    send("elsewhere", "2.2")
+    assert dispatcher.stats()['queued'] == {'C1': 2}
+
+    release_first.set()
+    first.join(5)
+    second.join(5)
+    assert sent == ["elsewhere", "first", "second"]
+    assert dispatcher.stats()['queued'] == {}
+
+
+def test_fake_slack_is_not_rate_limited(settings):
+    """Against the load test's fake Slack nothing gets a 429."""
+    settings.SLACK_RATE_LIMITS = True
+    settings.SLACK_CHANNEL_RATE = 10
+    settings.SLACK_CHANNEL_BURST = 1
+    slack = FakeSlack(Behaviour(rate_limit=20, burst=1, retry_after=1))
+    server = slack.serve(port=0)
+    url = f"http://127.0.0.1:{server.server_address[1]}"
+    try:
+        client = WebClient(token='xoxb-fake', base_url=f"{url}/api/")
+        dispatcher = SlackDispatcher()
+        for index in range(5):
+            dispatcher.call(
+                client, 'chat_postMessage', 'C1', text=f"message {index}"
+            )
+
+        stats = requests.get(f"{url}/_stats").json()
+        assert stats['calls']['POST /api/chat.postMessage'] == 5
+        assert stats['throttled'] == 0
+
+    finally:
+        server.shutdown()
+        server.server_close()
@@ -41,6 +41,13 @@ def test_slack_url_to_chat_id(log):
     result = slack_api.url_to_chat_id(url)
     assert result == chat_id
 
+    # Whitespace only parts are ignored:
+    assert slack_api.url_to_chat_id('  ') == '  '
+    assert slack_api.url_to_chat_id('x/ ') == '.x'
+    assert slack_api.url_to_chat_id(
+        ' https://example.com/C018JUAGGTS/p1597935682010800/ '
+    ) == '1597935682.010800'
+
 
 def test_post_message(log):
     """Verify the URL generated to point at (UI not API) ticket in zendesk.
@@ -0,0 +1,137 @@
+from unittest.mock import MagicMock
+from unittest.mock import patch
+
+import pytest
+from django.contrib.auth.models import Permission
+
+from zenslackchat import tracing
+from zenslackchat.message import handler
+
+
+@pytest.fixture(autouse=True)
+def no_traces():
+    tracing.traces.clear()
+    yield
+    tracing.traces.clear()
+
+
+def handle_new_message():
+    slack_client = MagicMock()
+    slack_client.users_info.return_value = MagicMock(data=dict(
+        user=dict(real_name="Bob Sprocket", profile=dict(email="bob@example.com"))
+    ))
+    zendesk_client = MagicMock()
+    zendesk_client.tickets.create.return_value = MagicMock(
+        ticket=MagicMock(id=1430)
+    )
+    event = dict(
+        type="message", channel="C019JUGAGTS", user="UGF7MRWMS",
+        text="My 🖨 is on 🔥", ts="1608291472.001600",
+    )
+
+    with patch("zenslackchat.message.on_call_roster") as on_call_roster:
+        on_call_roster.return_value = dict(primary="Fred", secondary="Tony")
+        return handler(
+            event,
+            our_channel="C019JUGAGTS",
+            workspace_uri="https://s.l.a.c.k",
+            zendesk_uri="https://z.e.n.d.e.s.k",
+            slack_client=slack_client,
+            zendesk_client=zendesk_client,
+            user_id="100000000001",
+            group_id="200000000002",
+        )
+
+
+def test_nothing_is_recorded_when_disabled(settings, log, db):
+    settings.TRACING_ENABLED = False
+
+    assert tracing.span("anything") is tracing.NO_SPAN
+    assert tracing.trace("anything") is tracing.NO_SPAN
+    assert handle_new_message() is True
+    assert tracing.traces.recent() == []
+
+
+def test_handler_stages_are_traced(settings, log, db):
+    settings.TRACING_ENABLED = True
+
+    assert handle_new_message() is True
+
+    [trace] = tracing.traces.recent()
+    assert trace.name == "message.handler"
+    assert trace.attrs["chat_id"] == "1608291472.001600"
+    names = [span.name for _, span in trace.walk()]
+    assert names[:6] == [
+        "message.handler",
+        "user_profile",
+        "slack.users_info",
+        "db.ZenSlackChat.get",
+        "zendesk.create_ticket",
+        "db.ZenSlackChat.open",
+    ]
+    assert "slack.chat_postMessage" in names
+    assert "out_of_hours.inform" in names
+
+    # Spans are in the order they started and fit inside their parent:
+    spans = [span for _, span in trace.walk()]
+    for span in spans[1:]:
+        assert span.offset >= 0
+        assert span.duration <= trace.duration
+
+    # Outside the handler there is no trace to add to:
+    assert tracing.span("slack.users_info") is tracing.NO_SPAN
+
+
+def test_errors_are_recorded(settings):
+    settings.TRACING_ENABLED = True
+
+    with pytest.raises(ValueError):
+        with tracing.trace("outer"):
+            with tracing.span("inner", ticket_id=1):
+                raise ValueError("boom")
+
+    [trace] = tracing.traces.recent()
+    inner = trace.children[0]
+    assert inner.error == "ValueError: boom"
+    assert inner.attrs == dict(ticket_id=1)
+    assert trace.as_dict()["children"][0]["error"] == "ValueError: boom"
+    assert trace.summary().startswith("outer=")
+
+
+def test_only_recent_traces_are_kept(settings):
+    settings.TRACING_ENABLED = True
+    settings.TRACE_BUFFER_SIZE = 3
+
+    for index in range(5):
+        with tracing.trace(f"trace-{index}"):
+            pass
+
+    assert [trace.name for trace in tracing.traces.recent()] == [
+        "trace-4", "trace-3", "trace-2"
+    ]
+
+
+def test_admin_traces_view(settings, admin_client, log, db):
+    settings.TRACING_ENABLED = True
+    handle_new_message()
+
+    resp = admin_client.get("/admin/zenslackchat/zenslackchat/traces/")
+    assert resp.status_code == 200
+    assert b"zendesk.create_ticket" in resp.content
+
+
+def test_admin_traces_need_the_view_permission(client, django_user_model, db):
+    user = django_user_model.objects.create_user(
+        "staff", password="secret", is_staff=True
+    )
+    client.force_login(user)
+    assert client.get(
+        "/admin/zenslackchat/zenslackchat/traces/"
+    ).status_code == 403
+
+    user.user_permissions.add(
+        Permission.objects.get(codename="view_zenslackchat")
+    )
+    assert client.get(
+        "/admin/zenslackchat/zenslackchat/traces/"
+    ).status_code == 200
@@ -0,0 +1,159 @@
+from unittest.mock import MagicMock
+from unittest.mock import patch
+
+from rest_framework.test import APIRequestFactory
+
+from zenslackchat import eventsview
+from zenslackchat.user_cache import UserProfileCache
+from zenslackchat.user_cache import profiles
+
+
+class FakeUserResponse(object):
+    def __init__(self, real_name="Bob Sprocket", email="bob@example.com"):
+        self.data = dict(
+            user=dict(
+                id="UGF7MRWMS",
+                real_name=real_name,
+                profile=dict(email=email, image_72="https://...")
+            )
+        )
+
+
+def test_profile_is_only_recovered_once(settings):
+    """Test repeat lookups are served from the cache.
+    """
+    settings.SLACK_USER_CACHE_SHARED = False
+    cache = UserProfileCache()
+    slack_client = MagicMock()
+    slack_client.users_info.return_value = FakeUserResponse()
+
+    expected = dict(real_name="Bob Sprocket", profile=dict(email="bob@example.com"))
+    assert cache.get(slack_client, "UGF7MRWMS") == expected
+    assert cache.get(slack_client, "UGF7MRWMS") == expected
+    slack_client.users_info.assert_called_once_with(user="UGF7MRWMS")
+    assert cache.stats() == dict(size=1, hits=1, shared_hits=0, misses=1)
+
+
+def test_profile_expires(settings):
+    """Test an entry older than the TTL is recovered from slack again.
+    """
+    settings.SLACK_USER_CACHE_SHARED = False
+    settings.SLACK_USER_CACHE_TTL = 60
+    cache = UserProfileCache()
+    slack_client = MagicMock()
+    slack_client.users_info.return_value = FakeUserResponse()
+
+    with patch('zenslackchat.user_cache.time') as time:
+        time.monotonic.return_value = 1000
+        cache.get(slack_client, "UGF7MRWMS")
+        time.monotonic.return_value = 1059
+        cache.get(slack_client, "UGF7MRWMS")
+        assert slack_client.users_info.call_count == 1
+        time.monotonic.return_value = 1061
+        cache.get(slack_client, "UGF7MRWMS")
+        assert slack_client.users_info.call_count == 2
+
+
+def test_least_recently_used_is_dropped(settings):
+    """Test the cache never holds more than SLACK_USER_CACHE_SIZE entries.
+    """
+    settings.SLACK_USER_CACHE_SHARED = False
+    settings.SLACK_USER_CACHE_SIZE = 2
+    cache = UserProfileCache()
+    slack_client = MagicMock()
+    slack_client.users_info.return_value = FakeUserResponse()
+
+    cache.get(slack_client, "U1")
+    cache.get(slack_client, "U2")
+    # U1 is now the most recently used:
+    cache.get(slack_client, "U1")
+    cache.get(slack_client, "U3")
+    assert cache.stats()['size'] == 2
+
+    slack_client.users_info.reset_mock()
+    cache.get(slack_client, "U1")
+    slack_client.users_info.assert_not_called()
+    cache.get(slack_client, "U2")
+    slack_client.users_info.assert_called_once_with(user="U2")
+
+
+def test_shared_tier_is_used_by_other_processes(settings):
+    """Test a profile another process recovered is found in the shared cache.
+    """
+    settings.SLACK_USER_CACHE_SHARED = True
+    web = UserProfileCache()
+    worker = UserProfileCache()
+    slack_client = MagicMock()
+    slack_client.users_info.return_value = FakeUserResponse()
+
+    web.get(slack_client, "UGF7MRWMS")
+    worker.get(slack_client, "UGF7MRWMS")
+    slack_client.users_info.assert_called_once()
+    assert worker.stats()['shared_hits'] == 1
+
+    # Invalidation removes it from the shared tier as well:
+    web.invalidate("UGF7MRWMS")
+    UserProfileCache().get(slack_client, "UGF7MRWMS")
+    assert slack_client.users_info.call_count == 2
+
+
+def test_other_processes_drop_a_changed_user(settings):
+    """Test a user_change seen by the web process reaches the workers.
+    """
+    settings.SLACK_USER_CACHE_SHARED = False
+    settings.SLACK_USER_CACHE_CHECK_SECONDS = 10
+    web = UserProfileCache()
+    worker = UserProfileCache()
+    slack_client = MagicMock()
+    slack_client.users_info.return_value = FakeUserResponse()
+
+    with patch('zenslackchat.user_cache.time') as time:
+        time.monotonic.return_value = 1000
+        worker.get(slack_client, "UGF7MRWMS")
+
+        web.invalidate("UGF7MRWMS")
+        slack_client.users_info.return_value = FakeUserResponse(
+            real_name='Bob Cog'
+        )
+
+        # Until the worker next checks:
+        time.monotonic.return_value = 1009
+        assert worker.get(slack_client, "UGF7MRWMS")['real_name'] == 'Bob Sprocket'
+
+        time.monotonic.return_value = 1010
+        assert worker.get(slack_client, "UGF7MRWMS")['real_name'] == 'Bob Cog'
+        time.monotonic.return_value = 1030
+        assert worker.get(slack_client, "UGF7MRWMS")['real_name'] == 'Bob Cog'
+        assert slack_client.users_info.call_count == 2
+
+
+def test_user_change_event_invalidates_profile(settings):
+    """Test Slack's user_change event drops the cached profile.
+    """
+    settings.SLACK_USER_CACHE_SHARED = False
+    settings.SLACK_VERIFICATION_TOKEN = 'the-token'
+    slack_client = MagicMock()
+    slack_client.users_info.return_value = FakeUserResponse()
+    profiles.get(slack_client, "UGF7MRWMS")
+
+    factory = APIRequestFactory()
+    request = factory.post(
+        '/slack/events/',
+        dict(
+            token='the-token',
+            event_id='Ev03',
+            event=dict(
+                type='user_change',
+                user=FakeUserResponse(real_name='Bob Cog').data['user']
+            )
+        ),
+        format='json'
+    )
+    with patch('zenslackchat.eventsview.handler') as handler:
+        response = eventsview.Events.as_view()(request)
+
+    assert response.status_code == 200
+    handler.assert_not_called()
+
+    slack_client.users_info.return_value = FakeUserResponse(real_name='Bob Cog')
+    assert profiles.get(slack_client, "UGF7MRWMS")['real_name'] == 'Bob Cog'
@@ -0,0 +1,155 @@
+from unittest.mock import MagicMock
+
+import pytest
+from zenpy import Zenpy
+
+from loadtest.fakes import Behaviour
+from loadtest.fakes import FakeZendesk
+from zenslackchat import metrics
+from zenslackchat import zendesk_api
+from zenslackchat.zendesk_budget import BACKGROUND
+from zenslackchat.zendesk_budget import budget
+from zenslackchat.zendesk_budget import BudgetAdapter
+from zenslackchat.zendesk_budget import CREATE
+from zenslackchat.zendesk_budget import current_priority
+from zenslackchat.zendesk_budget import INTERACTIVE
+from zenslackchat.zendesk_budget import priority
+from zenslackchat.zendesk_budget import RateBudget
+
+
+class Clock(object):
+    """Time that only passes when something sleeps."""
+    def __init__(self):
+        self.now = 1_700_000_000.0
+        self.slept = []
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.slept.append(seconds)
+        self.now += seconds
+
+
+def response(status_code=200, **headers):
+    return MagicMock(status_code=status_code, headers=headers)
+
+
+@pytest.fixture
+def clock(settings):
+    settings.ZENDESK_RESERVE_INTERACTIVE = 0.1
+    settings.ZENDESK_RESERVE_BACKGROUND = 0.3
+    settings.ZENDESK_BUDGET_MAX_WAIT = 30
+    settings.ZENDESK_BUDGET_POLL = 1
+    return Clock()
+
+
+def test_priority_context():
+    assert current_priority() == INTERACTIVE
+
+    @priority(CREATE)
+    def inner():
+        return current_priority()
+
+    with priority(BACKGROUND):
+        assert current_priority() == BACKGROUND
+        assert inner() == CREATE
+        assert current_priority() == BACKGROUND
+
+    assert current_priority() == INTERACTIVE
+
+
+def test_ticket_creation_keeps_going_when_syncs_wait(clock):
+    budget = RateBudget(sleep=clock.sleep, clock=clock)
+
+    # Nothing is known until Zendesk has answered:
+    assert budget.admit(BACKGROUND) == 0
+
+    budget.record(response(**{
+        'X-Rate-Limit': '100', 'X-Rate-Limit-Remaining': '31'
+    }))
+    assert budget.remaining() == (31, 100)
+
+    # Background syncs leave the last 30 calls:
+    assert budget.take(BACKGROUND) == 0
+    assert budget.take(BACKGROUND) == 1
+    assert budget.remaining() == (30, 100)
+
+    # Other calls leave the last 10 and ticket creation can use them all:
+    for _ in range(20):
+        assert budget.take(INTERACTIVE) == 0
+    assert budget.take(INTERACTIVE) == 1
+    for _ in range(10):
+        assert budget.take(CREATE) == 0
+    assert budget.take(CREATE) == 1
+
+
+def test_waiting_is_limited(clock, settings):
+    settings.ZENDESK_BUDGET_MAX_WAIT = 5
+    budget = RateBudget(sleep=clock.sleep, clock=clock)
+    budget.record(response(**{
+        'X-Rate-Limit': '100', 'X-Rate-Limit-Remaining': '0'
+    }))
+
+    # Wait for the minute to reset, but not forever:
+    assert budget.admit(BACKGROUND) == 5
+    assert clock.slept == [1, 1, 1, 1, 1]
+
+    found = metrics.render()
+    assert (
+        'zenslackchat_zendesk_budget_wait_seconds_count'
+        '{priority="background"} 1'
+    ) in found
+    assert 'zenslackchat_zendesk_rate{kind="limit"} 100' in found
+
+
+def test_429_holds_off_everyone(clock):
+    budget = RateBudget(sleep=clock.sleep, clock=clock)
+    budget.record(response(429, **{'Retry-After': '7'}))
+
+    assert RateBudget(clock=clock).take(CREATE) == 7
+    assert budget.admit(CREATE) == 7
+    assert clock.slept == [7]
+    assert 'zenslackchat_zendesk_rate_limited_total{priority="interactive"} 1' in (
+        metrics.render()
+    )
+
+
+def test_create_ticket_is_made_at_create_priority(log):
+    client = MagicMock()
+    seen = []
+    client.tickets.create.side_effect = lambda ticket: seen.append(
+        current_priority()
+    ) or MagicMock()
+
+    zendesk_api.create_ticket(
+        client, "1.1", "1", "2", "bob@example.com", "help", "https://s"
+    )
+
+    assert seen == [CREATE]
+
+
+def test_zenpy_requests_use_the_budget(monkeypatch, settings):
+    """The adapter admits and records each request Zenpy makes."""
+    settings.ZENDESK_BUDGET = True
+    zendesk = FakeZendesk(Behaviour())
+    server = zendesk.serve(port=0)
+    monkeypatch.setenv("ZENPY_FORCE_SCHEME", "http")
+    monkeypatch.setenv(
+        "ZENPY_FORCE_NETLOC", f"127.0.0.1:{server.server_address[1]}"
+    )
+    admitted = []
+    monkeypatch.setattr(budget, "admit", lambda: admitted.append(1))
+    recorded = []
+    monkeypatch.setattr(budget, "record", recorded.append)
+    try:
+        client = Zenpy(subdomain="fake", oauth_token="x")
+        client.users.session.mount("http://", BudgetAdapter())
+        client.users.me()
+
+        assert admitted == [1]
+        assert recorded[0].status_code == 200
+
+    finally:
+        server.shutdown()
+        server.server_close()
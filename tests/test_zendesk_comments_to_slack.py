@@ -1,68 +1,158 @@
 from unittest.mock import patch
 from unittest.mock import MagicMock
 
-import pytest
-
+from zenslackchat.models import ZenSlackChat
+from zenslackchat.message_tools import strip
+from zenslackchat.message_tools import message_hash
 from zenslackchat.message_tools import messages_for_slack
+from zenslackchat.zendesk_api import comments_since
 from zenslackchat.zendesk_comments_to_slack import comments_from_zendesk
 
 
-class FakeZenSlackChatIssue(object):
-    def __init__(self, ticket_id, chat_id, channel_id):
-        self.ticket_id = ticket_id
-        self.chat_id = chat_id
-        self.channel_id = channel_id
+class FakeComment(object):
+    def __init__(self, id, body, channel='web'):
+        self.id = id
+        self.body = body
+        self.channel = channel
+
+    def to_dict(self):
+        return dict(id=self.id, body=self.body, via=dict(channel=self.channel))
+
+
+def slack_replies(*messages):
+    resp = MagicMock()
+    resp.data = {
+        'messages': [dict(ts=ts, text=text) for ts, text in messages]
+    }
+    return resp
 
 
 @patch('zenslackchat.zendesk_comments_to_slack.post_message')
-@patch('zenslackchat.zendesk_comments_to_slack.ZenSlackChat')
-@patch('zenslackchat.zendesk_comments_to_slack.messages_for_slack')
-def test_comments_to_slack(
-    messages_for_slack,
-    ZenSlackChat,
-    post_message,
-    log,
-    db
-):
+def test_comments_to_slack(post_message, log, db):
     """Verify when a message gets posted to slack.
     """
+    issue = ZenSlackChat.open(
+        'slack-channel-id', '1608291472.001600', ticket_id='1430'
+    )
     zendesk_client = MagicMock()
-    zendesk_client.tickets.comments.return_value = []
-
     slack_client = MagicMock()
-    slack_client.conversation_replies.return_value = []
-    messages_for_slack.return_value = []
-
-    ZenSlackChat.get_by_ticket.return_value = FakeZenSlackChatIssue(
-        ticket_id='1430',
-        chat_id='slack-chat-id',
-        channel_id='slack-channel-id'
-    )
 
     event = {
         'token': 'the-correct-token',
-        'chat_id': 'slack-chat-id',
+        'chat_id': '1608291472.001600',
         'ticket_id': '1430',
     }
 
     # No messages to compare or post
+    zendesk_client.tickets.comments.return_value = []
+    slack_client.conversations_replies.return_value = slack_replies()
     assert comments_from_zendesk(event, slack_client, zendesk_client) == []
-    messages_for_slack.assert_called_with([], [])
     post_message.assert_not_called()
 
-    # One message for posting to slack
-    messages_for_slack.return_value = [dict(body='hello world')]
+    # First sync recovers everything:
+    post_message.return_value = dict(ts='1608291480.001800')
+    zendesk_client.tickets.comments.return_value = [
+        FakeComment(100, 'This is the message on slack', channel='api'),
+        FakeComment(101, 'hello world'),
+    ]
+    slack_client.conversations_replies.return_value = slack_replies(
+        ('1608291472.001600', 'new issue'),
+        ('1608291475.001700', 'Hello, your new support request is ...'),
+    )
     assert comments_from_zendesk(event, slack_client, zendesk_client) == [
-        dict(body='hello world')
+        dict(id=101, body='hello world', via=dict(channel='web'))
     ]
-    messages_for_slack.assert_called_with([], [])
-    post_message.assert_called_with(
+    slack_client.conversations_replies.assert_called_with(
+        channel='slack-channel-id', ts='1608291472.001600'
+    )
+    post_message.assert_called_once_with(
         slack_client,
-        'slack-chat-id',
+        '1608291472.001600',
         'slack-channel-id',
         '(Zendesk): hello world'
     )
 
+    issue.refresh_from_db()
+    assert issue.zendesk_cursor == 101
+    assert issue.slack_cursor == '1608291475.001700'
+    assert issue.hash_index() == (
+        {
+            message_hash('new issue'),
+            message_hash('Hello, your new support request is ...'),
+            message_hash('(Zendesk): hello world'),
+        },
+        {'1608291472.001600', '1608291475.001700', '1608291480.001800'},
+    )
+
+    # Only what is new since is recovered from now on:
+    post_message.reset_mock()
+    post_message.return_value = dict(ts='1608291490.001900')
+    zendesk_client.tickets._get.return_value = iter([
+        FakeComment(103, 'hello world'),
+        FakeComment(102, 'second comment'),
+        FakeComment(101, 'hello world'),
+        FakeComment(100, 'This is the message on slack', channel='api'),
+    ])
+    slack_client.conversations_replies.return_value = slack_replies(
+        ('1608291472.001600', 'new issue'),
+        ('1608291480.001800', '(Zendesk): hello world'),
+        ('1608291485.001850', 'a reply on slack'),
+    )
+    with patch(
+        'zenslackchat.message_tools.strip', wraps=strip
+    ) as normalized:
+        assert comments_from_zendesk(
+            event, slack_client, zendesk_client
+        ) == [
+            dict(id=102, body='second comment', via=dict(channel='web'))
+        ]
+    # The mirrored reply isn't normalized again, only the new one is:
+    texts = [c.args[0] for c in normalized.call_args_list]
+    assert 'a reply on slack' in texts
+    assert '(Zendesk): hello world' not in texts
+    slack_client.conversations_replies.assert_called_with(
+        channel='slack-channel-id', ts='1608291472.001600',
+        oldest='1608291475.001700'
+    )
+    post_message.assert_called_once_with(
+        slack_client,
+        '1608291472.001600',
+        'slack-channel-id',
+        '(Zendesk): second comment'
+    )
+
+    issue.refresh_from_db()
+    assert issue.zendesk_cursor == 103
+    assert issue.slack_cursor == '1608291485.001850'
+
+
+def test_comments_since():
+    """Verify only the comments after the cursor are recovered.
+    """
+    client = MagicMock()
+
+    # No cursor, recover everything:
+    client.tickets.comments.return_value = iter([FakeComment(1, 'a')])
+    assert [c.id for c in comments_since(client, '1430')] == [1]
+    client.tickets.comments.assert_called_with(ticket='1430')
+
+    # Newest first, stop at the cursor:
+    pages = [FakeComment(i, 'x') for i in range(10, 0, -1)]
+    client.tickets._get.return_value = iter(pages)
+    assert [c.id for c in comments_since(client, '1430', 7)] == [8, 9, 10]
+    # Nothing older than the cursor was recovered:
+    assert next(client.tickets._get.return_value).id == 6
+
+    # Zendesk ignored the sort order, nothing is missed:
+    pages = [FakeComment(i, 'x') for i in range(1, 11)]
+    client.tickets._get.return_value = iter(pages)
+    assert [c.id for c in comments_since(client, '1430', 7)] == [8, 9, 10]
+
+    # No new comments:
+    pages = [FakeComment(i, 'x') for i in range(7, 0, -1)]
+    client.tickets._get.return_value = iter(pages)
+    assert comments_since(client, '1430', 7) == []
+
 
 def test_normal_issue_flow(log):
     """Walk through the message comparrison for slack created issue.
@@ -10,7 +10,8 @@ from zenslackchat.message import (
     message_who_is_on_call,
 )
 from zenslackchat.message_tools import message_issue_zendesk_url
-from zenslackchat.models import PagerDutyApp, ZendeskApp, ZenSlackChat
+from zenslackchat.models import ZendeskApp, ZenSlackChat
+from zenslackchat.zendesk_budget import CREATE, current_priority
 from zenslackchat.zendesk_email_to_slack import email_from_zendesk
 
 
@@ -33,11 +34,9 @@ class FakeUserResponse(object):
 @patch("zenslackchat.zendesk_email_to_slack.add_comment")
 @patch("zenslackchat.zendesk_email_to_slack.message_issue_zendesk_url")
 @patch("zenslackchat.zendesk_email_to_slack.message_who_is_on_call")
-@patch("zenslackchat.zendesk_email_to_slack.SlackApp")
-@patch("zenslackchat.zendesk_email_to_slack.ZendeskApp")
+@patch("zenslackchat.zendesk_email_to_slack.on_call_roster")
 def test_email_from_zendesk_is_added_for_tracking(
-    ZendeskApp,
-    SlackApp,
+    on_call_roster,
     message_who_is_on_call,
     message_issue_zendesk_url,
     add_comment,
@@ -55,7 +54,6 @@ def test_email_from_zendesk_is_added_for_tracking(
 
     slack_client.users_info.return_value = FakeUserResponse()
     slack_client.chat_postMessage.return_value = {"message": {"ts": chat_id}}
-    SlackApp.client.return_value = slack_client
 
     # Return out fake ticket when asked to create:
     ticket = FakeTicket(
@@ -63,14 +61,17 @@ def test_email_from_zendesk_is_added_for_tracking(
         subject="My printer is on 🔥",
         description="I was smoking next to it and it just went up.",
     )
-    get_ticket.return_value = ticket
+    # Recovering the ticket is part of setting up the issue:
+    priorities = []
+    get_ticket.side_effect = lambda *args: (
+        priorities.append(current_priority()) or ticket
+    )
 
     # Return out fake ticket when asked to create:
     class ZendeskMe:
         id = "zendesk-user-id"
 
     zendesk_client.users.me.return_value = ZendeskMe()
-    ZendeskApp.client.return_value = zendesk_client
 
     # There should be no entries here yet:
     assert ZenSlackChat.objects.count() == 0
@@ -94,10 +95,13 @@ def test_email_from_zendesk_is_added_for_tracking(
         ZENDESK_GROUP_ID="7890",
         ZENDESK_TICKET_URI="https://z.e.n.d.e.s.k",
         SLACK_WORKSPACE_URI="https://s.l.a.c.k",
+        USE_ATLASSIAN=False,
     )
     with patch.dict("webapp.settings.__dict__", settings, clear=True):
         email_from_zendesk(event, slack_client, zendesk_client)
 
+    assert priorities == [CREATE]
+
     # There should now be one instance here:
     assert ZenSlackChat.objects.count() == 1
     assert len(ZenSlackChat.open_issues()) == 1
@@ -109,17 +113,16 @@ def test_email_from_zendesk_is_added_for_tracking(
     assert issue.closed is None
     assert issue.channel_id == "C024JUTACTS"
     assert issue.chat_id == "1597940362.013100"
-    assert issue.ticket_id == "32"
+    assert issue.ticket_id == 32
 
     # Check the args to the call that would post a message:
     message_issue_zendesk_url.assert_called_with(
         slack_client, "https://z.e.n.d.e.s.k", "32", "1597940362.013100", "C024JUTACTS"
     )
 
-    app_token = PagerDutyApp.client()
-    # No pager duty configured so no message about this:
+    # Who is on call is posted on the new thread:
     message_who_is_on_call.assert_called_with(
-        PagerDutyApp.on_call(app_token=app_token),
+        on_call_roster.return_value,
         slack_client,
         "1597940362.013100",
         "C024JUTACTS",
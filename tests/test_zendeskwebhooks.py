@@ -142,13 +142,10 @@ def test_zendesk_webhook_events_ok_path(
     SlackApp.client = MagicMock()
     slack_client = MockClient('slack')
     SlackApp.client.return_value = slack_client
-    # test my understanding of who this should work
-    assert SlackApp.client() == slack_client
 
     ZendeskApp.client = MagicMock()
     zendesk_client = MockClient('zendesk')
     ZendeskApp.client.return_value = zendesk_client
-    assert ZendeskApp.client() == zendesk_client
     with patch(patch_path) as expected_function_call:    
         with patch.dict('webapp.settings.__dict__', env):    
             view = WebHookView.as_view()
@@ -161,10 +158,13 @@ def test_zendesk_webhook_events_ok_path(
             response = view(request)
 
     assert response.status_code == 200
+    event, lazy_slack, lazy_zendesk = expected_function_call.call_args[0]
+    assert event == zendesk_event
+
+    # The clients are only built when the handler first uses them:
+    SlackApp.client.assert_not_called()
+    ZendeskApp.client.assert_not_called()
+    assert lazy_slack.resolve() == slack_client
+    assert lazy_zendesk.resolve() == zendesk_client
     SlackApp.client.assert_called()
-    ZendeskApp.client.assert_called()
-    expected_function_call.assert_called_with(
-        zendesk_event,
-        slack_client,
-        zendesk_client
-    )
\ No newline at end of file
+    ZendeskApp.client.assert_called()
\ No newline at end of file
@@ -0,0 +1,22 @@
+"""
+ASGI config for webapp project.
+
+It exposes the ASGI callable as a module-level variable named ``application``.
+Under ASGI the Slack events and Zendesk webhooks are served by the async views
+in zenslackchat.async_views.
+
+For more information on this file, see
+https://docs.djangoproject.com/en/4.2/howto/deployment/asgi/
+"""
+import os
+
+from django.contrib.staticfiles.handlers import ASGIStaticFilesHandler
+from django.core.asgi import get_asgi_application
+
+from zenslackchat import botlogging
+
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'webapp.settings')
+os.environ['SERVE_ASGI'] = '1'
+botlogging.log_setup()
+application = ASGIStaticFilesHandler(get_asgi_application())
@@ -2,6 +2,8 @@ import os
 
 from celery import Celery
 from celery.schedules import crontab
+from celery.signals import task_postrun
+from celery.signals import task_prerun
 
 from zenslackchat import botlogging
 
@@ -22,7 +24,8 @@ app.conf.worker_hijack_root_logger = False
 
 @app.on_after_configure.connect
 def setup_periodic_tasks(sender, **kwargs):
-    """Set up the daily report.
+    """Set up the daily report, nightly archiving and keep who is on call up
+    to date.
     """
     sender.add_periodic_task(
         # 9:00am Monday to Friday
@@ -30,23 +33,95 @@ def setup_periodic_tasks(sender, **kwargs):
         run_daily_summary,
     )
 
+    sender.add_periodic_task(
+        # 3:00am every day
+        crontab(hour=3, minute=0),
+        archive_conversations,
+    )
+
+    from webapp import settings
+
+    sender.add_periodic_task(
+        settings.ONCALL_ROSTER_PREWARM_SECONDS,
+        prewarm_on_call_roster,
+    )
+
+
+# The QueryCounter for each running task by task id:
+_query_counters = {}
+
+
+@task_prerun.connect
+def count_task_queries(task_id=None, task=None, **kwargs):
+    """Count the database queries each task makes (see zenslackchat.metrics).
+    """
+    from zenslackchat.metrics import QueryCounter
+
+    counter = QueryCounter(f"task:{task.name}")
+    _query_counters[task_id] = counter
+    counter.start()
+
+
+@task_postrun.connect
+def record_task_queries(task_id=None, **kwargs):
+    counter = _query_counters.pop(task_id, None)
+    if counter:
+        counter.stop()
+
 
 @app.task(ignore_result=True)
 def run_daily_summary():
     """Generate and send the daily summary report to slack.
+
+    A long report is continued in the thread of its first message.
+
     """
     from webapp import settings
     from zenslackchat.models import SlackApp
     from zenslackchat.models import ZenSlackChat
+    from zenslackchat.slack_api import create_thread
+    from zenslackchat.slack_api import post_message
 
     channel_id = settings.SRE_SUPPORT_CHANNEL
     workspace_uri = settings.SLACK_WORKSPACE_URI
 
     report_data = ZenSlackChat.daily_summary(workspace_uri)
-    text = ZenSlackChat.daily_report(report_data)
+    messages = ZenSlackChat.daily_report_messages(report_data)
 
     client = SlackApp.client()
-    client.chat_postMessage(channel=channel_id, text=text)
+    chat_id = create_thread(client, channel_id, next(messages))
+    for message in messages:
+        post_message(client, chat_id, channel_id, message)
+
+
+@app.task(ignore_result=True)
+def archive_conversations():
+    """Move the conversations resolved long ago out of the ZenSlackChat table.
+    """
+    from zenslackchat.archive import archive
+
+    archive()
+
+
+@app.task(ignore_result=True)
+def prewarm_on_call_roster():
+    """Recover who is on call so new issues don't wait for PagerDuty.
+    """
+    from zenslackchat.oncall import on_call_roster
+
+    on_call_roster(refresh=True)
+
+
+@app.task(ignore_result=True, acks_late=True)
+def process_slack_event(event):
+    """Run the message handler for a slack event the Events view queued.
+
+    This is sent to the 'slack-events-<N>' queue for the event's thread. See
+    zenslackchat.eventsview.event_queue.
+    """
+    from zenslackchat.eventsview import process_event
+
+    process_event(event)
 
 
 # Set up healthcheck.
@@ -1,6 +1,31 @@
 # -*- coding: utf-8 -*-
+import hmac
+
+from django.conf import settings
 from django.http import HttpResponse
 
+from zenslackchat.metrics import render
+
 
 def healthcheck_status(request):
     return HttpResponse("OK")
+
+
+def metrics_status(request):
+    """The bot's counters and latencies in the Prometheus text format.
+
+    Not found unless METRICS_TOKEN is set, and then the scraper must send it
+    as a bearer token.
+
+    """
+    if not settings.METRICS_TOKEN:
+        return HttpResponse(status=404)
+
+    expected = f"Bearer {settings.METRICS_TOKEN}"
+    given = request.headers.get("Authorization", "")
+    if not hmac.compare_digest(given.encode(), expected.encode()):
+        return HttpResponse(status=403)
+
+    return HttpResponse(
+        render(), content_type="text/plain; version=0.0.4; charset=utf-8"
+    )
@@ -78,6 +78,11 @@ SLACK_WORKSPACE_URI = os.environ.get(
 )
 
 
+# The Slack Web API the bot talks to. Point this at the fake service in
+# loadtest/ when load testing.
+SLACK_API_URL = os.environ.get("SLACK_API_URL", "https://www.slack.com/api/")
+
+
 # The channel events we listen for and ignore all other events.
 SRE_SUPPORT_CHANNEL = os.environ.get("SRE_SUPPORT_CHANNEL", "YOUR SUPPORT CHANNEL ID")
 
@@ -136,6 +141,25 @@ PAGERDUTY_REDIRECT_URI = os.environ.get(
 PAGERDUTY_ESCALATION_POLICY_ID = os.environ.get(
     "PAGERDUTY_ESCALATION_POLICY_ID", "PagerDuty Policy ID"
 )
+# The PagerDuty REST API. Point this at the fake service in loadtest/ when load
+# testing.
+PAGERDUTY_API_URL = os.environ.get("PAGERDUTY_API_URL", "https://api.pagerduty.com")
+# The PagerDuty token is reused until this many seconds before it expires. A
+# replacement is requested in the background REFRESH_AHEAD seconds before that.
+PAGERDUTY_TOKEN_EXPIRY_MARGIN = int(
+    os.environ.get("PAGERDUTY_TOKEN_EXPIRY_MARGIN", "60")
+)
+PAGERDUTY_TOKEN_REFRESH_AHEAD = int(
+    os.environ.get("PAGERDUTY_TOKEN_REFRESH_AHEAD", "300")
+)
+
+# Who is on call is cached until the next hand over, but no longer than this
+# many seconds as the rota can be changed by hand. The celery beat refreshes
+# it every ONCALL_ROSTER_PREWARM_SECONDS.
+ONCALL_ROSTER_MAX_AGE = int(os.environ.get("ONCALL_ROSTER_MAX_AGE", "3600"))
+ONCALL_ROSTER_PREWARM_SECONDS = int(
+    os.environ.get("ONCALL_ROSTER_PREWARM_SECONDS", "900")
+)
 
 # Used to work out our external URI for redirects. Also used as the entry in
 # ALLOWED_HOSTS.
@@ -166,6 +190,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    "zenslackchat.metrics.QueryCountMiddleware",
     "django.middleware.security.SecurityMiddleware",
     "whitenoise.middleware.WhiteNoiseMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
@@ -176,6 +201,13 @@ MIDDLEWARE = [
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
 ]
 
+# Set by webapp/asgi.py. WhiteNoise can only run synchronously, which would
+# put every request through one thread, so under ASGI the static files are
+# served by django's ASGIStaticFilesHandler instead.
+SERVE_ASGI = os.environ.get("SERVE_ASGI", "0").strip() == "1"
+if SERVE_ASGI:
+    MIDDLEWARE.remove("whitenoise.middleware.WhiteNoiseMiddleware")
+
 ROOT_URLCONF = "webapp.urls"
 
 TEMPLATES = [
@@ -266,6 +298,37 @@ else:
     REDIS_URL = os.environ["REDIS_URL"]
     REDIS_CELERY_URL = REDIS_URL
 
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.redis.RedisCache",
+        "LOCATION": REDIS_URL,
+        "KEY_PREFIX": "zenslackchat",
+    }
+}
+
+# How often (seconds) each process checks whether a new Slack or Zendesk OAuth
+# token was saved and its cached clients need to be rebuilt.
+CLIENT_REGISTRY_CHECK_SECONDS = int(
+    os.environ.get("CLIENT_REGISTRY_CHECK_SECONDS", "30")
+)
+
+# Slack users_info results kept per process, and for how long (seconds). Set
+# SLACK_USER_CACHE_SHARED=1 to also share them between processes in redis.
+# Each process checks a user it holds has had no user_change event at most
+# every SLACK_USER_CACHE_CHECK_SECONDS.
+SLACK_USER_CACHE_SIZE = int(os.environ.get("SLACK_USER_CACHE_SIZE", "512"))
+SLACK_USER_CACHE_TTL = int(os.environ.get("SLACK_USER_CACHE_TTL", "3600"))
+SLACK_USER_CACHE_CHECK_SECONDS = int(
+    os.environ.get("SLACK_USER_CACHE_CHECK_SECONDS", "10")
+)
+SLACK_USER_CACHE_SHARED = (
+    os.environ.get("SLACK_USER_CACHE_SHARED", "0").strip() == "1"
+)
+
+# How long (seconds) to remember Slack event_ids so retries are ignored. Slack
+# retries a failed event three times over roughly an hour.
+SLACK_EVENT_DEDUP_TTL = int(os.environ.get("SLACK_EVENT_DEDUP_TTL", "3600"))
+
 CELERY_BROKER_URL = REDIS_CELERY_URL
 # no results as I'm just running a report once a day and it should just work.
 # result_backend = REDIS_CELERY_URL
@@ -274,6 +337,93 @@ task_serializer = "json"
 result_serializer = "json"
 task_always_eager = False
 
+# Acknowledge Slack events straight away and run the message handler on a
+# celery worker instead of inside the request.
+SLACK_EVENTS_ASYNC = False
+if os.environ.get("SLACK_EVENTS_ASYNC", "0").strip() == "1":
+    sys.stderr.write("SLACK_EVENTS_ASYNC=1 is set in environment!\n")
+    SLACK_EVENTS_ASYNC = True
+
+# Events are spread over 'slack-events-<N>' queues by their thread. Each queue
+# must be consumed by a single worker with concurrency 1 so the messages in a
+# thread are handled in the order slack sent them.
+SLACK_EVENT_QUEUES = int(os.environ.get("SLACK_EVENT_QUEUES", "1"))
+
+# Slack writes are held to SLACK_CHANNEL_RATE a second per channel and
+# SLACK_METHOD_RATE a minute per method, with bursts of up to the _BURST
+# settings. A 429 is retried after its Retry-After up to SLACK_RATE_RETRIES
+# times, unless Slack asks for more than SLACK_RETRY_AFTER_MAX seconds. See
+# zenslackchat/slack_dispatcher.py.
+SLACK_RATE_LIMITS = os.environ.get("SLACK_RATE_LIMITS", "1").strip() == "1"
+SLACK_CHANNEL_RATE = float(os.environ.get("SLACK_CHANNEL_RATE", "1"))
+SLACK_CHANNEL_BURST = int(os.environ.get("SLACK_CHANNEL_BURST", "3"))
+SLACK_METHOD_RATE = float(os.environ.get("SLACK_METHOD_RATE", "300"))
+SLACK_METHOD_BURST = int(os.environ.get("SLACK_METHOD_BURST", "20"))
+SLACK_RATE_RETRIES = int(os.environ.get("SLACK_RATE_RETRIES", "3"))
+SLACK_RETRY_AFTER_MAX = int(os.environ.get("SLACK_RETRY_AFTER_MAX", "60"))
+
+# Zendesk's per-minute API quota is shared between all processes through the
+# cache. Ticket creation and emailed tickets may use all of it, other calls
+# leave the ZENDESK_RESERVE_INTERACTIVE fraction of it and the comment syncs
+# leave the ZENDESK_RESERVE_BACKGROUND fraction. See zenslackchat/zendesk_budget.py.
+ZENDESK_BUDGET = os.environ.get("ZENDESK_BUDGET", "1").strip() == "1"
+ZENDESK_RESERVE_INTERACTIVE = float(
+    os.environ.get("ZENDESK_RESERVE_INTERACTIVE", "0.1")
+)
+ZENDESK_RESERVE_BACKGROUND = float(
+    os.environ.get("ZENDESK_RESERVE_BACKGROUND", "0.3")
+)
+ZENDESK_BUDGET_MAX_WAIT = int(os.environ.get("ZENDESK_BUDGET_MAX_WAIT", "30"))
+ZENDESK_BUDGET_POLL = float(os.environ.get("ZENDESK_BUDGET_POLL", "1"))
+
+# Threads per process used to find who is on call while a new issue is stored
+# and announced, and the seconds to wait for them. FOLLOW_UP_WORKERS=0 does
+# this in turn instead. See zenslackchat/follow_ups.py.
+FOLLOW_UP_WORKERS = int(os.environ.get("FOLLOW_UP_WORKERS", "4"))
+FOLLOW_UP_TIMEOUT = float(os.environ.get("FOLLOW_UP_TIMEOUT", "10"))
+
+# The daily report is posted as a thread of messages of no more than this
+# many characters. Slack recommends keeping messages under 4,000.
+DAILY_REPORT_MESSAGE_SIZE = int(
+    os.environ.get("DAILY_REPORT_MESSAGE_SIZE", "3000")
+)
+
+# Conversations resolved more than ARCHIVE_AFTER_DAYS ago are moved out of the
+# table the bot queries, ARCHIVE_BATCH_SIZE at a time with ARCHIVE_BATCH_PAUSE
+# seconds between batches. See zenslackchat/archive.py.
+ARCHIVE_AFTER_DAYS = int(os.environ.get("ARCHIVE_AFTER_DAYS", "90"))
+ARCHIVE_BATCH_SIZE = int(os.environ.get("ARCHIVE_BATCH_SIZE", "500"))
+ARCHIVE_BATCH_PAUSE = float(os.environ.get("ARCHIVE_BATCH_PAUSE", "0.5"))
+
+# The conversations export reads and sends this many rows at a time. See
+# zenslackchat/export.py.
+EXPORT_PAGE_SIZE = int(os.environ.get("EXPORT_PAGE_SIZE", "1000"))
+
+# Under ASGI the Slack events and Zendesk webhooks are async views which
+# respond straight away and then run the (blocking) handlers on a pool of
+# ASYNC_HANDLER_THREADS threads per process. Each busy thread holds a database
+# connection, and with CONN_MAX_AGE set each idle one keeps its own too, so per
+# process this plus FOLLOW_UP_WORKERS must fit in the database's connection
+# limit. Once ASYNC_BACKLOG events are waiting for or on the pool, requests
+# wait for their handling again. See zenslackchat/async_views.py.
+ASYNC_HANDLER_THREADS = int(os.environ.get("ASYNC_HANDLER_THREADS", "8"))
+ASYNC_BACKLOG = int(os.environ.get("ASYNC_BACKLOG", "500"))
+
+# Time each stage of the message handler and its Slack, Zendesk and PagerDuty
+# calls. The last TRACE_BUFFER_SIZE traces are kept per process and can be seen
+# in the admin. See zenslackchat/tracing.py.
+TRACING_ENABLED = os.environ.get("TRACING_ENABLED", "0").strip() == "1"
+TRACE_BUFFER_SIZE = int(os.environ.get("TRACE_BUFFER_SIZE", "200"))
+
+# Where the /metrics counters are kept: "redis" totals them over every web and
+# worker process, "local" keeps them per process. Each process sends its counts
+# to redis at most every METRICS_FLUSH_SECONDS. /metrics is off (404) unless
+# METRICS_TOKEN is set, then it needs an "Authorization: Bearer <METRICS_TOKEN>"
+# header.
+METRICS_BACKEND = os.environ.get("METRICS_BACKEND", "redis")
+METRICS_FLUSH_SECONDS = float(os.environ.get("METRICS_FLUSH_SECONDS", "5"))
+METRICS_TOKEN = os.environ.get("METRICS_TOKEN", "")
+
 # Set the name for the app in logging:
 DLFE_APP_NAME = "ZenSlackChat"
 
@@ -18,6 +18,7 @@ from django.urls import path
 from django.urls import include
 
 from .healthcheck import healthcheck_status
+from .healthcheck import metrics_status
 
 
 urlpatterns = [
@@ -25,4 +26,5 @@ urlpatterns = [
     path('admin/', admin.site.urls),
     path('auth/', include('authbroker_client.urls', namespace='authbroker')),
     path("healthcheck/", healthcheck_status, name='status'),
+    path("metrics", metrics_status, name='metrics'),
 ]
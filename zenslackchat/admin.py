@@ -1,9 +1,17 @@
+import re
+
 from django import forms
 from django.db import models
 from django.contrib import admin
 from django.conf import settings
+from django.core.exceptions import PermissionDenied
+from django.http import HttpResponseRedirect
+from django.template.response import TemplateResponse
+from django.urls import path
 from django.utils.html import format_html
 
+from zenslackchat.models import ArchivedChat
+from zenslackchat.models import DailyStats
 from zenslackchat.models import SlackApp
 from zenslackchat.models import ZendeskApp
 from zenslackchat.models import PagerDutyApp
@@ -11,9 +19,14 @@ from zenslackchat.models import ZenSlackChat
 from zenslackchat.models import OutOfHoursInformation
 from zenslackchat.slack_api import message_url
 from zenslackchat.slack_api import url_to_chat_id
+from zenslackchat.tracing import traces
 from zenslackchat.zendesk_api import zendesk_ticket_url
 
 
+# e.g. https://xyz.slack.com/archives/C019JUGAGTS/p1614771038052300
+SLACK_MESSAGE_URL = re.compile(r"/archives/[^/]+/p\d+/?$")
+
+
 @admin.register(SlackApp)
 class SlackAppAdmin(admin.ModelAdmin):
     """Manage the stored Slack OAuth client credentials.
@@ -52,6 +65,9 @@ class ZenSlackChatAdmin(admin.ModelAdmin):
 
     actions = ('mark_resolved',)
 
+    # Don't count the whole table again when searching or filtering:
+    show_full_result_count = False
+
     def chat_url(self, obj):
         """Provide a link to the slack chat."""
         url = message_url(
@@ -68,16 +84,22 @@ class ZenSlackChatAdmin(admin.ModelAdmin):
         return format_html(f'<a href="{url}">{obj.ticket_id}</a>')
 
     def get_search_results(self, request, queryset, search_term):
-        """Support Slack chat url to chat_id conversion and searching."""
-        queryset, use_distinct = super().get_search_results(
+        """Support Slack chat url to chat_id conversion and searching.
+
+        The chat_id from a pasted Slack message URL is matched in the same
+        query, rather than counting the results first to see if it is needed.
+        It is matched within the queryset given, so any filters still apply.
+
+        """
+        matches, use_distinct = super().get_search_results(
             request, queryset, search_term
         )
 
-        if queryset.count() == 0:
-            chat_id = url_to_chat_id(search_term)
-            queryset |= self.model.objects.filter(chat_id=chat_id)
+        term = search_term.strip()
+        if SLACK_MESSAGE_URL.search(term):
+            matches |= queryset.filter(chat_id=url_to_chat_id(term))
 
-        return queryset, use_distinct
+        return matches, use_distinct
 
     def mark_resolved(modeladmin, request, queryset):
         """Allow the admin to close issue.
@@ -95,6 +117,136 @@ class ZenSlackChatAdmin(admin.ModelAdmin):
 
     mark_resolved.short_description = "Remove an issue by marking it resolved."
 
+    def get_urls(self):
+        return [
+            path(
+                'traces/',
+                self.admin_site.admin_view(self.traces_view),
+                name='zenslackchat_traces',
+            ),
+            path(
+                'analytics/',
+                self.admin_site.admin_view(self.analytics_view),
+                name='zenslackchat_analytics',
+            ),
+        ] + super().get_urls()
+
+    def traces_view(self, request):
+        """Show the recent message handler traces kept by this process.
+
+        These are only recorded when TRACING_ENABLED=1. Each web and worker
+        process has its own, so events handled on a celery worker only appear
+        in its logs. They include message text, so only those who can view
+        the conversations can see them.
+
+        """
+        if not self.has_view_permission(request):
+            raise PermissionDenied
+
+        context = dict(
+            self.admin_site.each_context(request),
+            title='Recent traces',
+            opts=self.model._meta,
+            enabled=settings.TRACING_ENABLED,
+            traces=[
+                dict(trace=trace, spans=list(trace.walk()))
+                for trace in traces.recent()
+            ],
+        )
+        return TemplateResponse(
+            request, 'admin/zenslackchat/traces.html', context
+        )
+
+    def analytics_view(self, request):
+        """Show the arrival rates, resolve times and backlog ages.
+
+        These are worked out once a day (see zenslackchat.analytics). Pass
+        ?channel=<ID> for one channel. Those who can change conversations can
+        POST to work them out again.
+
+        """
+        if not self.has_view_permission(request):
+            raise PermissionDenied
+
+        # Imported here so the admin, and the app, load without NumPy:
+        from zenslackchat import analytics
+
+        channel_id = request.GET.get('channel') or None
+        can_refresh = self.has_change_permission(request)
+        if request.method == 'POST':
+            if not can_refresh:
+                raise PermissionDenied
+            analytics.report(channel_id, refresh=True)
+            return HttpResponseRedirect(request.get_full_path())
+
+        context = dict(
+            self.admin_site.each_context(request),
+            title='Analytics',
+            opts=self.model._meta,
+            report=analytics.report(channel_id),
+            hours=range(24),
+            can_refresh=can_refresh,
+        )
+        return TemplateResponse(
+            request, 'admin/zenslackchat/analytics.html', context
+        )
+
+
+@admin.register(DailyStats)
+class DailyStatsAdmin(admin.ModelAdmin):
+    """Show the issues opened and closed each day.
+
+    These are kept up to date by the bot, see "manage.py daily_stats".
+
+    """
+    date_hierarchy = 'day'
+
+    list_display = (
+        'day', 'channel_id', 'opened', 'closed', 'backlog', 'resolve_p50',
+        'resolve_p90'
+    )
+
+    list_filter = ('channel_id',)
+
+    ordering = ('-day', 'channel_id')
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(ArchivedChat)
+class ArchivedChatAdmin(admin.ModelAdmin):
+    """Show the resolved conversations moved out of the main table.
+
+    These are moved by the bot, see "manage.py archive_conversations".
+
+    """
+    date_hierarchy = 'closed'
+
+    list_display = (
+        'chat_id', 'channel_id', 'ticket_url', 'chat_url', 'opened', 'closed',
+        'archived'
+    )
+
+    search_fields = ('chat_id', 'ticket_id')
+
+    list_filter = ('channel_id', 'archived')
+
+    show_full_result_count = False
+
+    chat_url = ZenSlackChatAdmin.chat_url
+
+    ticket_url = ZenSlackChatAdmin.ticket_url
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
 
 @admin.register(OutOfHoursInformation)
 class OutOfHoursInformationAdmin(admin.ModelAdmin):
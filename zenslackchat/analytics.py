@@ -0,0 +1,152 @@
+"""
+Capacity planning numbers from the history of support issues.
+
+The opened and closed times of every issue, archived or not, are loaded in a
+query per table into NumPy arrays (as seconds since the epoch, NaN if still
+open). The numbers are then worked out over the whole arrays at once:
+
+- arrivals: the mean issues opened in each hour of the week (Monday 00:00
+  UTC first), over the weeks from the first issue to the last.
+- resolve: percentiles of the seconds taken to resolve the closed issues.
+- backlog: how long the open issues have been open, as a histogram.
+
+The history only changes by a day's worth each day, so report() caches the
+result per day. See "manage.py analytics" and the admin analytics page.
+
+"""
+import itertools
+import logging
+from datetime import datetime, timezone
+
+import numpy as np
+from django.core.cache import cache
+
+from zenslackchat.models import ArchivedChat
+from zenslackchat.models import ZenSlackChat
+from zenslackchat.tracing import traced
+
+
+HOUR = 3600
+DAY = 24 * HOUR
+WEEK = 7 * DAY
+
+PERCENTILES = (50, 75, 90, 95, 99)
+
+# The backlog age histogram bins, in seconds, and their labels:
+AGE_BINS = (0, HOUR, 4 * HOUR, DAY, 3 * DAY, 7 * DAY, 30 * DAY, 90 * DAY)
+AGE_LABELS = (
+    "<1h", "1-4h", "4h-1d", "1-3d", "3-7d", "7-30d", "30-90d", ">90d"
+)
+
+DAYS = ("Mon", "Tue", "Wed", "Thu", "Fri", "Sat", "Sun")
+
+
+def load(channel_id=None):
+    """Return the (opened, closed) arrays of seconds since the epoch.
+
+    :param channel_id: Optional, only the issues on this channel.
+
+    closed is NaN for issues that are still open. The archived issues are
+    included.
+
+    """
+    rows = []
+    for model in (ZenSlackChat, ArchivedChat):
+        issues = model.objects.all()
+        if channel_id:
+            issues = issues.filter(channel_id=channel_id)
+        rows.append(
+            issues.values_list("opened", "closed").iterator(chunk_size=10_000)
+        )
+
+    times = np.fromiter(
+        (
+            (opened.timestamp(), closed.timestamp() if closed else np.nan)
+            for opened, closed in itertools.chain.from_iterable(rows)
+        ),
+        dtype=np.dtype((np.float64, 2)),
+    )
+    return times[:, 0], times[:, 1]
+
+
+def arrivals(opened):
+    """Return the mean issues opened in each of the 168 hours of a week."""
+    if not opened.size:
+        return np.zeros(168)
+
+    # 1 Jan 1970 was a Thursday, so Monday 00:00 was 3 days before it:
+    since_monday = opened + 3 * DAY
+    hour_of_week = (since_monday % WEEK // HOUR).astype(np.int64)
+    counts = np.bincount(hour_of_week, minlength=168)
+    # The weeks from the first issue's to the last's:
+    week = since_monday // WEEK
+    return counts / (week.max() - week.min() + 1)
+
+
+def resolve_percentiles(opened, closed):
+    """Return the PERCENTILES of the seconds taken to resolve closed issues.
+
+    np.percentile() interpolates between values by default, as the DailyStats
+    percentiles do (see zenslackchat.models.percentiles).
+
+    """
+    done = ~np.isnan(closed)
+    if not done.any():
+        return [None] * len(PERCENTILES)
+
+    return np.percentile(closed[done] - opened[done], PERCENTILES).tolist()
+
+
+def backlog_ages(opened, closed, now):
+    """Return how many open issues fall in each AGE_BINS bucket."""
+    ages = now - opened[np.isnan(closed)]
+    counts, _ = np.histogram(ages, bins=AGE_BINS + (np.inf,))
+    return counts.tolist()
+
+
+@traced("analytics.compute")
+def compute(channel_id=None, now=None):
+    """Work out the report from the stored issues."""
+    now = now or datetime.now(timezone.utc)
+    opened, closed = load(channel_id)
+    per_hour = arrivals(opened)
+
+    return dict(
+        channel_id=channel_id,
+        computed=now.isoformat(),
+        issues=int(opened.size),
+        open=int(np.isnan(closed).sum()),
+        arrivals=[
+            dict(day=DAYS[index], rates=[round(rate, 3) for rate in rates])
+            for index, rates in enumerate(per_hour.reshape(7, 24).tolist())
+        ],
+        resolve=dict(zip(
+            (f"p{percent}" for percent in PERCENTILES),
+            resolve_percentiles(opened, closed),
+        )),
+        backlog=dict(zip(
+            AGE_LABELS, backlog_ages(opened, closed, now.timestamp())
+        )),
+    )
+
+
+def report(channel_id=None, refresh=False, now=None):
+    """Return the report from the cache, working it out once a day.
+
+    :param channel_id: Optional, only the issues on this channel.
+
+    :param refresh: Work it out again even if cached.
+
+    """
+    log = logging.getLogger(__name__)
+
+    now = now or datetime.now(timezone.utc)
+    key = f"analytics:{channel_id or 'all'}:{now.date().isoformat()}"
+
+    found = None if refresh else cache.get(key)
+    if found is None:
+        log.debug(f"Working out the analytics for <{key}>")
+        found = compute(channel_id, now)
+        cache.set(key, found, timeout=DAY)
+
+    return found
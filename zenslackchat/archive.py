@@ -0,0 +1,55 @@
+"""
+Move old resolved conversations out of the ZenSlackChat table.
+
+Every Slack message and Zendesk webhook looks up ZenSlackChat, while most of
+its rows are conversations resolved long ago. Those resolved more than
+ARCHIVE_AFTER_DAYS ago are moved to ArchivedChat, ARCHIVE_BATCH_SIZE at a
+time with a pause of ARCHIVE_BATCH_PAUSE seconds between batches. Each batch
+is a short transaction, so the bot isn't held up while the backlog is moved.
+
+The celery beat runs this each night (see webapp/celery.py). It can also be
+run by hand with "manage.py archive_conversations".
+
+"""
+import logging
+import time
+from datetime import timedelta
+
+from django.conf import settings
+
+from zenslackchat.models import ArchivedChat
+from zenslackchat.models import utcnow
+
+
+def archive(days=None, size=None, pause=None, now=None, sleep=time.sleep):
+    """Archive the conversations resolved more than days ago.
+
+    :param days: Default is ARCHIVE_AFTER_DAYS.
+
+    :param size: The conversations moved per batch, default is
+    ARCHIVE_BATCH_SIZE.
+
+    :param pause: Seconds between batches, default is ARCHIVE_BATCH_PAUSE.
+
+    :returns: The number of conversations archived.
+
+    """
+    log = logging.getLogger(__name__)
+
+    days = settings.ARCHIVE_AFTER_DAYS if days is None else days
+    size = size or settings.ARCHIVE_BATCH_SIZE
+    pause = settings.ARCHIVE_BATCH_PAUSE if pause is None else pause
+    before = (now or utcnow()) - timedelta(days=days)
+
+    total = 0
+    while True:
+        moved = ArchivedChat.archive(before, size)
+        total += moved
+        if moved < size:
+            break
+        log.debug(f"Archived {total} conversations so far, pausing {pause}s")
+        sleep(pause)
+
+    log.info(f"Archived {total} conversations resolved before {before}")
+
+    return total
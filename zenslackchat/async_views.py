@@ -0,0 +1,209 @@
+"""
+Async versions of the Slack events and Zendesk webhook views for ASGI.
+
+Under WSGI each request in progress holds one of the server's threads for as
+long as its handler waits on Slack, Zendesk, PagerDuty and the database. Under
+ASGI (see webapp/asgi.py) these views are used instead. Each request is a
+coroutine which only checks the token and whether the event was seen before
+(see eventsview.receive and BaseWebHook.receive) and responds. The blocking
+handling is then done off the request on a pool of ASYNC_HANDLER_THREADS
+threads. Requests in flight are therefore only limited by the server, and the
+pool only limits how many events are handled at once. The pool is kept small
+as each busy thread holds a database connection.
+
+Up to ASYNC_BACKLOG events per process can be waiting for or being handled
+this way. Beyond that a request waits for its handling again, which slows
+Slack and Zendesk down rather than holding ever more events in memory. Events
+acknowledged here are lost if the process dies before handling them; set
+SLACK_EVENTS_ASYNC to queue Slack events on celery instead.
+
+The queries made on the pool are counted under the view's name, as the
+QueryCountMiddleware does for the other views.
+
+"""
+import concurrent.futures
+import json
+import logging
+import threading
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import close_old_connections
+from django.http import HttpResponse
+from django.http import JsonResponse
+
+from zenslackchat import eventsview
+from zenslackchat import zendesk_webhooks
+from zenslackchat.metrics import ASYNC_BACKLOG
+from zenslackchat.metrics import ASYNC_IN_FLIGHT
+from zenslackchat.metrics import QueryCounter
+
+
+_lock = threading.Lock()
+_executor = None
+_backlog = 0
+
+
+def executor():
+    """Return this process's pool of ASYNC_HANDLER_THREADS threads."""
+    global _executor
+
+    if _executor is None:
+        with _lock:
+            if _executor is None:
+                _executor = concurrent.futures.ThreadPoolExecutor(
+                    max_workers=settings.ASYNC_HANDLER_THREADS,
+                    thread_name_prefix="async-handler",
+                )
+
+    return _executor
+
+
+def counted(name, func):
+    """Wrap func to count its queries and close the thread's connection.
+
+    :param name: The view name the queries are counted under.
+
+    """
+    def run(*args):
+        close_old_connections()
+        try:
+            with QueryCounter(f"view:{name}"):
+                return func(*args)
+
+        finally:
+            close_old_connections()
+
+    return run
+
+
+async def run_blocking(name, func, *args):
+    """Run func(*args) on the pool and return its result.
+
+    :param name: The view name the queries are counted under.
+
+    """
+    ASYNC_IN_FLIGHT.inc(view=name)
+    try:
+        return await sync_to_async(
+            counted(name, func), thread_sensitive=False, executor=executor()
+        )(*args)
+
+    finally:
+        ASYNC_IN_FLIGHT.dec(view=name)
+
+
+async def run_later(name, func, *args):
+    """Run func(*args) on the pool without waiting for it to finish.
+
+    :param name: The view name the queries are counted under.
+
+    If ASYNC_BACKLOG calls are already waiting for or running on the pool,
+    this waits for func like run_blocking instead.
+
+    """
+    global _backlog
+
+    with _lock:
+        queued = _backlog < settings.ASYNC_BACKLOG
+        if queued:
+            _backlog += 1
+
+    if not queued:
+        await run_blocking(name, func, *args)
+        return
+
+    def done(future):
+        global _backlog
+
+        with _lock:
+            _backlog -= 1
+        ASYNC_BACKLOG.dec(view=name)
+
+    ASYNC_BACKLOG.inc(view=name)
+    executor().submit(counted(name, func), *args).add_done_callback(done)
+
+
+async def check(func, *args):
+    """Run the quick blocking checks made before a request is acknowledged.
+
+    These only use the cache, so they don't wait on the handlers' pool.
+
+    """
+    return await sync_to_async(func, thread_sensitive=False)(*args)
+
+
+def json_body(request):
+    """Return the decoded JSON body of the request or None if it isn't."""
+    log = logging.getLogger(__name__)
+
+    try:
+        return json.loads(request.body or b'{}')
+
+    except ValueError:
+        log.error(f"Ignoring {request.path} request without a JSON body.")
+        return None
+
+
+async def slack_events(request):
+    """The async version of eventsview.Events."""
+    if request.method != 'POST':
+        return HttpResponse(status=405)
+
+    slack_message = json_body(request)
+    if not isinstance(slack_message, dict):
+        return HttpResponse(status=400)
+
+    events = []
+    status_code, data = await check(
+        eventsview.receive, slack_message, request.headers, events.append
+    )
+    for event in events:
+        await run_later('slack_events', eventsview.dispatch, event)
+
+    if data is None:
+        return HttpResponse(status=status_code)
+
+    return JsonResponse(data, status=status_code)
+
+
+def webhook(WebHook, name):
+    """Return the async version of the Zendesk webhook view.
+
+    :param WebHook: The BaseWebHook subclass handling the events.
+
+    :param name: The name of the view in zenslackchat/urls.py.
+
+    """
+    async def view(request):
+        if request.method != 'POST':
+            return HttpResponse(status=405)
+
+        data = json_body(request)
+        if not isinstance(data, dict):
+            return HttpResponse(status=400)
+
+        hook = WebHook()
+        received = []
+        status_code, body = await check(hook.receive, data, received.append)
+        for data in received:
+            await run_later(name, hook.dispatch_event, data)
+
+        if body is None:
+            return HttpResponse(status=status_code)
+
+        return JsonResponse(body, status=status_code, safe=False)
+
+    view.__name__ = name
+    # django 4.2's csrf_exempt() doesn't keep a view async, so set it here:
+    view.csrf_exempt = True
+    return view
+
+
+slack_events.csrf_exempt = True
+
+comments_webhook = webhook(
+    zendesk_webhooks.CommentsWebHook, 'zenslackchat_comments'
+)
+
+email_webhook = webhook(zendesk_webhooks.EmailWebHook, 'zenslackchat_emails')
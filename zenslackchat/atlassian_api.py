@@ -1,11 +1,18 @@
 import requests
 from requests.auth import HTTPBasicAuth
 from bs4 import BeautifulSoup
-from datetime import datetime
+from bisect import bisect_left, bisect_right
+from collections import namedtuple
+from datetime import date, datetime, time, timedelta, timezone
 import os
 import sys
 import logging
+import threading
 from django.conf import settings
+from django.core.cache import cache
+
+from zenslackchat.metrics import CACHE_REQUESTS
+from zenslackchat.metrics import api_call
 
 log = logging.getLogger(__name__)
 
@@ -13,13 +20,23 @@ sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'webapp.settings')
 
 
-def get_oncall_support(content):
-    """Extract today's Primary and Secondary on-call support from an HTML table."""
+# A row in the on-call table. The start and end dates are both inclusive.
+Rotation = namedtuple("Rotation", "start end primary secondary")
+
+
+def parse_rotations(content):
+    """Extract all the rotations from the on-call HTML table.
+
+    :param content: The Confluence page body storage HTML.
+
+    :returns: A list of Rotation sorted by start date.
+
+    Rows without a 'dd/mm/yy - dd/mm/yy' date range are skipped.
+
+    """
     soup = BeautifulSoup(content, "html.parser")
 
-    today = datetime.today()
-    today = today.replace(hour=0, minute=0, second=0, microsecond=0)
-    primary, secondary = None, None
+    rotations = []
 
     # Loop through table rows
     for row in soup.find_all("tr"):
@@ -33,45 +50,176 @@ def get_oncall_support(content):
                 start_date = datetime.strptime(start_date_str, "%d/%m/%y")
                 end_date = datetime.strptime(end_date_str, "%d/%m/%y")
 
-                # Check if today falls within the date range
-                if start_date <= today <= end_date:
-                    primary = cols[1].get_text(strip=True)
-                    secondary = cols[3].get_text(strip=True)
-                    break  # Stop once today's entry is found
-
             except ValueError:
                 continue  # Skip invalid date formats
 
-    return primary, secondary
+            rotations.append(Rotation(
+                start_date.date(),
+                end_date.date(),
+                cols[1].get_text(strip=True),
+                cols[3].get_text(strip=True),
+            ))
 
+    # Stable, so rows with the same start date keep their table order:
+    rotations.sort(key=lambda rotation: rotation.start)
 
-def call_atlassian():
-    # API Endpoint
-    url = f"{settings.ATLASSIAN_BASE_URL}/rest/api/content/{settings.ATLASSIAN_PAGE_ID}?expand=body.storage"
+    return rotations
 
-    # Request headers
-    headers = {
-        "Accept": "application/json"
-    }
-    log.debug("Atlassian login")
-    # Make the request
-    response = requests.get(
+
+class RotationCalendar(object):
+    """An index of the on-call rotations for lookups by date.
+
+    Finding who is on call on a given day is a binary search on the start
+    dates and another on the latest end date so far. If rotations overlap,
+    the one starting first wins and then the first row in the table, as when
+    the table is read top down.
+
+    """
+    def __init__(self, rotations, version=None):
+        """
+        :param rotations: A list of Rotation sorted by start date.
+
+        :param version: The Confluence page version they were parsed from.
+
+        """
+        self.rotations = rotations
+        self.version = version
+        self._starts = [rotation.start for rotation in rotations]
+        # The latest end of the rotations up to and including each one:
+        self._reach = []
+        for rotation in rotations:
+            self._reach.append(
+                max(rotation.end, self._reach[-1]) if self._reach
+                else rotation.end
+            )
+
+    @classmethod
+    def from_content(cls, content, version=None):
+        return cls(parse_rotations(content), version)
+
+    def rotation(self, when):
+        """Return the Rotation covering the day, or None.
+
+        :param when: A date or datetime.
+
+        """
+        if isinstance(when, datetime):
+            when = when.date()
+
+        # Those starting on or before the day:
+        started = bisect_right(self._starts, when)
+        # The first of them still going on the day, as the ones before it
+        # all ended before it:
+        index = bisect_left(self._reach, when, hi=started)
+        if index < started:
+            return self.rotations[index]
+
+        return None
+
+    def on_call(self, when):
+        """Return (primary, secondary) on the day or (None, None).
+        """
+        found = self.rotation(when)
+        if found is None:
+            return None, None
+
+        return found.primary, found.secondary
+
+    def hand_over(self, when):
+        """Return the UTC datetime the rotation covering the day ends, or None.
+        """
+        found = self.rotation(when)
+        if found is None:
+            return None
+
+        return datetime.combine(
+            found.end + timedelta(days=1), time.min, tzinfo=timezone.utc
+        )
+
+
+def get_oncall_support(content, today=None):
+    """Extract today's Primary and Secondary on-call support from an HTML table."""
+    if today is None:
+        today = date.today()
+
+    return RotationCalendar.from_content(content).on_call(today)
+
+
+# Keep-alive session for the Confluence API calls.
+session = requests.Session()
+
+# Changed when RotationCalendar changes, so older pickled ones aren't used:
+CALENDAR_KEY = "confluence-rotation-calendar:2"
+
+_calendar_lock = threading.Lock()
+
+_calendar = None
+
+
+@api_call("confluence", "get_page")
+def _get_page(expand):
+    url = f"{settings.ATLASSIAN_BASE_URL}/rest/api/content/{settings.ATLASSIAN_PAGE_ID}"
+    response = session.get(
         url,
-        headers=headers,
+        params={"expand": expand},
+        headers={"Accept": "application/json"},
         auth=HTTPBasicAuth(settings.ATLASSIAN_USERNAME, settings.ATLASSIAN_API_TOKEN)
     )
+    if response.status_code != 200:
+        log.error(f"Error: {response.status_code} - {response.text}")
+    response.raise_for_status()
+
+    return response.json()
+
+
+def rotation_calendar():
+    """Return the RotationCalendar for the current version of the page.
 
-    # Parse response
-    if response.status_code == 200:
-        data = response.json()
+    Only the small page version is requested each time. The page body is only
+    downloaded and parsed when its version changes. The parsed calendar is
+    kept in this process and shared with others through the django cache.
+
+    """
+    global _calendar
+
+    log.debug("Atlassian login")
+    version = _get_page("version")["version"]["number"]
+
+    with _calendar_lock:
+        if _calendar is not None and _calendar.version == version:
+            CACHE_REQUESTS.inc(cache="confluence_calendar", result="hit")
+            return _calendar
+
+        try:
+            shared = cache.get(CALENDAR_KEY)
+        except:  # noqa: I'm logging rather than hidding.
+            log.exception("Unable to recover the on-call calendar from cache: ")
+            shared = None
+
+        if shared is not None and shared.version == version:
+            CACHE_REQUESTS.inc(cache="confluence_calendar", result="shared_hit")
+            _calendar = shared
+            return _calendar
+
+        CACHE_REQUESTS.inc(cache="confluence_calendar", result="miss")
+
+        log.debug(f"Parsing on-call page version {version}")
+        data = _get_page("body.storage,version")
         content = data["body"]["storage"]["value"]  # HTML format
-    else:
-        print(f"Error: {response.status_code} - {response.text}")
+        _calendar = RotationCalendar.from_content(
+            content, data["version"]["number"]
+        )
+
+        try:
+            cache.set(CALENDAR_KEY, _calendar, timeout=None)
+        except:  # noqa: I'm logging rather than hidding.
+            log.exception("Unable to store the on-call calendar in cache: ")
+
+        return _calendar
 
-    primary, secondary = get_oncall_support(content)
+
+def call_atlassian():
+    primary, secondary = rotation_calendar().on_call(date.today())
     oncall = {"primary": primary, "secondary": secondary}
 
     return oncall
-
-# oncall = call_atlassian()
-# print(oncall)
@@ -0,0 +1,115 @@
+"""
+Keep one Slack and Zendesk client per process instead of one per request.
+
+Building a client means a database query for the latest OAuth token and a new
+HTTP session. The registry keeps the client it built and hands it out until a
+new token is saved. Saving a token bumps a generation counter in the django
+cache (redis) so every web and worker process notices and rebuilds its client.
+
+"""
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+
+
+GENERATION_KEY = "client-generation"
+
+
+class ClientRegistry(object):
+    """A thread safe store of clients by name for this process.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._clients = {}
+        self._generation = None
+        self._checked = 0
+
+    def generation(self):
+        """Return the shared token generation.
+
+        This is only read from the cache every CLIENT_REGISTRY_CHECK_SECONDS
+        so the normal case costs no network round trip.
+
+        """
+        log = logging.getLogger(__name__)
+
+        now = time.monotonic()
+        interval = settings.CLIENT_REGISTRY_CHECK_SECONDS
+        if self._generation is None or now - self._checked >= interval:
+            try:
+                self._generation = cache.get(GENERATION_KEY, 0)
+
+            except:  # noqa: I'm logging rather than hidding.
+                log.exception("Unable to recover the client generation: ")
+                if self._generation is None:
+                    self._generation = 0
+
+            self._checked = now
+
+        return self._generation
+
+    def get(self, name, factory):
+        """Return the client for the name, building it if needed.
+
+        :param name: e.g. 'slack' or 'zendesk'.
+
+        :param factory: Called with no arguments to build a new client.
+
+        """
+        generation = self.generation()
+
+        found = self._clients.get(name)
+        if found is None or found[0] != generation:
+            with self._lock:
+                found = self._clients.get(name)
+                if found is None or found[0] != generation:
+                    logging.getLogger(__name__).debug(
+                        f"Building {name} client for generation {generation}"
+                    )
+                    found = (generation, factory())
+                    self._clients[name] = found
+
+        return found[1]
+
+    def invalidate(self):
+        """Drop all clients here and tell other processes to do the same.
+        """
+        log = logging.getLogger(__name__)
+
+        with self._lock:
+            self._clients.clear()
+            self._generation = None
+
+        try:
+            cache.add(GENERATION_KEY, 0, timeout=None)
+            cache.incr(GENERATION_KEY)
+
+        except:  # noqa: I'm logging rather than hidding.
+            log.exception("Unable to update the client generation: ")
+
+
+class LazyClient(object):
+    """Stands in for a client, only building it when it is first used.
+
+    This allows clients to be passed into handlers that may ignore the event
+    without making any API calls.
+
+    """
+    def __init__(self, factory):
+        self._factory = factory
+        self._client = None
+
+    def resolve(self):
+        """Return the real client, building it if needed."""
+        if self._client is None:
+            self._client = self._factory()
+        return self._client
+
+    def __getattr__(self, name):
+        return getattr(self.resolve(), name)
+
+
+registry = ClientRegistry()
@@ -1,14 +1,154 @@
 import pprint
 import logging
+import zlib
 
 from django.conf import settings
 from rest_framework import status
 from rest_framework.views import APIView
 from rest_framework.response import Response
 
+from webapp.celery import process_slack_event
+from zenslackchat.client_registry import LazyClient
+from zenslackchat.idempotency import first_delivery
 from zenslackchat.message import handler
 from zenslackchat.models import SlackApp
 from zenslackchat.models import ZendeskApp
+from zenslackchat.user_cache import profiles
+
+
+def event_queue(event):
+    """Return the celery queue the event should be processed on.
+
+    :param event: The slack event received.
+
+    A top-level message and all its replies are sent to the same queue. The
+    thread is identified by the 'thread_ts' in replies, which is the 'ts' of
+    the top-level message.
+
+    :returns: A queue name e.g. 'slack-events-0'.
+
+    """
+    thread_id = event.get('thread_ts') or event.get('ts', '')
+    # crc32 and not hash() as it must be the same in every process:
+    partition = zlib.crc32(thread_id.encode()) % settings.SLACK_EVENT_QUEUES
+
+    return f'slack-events-{partition}'
+
+
+def process_event(event):
+    """Run the message handler for the event using our configuration.
+
+    :param event: The slack event received.
+
+    This is used directly by the Events view or from the celery worker when
+    SLACK_EVENTS_ASYNC is enabled. All exceptions are logged and not raised.
+
+    """
+    log = logging.getLogger(__name__)
+
+    try:
+        handler(
+            event,
+            our_channel=settings.SRE_SUPPORT_CHANNEL,
+            slack_client=LazyClient(SlackApp.client),
+            zendesk_client=LazyClient(ZendeskApp.client),
+            workspace_uri=settings.SLACK_WORKSPACE_URI,
+            zendesk_uri=settings.ZENDESK_TICKET_URI,
+            user_id=settings.ZENDESK_USER_ID,
+            group_id=settings.ZENDESK_GROUP_ID,
+        )
+
+    except:  # noqa
+        # I want all event even if they cause me problems. If I don't
+        # accept the webhook will be marked as broken and then no more
+        # events will be sent.
+        log.exception("Slack message_handler error: ")
+
+
+def dispatch(event):
+    """Queue the event for the celery worker or handle it now.
+
+    :param event: The slack event received.
+
+    """
+    if settings.SLACK_EVENTS_ASYNC:
+        enqueue(event)
+    else:
+        process_event(event)
+
+
+def receive(slack_message, headers, dispatch=dispatch):
+    """Check and handle the body of a Slack Events API request.
+
+    :param slack_message: The decoded JSON body.
+
+    :param headers: The request headers.
+
+    :param dispatch: Called with the event once it has been checked. The
+    async version of the view (see zenslackchat.async_views) passes its own
+    to acknowledge the event before it is handled.
+
+    :returns: (HTTP status code, response data or None)
+
+    """
+    log = logging.getLogger(__name__)
+
+    if slack_message.get('token') != settings.SLACK_VERIFICATION_TOKEN:
+        log.error("Slack message verification failed!")
+        return status.HTTP_403_FORBIDDEN, None
+
+    # verification challenge, convert to signature verification instead:
+    if slack_message.get('type') == 'url_verification':
+        return status.HTTP_200_OK, slack_message
+
+    event_id = slack_message.get('event_id')
+    retry_num = headers.get('X-Slack-Retry-Num')
+    if retry_num:
+        reason = headers.get('X-Slack-Retry-Reason')
+        log.info(f"Slack retry {retry_num} of <{event_id}>: {reason}")
+
+    if event_id and not first_delivery(
+        'slack-event', event_id, settings.SLACK_EVENT_DEDUP_TTL
+    ):
+        log.info(f"Ignoring event <{event_id}> we have already received.")
+        return status.HTTP_200_OK, None
+
+    if 'event' in slack_message:
+        event = slack_message.get('event')
+        if settings.DEBUG:
+            log.debug(f'event received:\n{pprint.pformat(event)}\n')
+
+        if event.get('type') == 'user_change':
+            # Someone changed their name or email, forget what we have:
+            profiles.invalidate(event['user']['id'])
+            return status.HTTP_200_OK, None
+
+        dispatch(event)
+
+    return status.HTTP_200_OK, None
+
+
+def enqueue(event):
+    """Queue the event for processing on the celery worker.
+
+    If the broker cannot be reached the event is processed now instead of
+    being lost.
+
+    """
+    log = logging.getLogger(__name__)
+
+    queue = event_queue(event)
+    try:
+        process_slack_event.apply_async(args=(event,), queue=queue)
+
+    except:  # noqa
+        log.exception(
+            f"Unable to queue event on <{queue}>, processing it now: "
+        )
+        process_event(event)
+
+    else:
+        log.debug(f"Event ts:<{event.get('ts')}> queued on <{queue}>")
 
 
 class Events(APIView):
@@ -30,42 +170,17 @@ class Events(APIView):
     Message on channels will now start being recieved. The bot will need to be
     invited to a channel first.
 
+    Slack expects a response within 3 seconds or it will resend the event. With
+    SLACK_EVENTS_ASYNC set the event is queued for the celery worker and the
+    response is returned straight away. Resent events have the same event_id
+    and are ignored if we have seen them already.
+
+    Subscribing to the 'user_change' event keeps the cached user profiles the
+    handler uses up to date.
+
     """
     def post(self, request, *args, **kwargs):
         """Events will come in over a POST request.
         """
-        log = logging.getLogger(__name__)
-
-        slack_message = request.data
-
-        if slack_message.get('token') != settings.SLACK_VERIFICATION_TOKEN:
-            log.error("Slack message verification failed!")
-            return Response(status=status.HTTP_403_FORBIDDEN)
-
-        # verification challenge, convert to signature verification instead:
-        if slack_message.get('type') == 'url_verification':
-            return Response(data=slack_message, status=status.HTTP_200_OK)
-
-        if 'event' in slack_message:
-            event = slack_message.get('event')
-            if settings.DEBUG:
-                log.debug(f'event received:\n{pprint.pformat(event)}\n')
-            try:
-                handler(
-                    event,
-                    our_channel=settings.SRE_SUPPORT_CHANNEL,
-                    slack_client=SlackApp.client(),
-                    zendesk_client=ZendeskApp.client(),
-                    workspace_uri=settings.SLACK_WORKSPACE_URI,
-                    zendesk_uri=settings.ZENDESK_TICKET_URI,
-                    user_id=settings.ZENDESK_USER_ID,
-                    group_id=settings.ZENDESK_GROUP_ID,
-                )
-
-            except:  # noqa
-                # I want all event even if they cause me problems. If I don't
-                # accept the webhook will be marked as broken and then no more
-                # events will be sent.
-                log.exception("Slack message_handler error: ")
-
-        return Response(status=status.HTTP_200_OK)
+        status_code, data = receive(request.data, request.headers)
+        return Response(data=data, status=status_code)
@@ -0,0 +1,167 @@
+"""
+Export the stored conversations as CSV or NDJSON, a page at a time.
+
+Rows are read in pages of primary keys after the last one seen (keyset
+pagination), so each page is a quick query however far into the table it is
+and only one page is held in memory. Each row has the Slack and Zendesk links
+for the conversation added.
+
+The archived conversations (see ArchivedChat) keep their primary key, so each
+page is read from both tables in one UNION query. A conversation archived or
+restored while the export runs is then still sent once: either in a page
+already sent or in whichever table it is in when its page is read. The export
+is not one snapshot though, conversations opened meanwhile are included.
+
+Used by the export view (see zenslackchat.views.export_conversations) and
+"manage.py export_conversations".
+
+"""
+import csv
+import io
+import json
+from functools import partial
+from datetime import datetime, time, timezone
+
+from django.conf import settings
+from django.utils.dateparse import parse_date, parse_datetime
+
+from zenslackchat.models import ArchivedChat
+from zenslackchat.models import ZenSlackChat
+from zenslackchat.slack_api import message_url
+from zenslackchat.zendesk_api import zendesk_ticket_url
+
+
+FORMATS = {
+    "csv": "text/csv",
+    "ndjson": "application/x-ndjson",
+}
+
+COLUMNS = (
+    "id", "channel_id", "chat_id", "ticket_id", "active", "opened", "closed"
+)
+
+FIELDS = COLUMNS + ("slack_url", "zendesk_url")
+
+
+def parse_when(value):
+    """Return the ISO date or datetime as a UTC datetime or None if not set.
+
+    A date is taken as midnight UTC at its start. ValueError is raised if the
+    value can't be parsed.
+
+    """
+    if not value:
+        return None
+
+    when = parse_datetime(value)
+    if when is None:
+        day = parse_date(value)
+        if day is None:
+            raise ValueError(f"'{value}' is not an ISO date or datetime.")
+        when = datetime.combine(day, time(), tzinfo=timezone.utc)
+
+    if when.tzinfo is None:
+        when = when.replace(tzinfo=timezone.utc)
+
+    return when
+
+
+def page(after=0, since=None, until=None, channel_id=None, size=1000):
+    """Return the next page of up to size rows as dicts.
+
+    :param after: Only rows with a primary key after this one.
+
+    :param since: Optional, only conversations opened at or after this.
+
+    :param until: Optional, only conversations opened before this.
+
+    :param channel_id: Optional, only conversations on this channel.
+
+    Both the ZenSlackChat and ArchivedChat rows are read.
+
+    """
+    tables = []
+    for model in (ZenSlackChat, ArchivedChat):
+        issues = model.objects.filter(pk__gt=after)
+        if since:
+            issues = issues.filter(opened__gte=since)
+        if until:
+            issues = issues.filter(opened__lt=until)
+        if channel_id:
+            issues = issues.filter(channel_id=channel_id)
+        tables.append(issues.values_list(*COLUMNS))
+
+    rows = []
+    current, archived = tables
+    query = current.union(archived, all=True).order_by("id")[:size]
+    for values in query.iterator(chunk_size=size):
+        row = dict(zip(COLUMNS, values))
+        row["slack_url"] = message_url(
+            settings.SLACK_WORKSPACE_URI, row["channel_id"], row["chat_id"]
+        )
+        row["zendesk_url"] = (
+            zendesk_ticket_url(settings.ZENDESK_TICKET_URI, row["ticket_id"])
+            if row["ticket_id"] is not None else None
+        )
+        for name in ("opened", "closed"):
+            if row[name]:
+                row[name] = row[name].isoformat()
+        rows.append(row)
+
+    return rows
+
+
+def encode(rows, format, header=False):
+    """Return the rows as CSV or NDJSON text."""
+    if format == "ndjson":
+        return "".join(json.dumps(row) + "\n" for row in rows)
+
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, FIELDS)
+    if header:
+        writer.writeheader()
+    writer.writerows(rows)
+    return buffer.getvalue()
+
+
+def stream(format, **filters):
+    """Generate the export text a page at a time.
+
+    :param format: "csv" or "ndjson".
+
+    :param filters: The page() since, until, channel_id and size.
+
+    """
+    if format == "csv":
+        yield encode([], format, header=True)
+
+    after = 0
+    while True:
+        rows = page(after, **filters)
+        if not rows:
+            break
+
+        yield encode(rows, format)
+        after = rows[-1]["id"]
+
+
+async def astream(format, **filters):
+    """The async version of stream() for serving under ASGI.
+
+    Each page is read on the async handler pool. Django would otherwise read
+    the whole of a sync stream into memory before sending it.
+
+    """
+    from zenslackchat.async_views import run_blocking
+
+    if format == "csv":
+        yield encode([], format, header=True)
+
+    after = 0
+    while True:
+        rows = await run_blocking("export", partial(page, after, **filters))
+        if not rows:
+            break
+
+        yield encode(rows, format)
+        after = rows[-1]["id"]
@@ -0,0 +1,96 @@
+"""
+Run the slow lookups for a new issue while its first messages are posted.
+
+Once a ticket is made, who is on call is needed from PagerDuty (or the cache).
+Rather than wait for the issue to be stored and the Zendesk link posted first,
+the roster is fetched on a small thread pool at the same time. The messages are
+still posted one after the other by the caller so they appear in order.
+
+Work started here runs in a copy of the caller's context, so it is traced
+under the caller's span and keeps its Zendesk priority. Each pool thread
+closes its own database connection when the work is done.
+
+"""
+import concurrent.futures
+import contextvars
+import logging
+import threading
+
+from django.conf import settings
+from django.db import connections
+
+
+_lock = threading.Lock()
+_executor = None
+
+
+def executor():
+    """Return this process's pool of FOLLOW_UP_WORKERS threads."""
+    global _executor
+
+    if _executor is None:
+        with _lock:
+            if _executor is None:
+                _executor = concurrent.futures.ThreadPoolExecutor(
+                    max_workers=settings.FOLLOW_UP_WORKERS,
+                    thread_name_prefix="follow-up",
+                )
+
+    return _executor
+
+
+def in_background(func, *args, **kwargs):
+    """Start func(*args, **kwargs) on the pool.
+
+    :returns: A concurrent.futures.Future for the result.
+
+    With FOLLOW_UP_WORKERS=0 func is run straight away in this thread.
+
+    """
+    context = contextvars.copy_context()
+
+    if settings.FOLLOW_UP_WORKERS < 1:
+        future = concurrent.futures.Future()
+        try:
+            future.set_result(context.run(func, *args, **kwargs))
+
+        except Exception as error:
+            future.set_exception(error)
+
+        return future
+
+    def run():
+        try:
+            return context.run(func, *args, **kwargs)
+
+        finally:
+            connections.close_all()
+
+    return executor().submit(run)
+
+
+def result(future, default):
+    """Wait up to FOLLOW_UP_TIMEOUT seconds for the future's result.
+
+    :param future: From in_background() or None if nothing was started.
+
+    :param default: Returned if it failed, took too long or wasn't started.
+
+    """
+    log = logging.getLogger(__name__)
+
+    if future is None:
+        return default
+
+    try:
+        return future.result(timeout=settings.FOLLOW_UP_TIMEOUT)
+
+    except concurrent.futures.TimeoutError:
+        log.error(
+            f"Gave up waiting {settings.FOLLOW_UP_TIMEOUT}s for a follow up."
+        )
+
+    except:  # noqa: I'm logging rather than hidding.
+        log.exception("The follow up failed: ")
+
+    return default
@@ -0,0 +1,39 @@
+"""
+Recognise events we have already received so they are only handled once.
+
+Slack resends an event it thinks we did not receive in time. The envelope
+event_id stays the same across these retries. This is remembered in the
+django cache (redis), which is shared by all web and worker processes.
+
+"""
+import logging
+
+from django.core.cache import cache
+
+
+def first_delivery(namespace, key, ttl):
+    """Return True the first time a key is seen within ttl seconds.
+
+    :param namespace: Keeps keys for different event sources apart.
+
+    :param key: The unique id of the event e.g. the slack event_id.
+
+    :param ttl: How many seconds to remember the key for.
+
+    :returns: True if this is the first time, False for repeats.
+
+    This is a single atomic 'add' so concurrent deliveries of the same event
+    can only have one winner. If the cache is unavailable the event is
+    treated as new, as handling it twice is better than losing it.
+
+    """
+    log = logging.getLogger(__name__)
+
+    try:
+        returned = cache.add(f"seen:{namespace}:{key}", 1, timeout=ttl)
+
+    except:  # noqa: I'm logging rather than hidding.
+        log.exception(f"Unable to check if {namespace} <{key}> was seen: ")
+        returned = True
+
+    return returned
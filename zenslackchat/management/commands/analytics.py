@@ -0,0 +1,54 @@
+"""
+Print the capacity planning numbers worked out by zenslackchat.analytics.
+
+The report is cached for the day, use --refresh to work it out again:
+
+    python manage.py analytics --channel C019JUGAGTS --refresh
+
+"""
+import json
+
+from django.core.management.base import BaseCommand
+
+from zenslackchat import analytics
+
+
+class Command(BaseCommand):
+    help = __doc__.strip().split("\n\n")[0]
+
+    def add_arguments(self, parser):
+        parser.add_argument("--channel", help="Only this slack channel ID.")
+        parser.add_argument("--refresh", action="store_true")
+        parser.add_argument(
+            "--json", action="store_true", help="Print the report as JSON."
+        )
+
+    def handle(self, *args, **options):
+        report = analytics.report(options["channel"], options["refresh"])
+
+        if options["json"]:
+            self.stdout.write(json.dumps(report, indent=2))
+            return
+
+        def hours(seconds):
+            return "-" if seconds is None else f"{seconds / 3600:.1f}h"
+
+        self.stdout.write(
+            f"{report['issues']} issues, {report['open']} open "
+            f"(worked out {report['computed']})"
+        )
+
+        self.stdout.write("\nIssues opened per hour (UTC) of the week:")
+        self.stdout.write("     " + "".join(f"{hour:>6}" for hour in range(24)))
+        for row in report["arrivals"]:
+            self.stdout.write(
+                f"{row['day']:<5}" + "".join(f"{rate:>6.2f}" for rate in row["rates"])
+            )
+
+        self.stdout.write("\nTime to resolve:")
+        for name, seconds in report["resolve"].items():
+            self.stdout.write(f"  {name:<6}{hours(seconds):>10}")
+
+        self.stdout.write("\nOpen issues by age:")
+        for label, count in report["backlog"].items():
+            self.stdout.write(f"  {label:<8}{count:>8}")
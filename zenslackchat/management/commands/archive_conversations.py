@@ -0,0 +1,33 @@
+"""
+Move the conversations resolved long ago to the archive table.
+
+The celery beat does this each night. Run it by hand e.g. to archive the
+backlog on first deploy or with a different age:
+
+    python manage.py archive_conversations
+    python manage.py archive_conversations --days 30 --batch 1000
+
+"""
+from django.core.management.base import BaseCommand
+
+from zenslackchat import archive
+
+
+class Command(BaseCommand):
+    help = __doc__.strip().split("\n\n")[0]
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--days", type=int,
+            help="Archive those resolved more than this many days ago.",
+        )
+        parser.add_argument("--batch", type=int)
+        parser.add_argument(
+            "--pause", type=float, help="Seconds to wait between batches."
+        )
+
+    def handle(self, *args, **options):
+        total = archive.archive(
+            days=options["days"], size=options["batch"], pause=options["pause"]
+        )
+        self.stdout.write(f"Archived {total} conversations.")
@@ -0,0 +1,131 @@
+"""
+Time the ZenSlackChat lookups against a table of many conversations.
+
+The conversations are added inside a transaction which is rolled back at the
+end, so this can be run against a copy of a live database:
+
+    python manage.py benchmark_lookups --rows 1000000
+
+The query plan of each lookup is printed to show the index used.
+
+"""
+import itertools
+import random
+import statistics
+import time
+from datetime import datetime, timedelta, timezone
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+
+from zenslackchat.models import ZenSlackChat
+
+
+class Rollback(Exception):
+    """Raised to undo the conversations added for the benchmark."""
+
+
+class Command(BaseCommand):
+    help = __doc__.strip().split("\n\n")[0]
+
+    def add_arguments(self, parser):
+        parser.add_argument("--rows", type=int, default=1_000_000)
+        parser.add_argument("--batch", type=int, default=10_000)
+        parser.add_argument(
+            "--repeat", type=int, default=100,
+            help="Times each lookup is made.",
+        )
+        parser.add_argument(
+            "--open-share", type=float, default=0.01,
+            help="The fraction of conversations still active.",
+        )
+        parser.add_argument("--seed", type=int, default=1)
+
+    def handle(self, *args, **options):
+        try:
+            with transaction.atomic():
+                self.run(**options)
+                raise Rollback()
+
+        except Rollback:
+            self.stdout.write("Rolled back the benchmark conversations.")
+
+    def add_rows(self, rows, batch, open_share, start):
+        """Add conversations opened over the three years before start."""
+        self.stdout.write(f"Adding {rows} conversations...")
+        span = timedelta(days=3 * 365).total_seconds()
+        for first in range(0, rows, batch):
+            issues = []
+            for index in range(first, min(first + batch, rows)):
+                opened = start - timedelta(seconds=random.random() * span)
+                active = random.random() < open_share
+                issues.append(ZenSlackChat(
+                    channel_id="CBENCHMARK",
+                    chat_id=f"{opened.timestamp():.6f}",
+                    ticket_id=10_000_000 + index,
+                    active=active,
+                    opened=opened,
+                    closed=None if active else opened + timedelta(hours=4),
+                ))
+            # Clashing chat_id are unlikely but possible, skip them:
+            ZenSlackChat.objects.bulk_create(issues, ignore_conflicts=True)
+
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "ANALYZE" if connection.vendor == "sqlite"
+                else f"ANALYZE {ZenSlackChat._meta.db_table}"
+            )
+
+    def time(self, name, lookup, queryset, repeat):
+        """Print the timings and plan of lookup()."""
+        timings = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            lookup()
+            timings.append((time.perf_counter() - started) * 1000)
+
+        timings.sort()
+        p95 = timings[max(int(len(timings) * 0.95) - 1, 0)]
+        self.stdout.write(
+            f"\n{name}: mean {statistics.mean(timings):.3f}ms "
+            f"p50 {statistics.median(timings):.3f}ms p95 {p95:.3f}ms"
+        )
+        self.stdout.write(queryset.explain())
+
+    def run(self, rows, batch, repeat, open_share, seed, **options):
+        random.seed(seed)
+        start = datetime(2024, 1, 1, tzinfo=timezone.utc)
+        self.add_rows(rows, batch, open_share, start)
+
+        issues = list(
+            ZenSlackChat.objects.filter(channel_id="CBENCHMARK")
+            .order_by("?")
+            .values_list("chat_id", "ticket_id")[:repeat]
+        )
+        lookups = itertools.cycle(issues)
+        chat_id, ticket_id = issues[0]
+        self.time(
+            "get_by_ticket",
+            lambda: ZenSlackChat.get_by_ticket(*next(lookups)),
+            ZenSlackChat.objects.filter(chat_id=chat_id, ticket_id=ticket_id),
+            repeat,
+        )
+
+        self.time(
+            "open_issues",
+            ZenSlackChat.open_issues,
+            ZenSlackChat.objects.filter(active=True).order_by("-opened"),
+            repeat,
+        )
+
+        day = start - timedelta(days=30)
+        self.time(
+            "daily_summary closed count",
+            lambda: ZenSlackChat.objects.filter(
+                closed__range=(day, day + timedelta(days=1))
+            ).count(),
+            ZenSlackChat.objects.filter(
+                closed__range=(day, day + timedelta(days=1))
+            ),
+            repeat,
+        )
@@ -0,0 +1,95 @@
+"""
+Rebuild or check the DailyStats rows from the stored issues.
+
+ZenSlackChat.open() and resolve() keep DailyStats up to date as they go. Run
+this once to fill it in for the issues from before it existed, and with
+--check to see whether it has drifted, e.g. from issues changed in the admin.
+
+    python manage.py daily_stats
+    python manage.py daily_stats --check
+
+"""
+import itertools
+import math
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from zenslackchat.models import ArchivedChat
+from zenslackchat.models import DailyStats
+from zenslackchat.models import ZenSlackChat
+
+
+FIELDS = ("opened", "closed", "backlog", "resolve_p50", "resolve_p90")
+
+
+def same(a, b):
+    if a is None or b is None:
+        return a is b
+
+    return math.isclose(a, b, abs_tol=0.001)
+
+
+class Command(BaseCommand):
+    help = __doc__.strip().split("\n\n")[0]
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--check", action="store_true",
+            help="Report rows that differ from the issues, changing nothing.",
+        )
+        parser.add_argument("--batch", type=int, default=1000)
+
+    def handle(self, *args, **options):
+        # The archived conversations are part of the history too:
+        issues = itertools.chain.from_iterable(
+            model.objects.values_list(
+                "channel_id", "opened", "closed"
+            ).iterator()
+            for model in (ZenSlackChat, ArchivedChat)
+        )
+        expected = DailyStats.compute(issues)
+
+        if options["check"]:
+            self.check_rows(expected)
+
+        else:
+            with transaction.atomic():
+                DailyStats.objects.all().delete()
+                DailyStats.objects.bulk_create(
+                    [expected[key] for key in sorted(expected)],
+                    batch_size=options["batch"],
+                )
+            self.stdout.write(f"Rebuilt {len(expected)} daily stats rows.")
+
+    def check_rows(self, expected):
+        differences = 0
+        for row in DailyStats.objects.iterator():
+            wanted = expected.pop((row.channel_id, row.day), None)
+            if wanted is None:
+                differences += 1
+                self.stdout.write(
+                    f"{row.day} {row.channel_id}: no issues for this row"
+                )
+                continue
+
+            for field in FIELDS:
+                found, value = getattr(row, field), getattr(wanted, field)
+                if not same(found, value):
+                    differences += 1
+                    self.stdout.write(
+                        f"{row.day} {row.channel_id}: {field} is {found} "
+                        f"and should be {value}"
+                    )
+
+        for channel_id, day in sorted(expected):
+            differences += 1
+            self.stdout.write(f"{day} {channel_id}: row is missing")
+
+        if differences:
+            raise CommandError(
+                f"{differences} difference(s) found, run 'manage.py "
+                "daily_stats' to rebuild."
+            )
+
+        self.stdout.write("The daily stats match the issues.")
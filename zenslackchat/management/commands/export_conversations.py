@@ -0,0 +1,57 @@
+"""
+Export the conversations as CSV or NDJSON.
+
+The rows are read and written a page at a time (see zenslackchat.export), so
+the whole history can be exported without holding it in memory:
+
+    python manage.py export_conversations --format ndjson --output all.ndjson
+    python manage.py export_conversations --since 2024-01-01 --channel C0123
+
+"""
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from zenslackchat import export
+
+
+class Command(BaseCommand):
+    help = __doc__.strip().split("\n\n")[0]
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--format", choices=sorted(export.FORMATS), default="csv"
+        )
+        parser.add_argument(
+            "--since", help="Only conversations opened on or after this."
+        )
+        parser.add_argument(
+            "--until", help="Only conversations opened before this."
+        )
+        parser.add_argument("--channel", help="Only this channel's.")
+        parser.add_argument(
+            "--output", help="The file to write, the default is stdout."
+        )
+        parser.add_argument(
+            "--batch", type=int, default=settings.EXPORT_PAGE_SIZE
+        )
+
+    def handle(self, *args, **options):
+        try:
+            filters = dict(
+                since=export.parse_when(options["since"]),
+                until=export.parse_when(options["until"]),
+                channel_id=options["channel"],
+                size=options["batch"],
+            )
+
+        except ValueError as error:
+            raise CommandError(str(error))
+
+        chunks = export.stream(options["format"], **filters)
+        if options["output"]:
+            with open(options["output"], "w", newline="") as fd:
+                fd.writelines(chunks)
+
+        else:
+            for chunk in chunks:
+                self.stdout.write(chunk, ending="")
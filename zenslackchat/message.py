@@ -14,19 +14,29 @@ import logging
 import zenpy
 
 from webapp import settings
+from zenslackchat.follow_ups import in_background, result
 from zenslackchat.message_tools import (
     is_resolved,
+    message_hash,
     message_issue_zendesk_url,
     message_who_is_on_call,
     ts_to_datetime,
 )
+from zenslackchat.metrics import (
+    EVENTS_HANDLED,
+    EVENTS_IGNORED,
+    EVENTS_RECEIVED,
+    count_queries,
+)
 from zenslackchat.models import (
     NotFoundError,
     OutOfHoursInformation,
-    PagerDutyApp,
     ZenSlackChat,
 )
+from zenslackchat.oncall import PAGERDUTY, on_call_roster
 from zenslackchat.slack_api import message_url, post_message
+from zenslackchat.tracing import annotate, span, traced
+from zenslackchat.user_cache import profiles
 from zenslackchat.zendesk_api import (
     add_comment,
     close_ticket,
@@ -69,6 +79,8 @@ IGNORED_SUBTYPES = [
 # description and the bot was ignoring this.
 
 
+@traced("message.handler", root=True)
+@count_queries("message.handler")
 def handler(
     event,
     our_channel,
@@ -106,11 +118,14 @@ def handler(
     """
     log = logging.getLogger(__name__)
 
+    EVENTS_RECEIVED.inc()
+
     text = event.get("text", "")
 
     bot_id = event.get("bot_id")
     if bot_id and bot_id not in settings.ALLOWED_BOT_IDS:
         log.debug(f"Ignoring bot ({bot_id}) message to prevent repeats: {text}")
+        EVENTS_IGNORED.inc(reason="bot_id")
         return False
 
     channel_id = event.get("channel", "").strip()
@@ -120,11 +135,13 @@ def handler(
                 f"Ignoring event from channel id:<{channel_id} as its not from"
                 f"our support channel id:{our_channel}"
             )
+        EVENTS_IGNORED.inc(reason="channel")
         return False
 
     subtype = event.get("subtype")
     if subtype in IGNORED_SUBTYPES:
         log.debug(f"Ignoring subtype we don't handle: {subtype}")
+        EVENTS_IGNORED.inc(reason="subtype")
         return False
 
     if settings.DISABLE_MESSAGE_PROCESSING:
@@ -132,6 +149,7 @@ def handler(
             "MESSAGE HANDLING IS DISABLED! "
             f"Not handled from channel<{channel_id}>: {text}"
         )
+        EVENTS_IGNORED.inc(reason="disabled")
         return False
 
     log.debug(f"New message on support channel<{channel_id}>: {text}")
@@ -139,6 +157,7 @@ def handler(
     chat_id = event["ts"]
     # Only present in a new top-level message
     thread_id = event.get("thread_ts", "")
+    annotate(channel_id=channel_id, chat_id=chat_id, thread_id=thread_id)
 
     real_name = None
     recipient_email = None
@@ -150,16 +169,17 @@ def handler(
         slack_user_id = event["user"]
 
         # Recover the slack channel message author's email address. I assume
-        # this is always set on all accounts.
-        log.debug(f"Recovering profile for user <{slack_user_id}>")
-        resp = slack_client.users_info(user=slack_user_id)
-        # print(f"resp.event:\n{resp.event}\n")
-        real_name = resp.data["user"]["real_name"]
-        recipient_profile = resp.data["user"].get("profile")
+        # this is always set on all accounts. This is cached as the same
+        # people post all day.
+        with span("user_profile"):
+            user = profiles.get(slack_client, slack_user_id)
+        real_name = user["real_name"]
+        recipient_profile = user.get("profile")
         if not recipient_profile and not bot_id:
             log.error(
                 f"For slack user '{real_name}' I was not able to recover a profile."
             )
+            EVENTS_IGNORED.inc(reason="no_profile")
             return False
 
         recipient_email = None
@@ -171,6 +191,7 @@ def handler(
                     "email. Is the bot token scope users:read.email set? (Re)install "
                     "the slack app?"
                 )
+                EVENTS_IGNORED.inc(reason="no_email")
                 return False
 
     # zendesk ticket instance
@@ -189,6 +210,7 @@ def handler(
         except NotFoundError:
             # This could be an thread that happened before the bot was running:
             log.warning(f"No ticket found in slack {slack_chat_url}. Old thread?")
+            action = "old_thread"
 
         else:
             # If this is a command handle it otherwise ship it as a comment to
@@ -204,6 +226,7 @@ def handler(
                 log.debug(f"Closing ticket {ticket_id} from slack {slack_chat_url}.")
                 close_ticket(zendesk_client, ticket_id)
                 ZenSlackChat.resolve(channel_id, thread_id)
+                action = "resolve"
                 post_message(
                     slack_client,
                     thread_id,
@@ -212,6 +235,7 @@ def handler(
                 )
 
             elif command == "help":
+                action = "help"
                 post_message(
                     slack_client,
                     thread_id,
@@ -225,6 +249,7 @@ def handler(
 
             else:
                 if ticket.status == "closed":
+                    action = "ticket_closed"
                     post_message(
                         slack_client,
                         thread_id,
@@ -236,6 +261,8 @@ def handler(
                 else:
                     # Send this message on to Zendesk.
                     add_comment(zendesk_client, ticket, f"{real_name} (Slack): {text}")
+                    action = "comment"
+                    issue.remember_hashes({message_hash(text): chat_id})
 
     else:
         slack_chat_url = message_url(workspace_uri, channel_id, chat_id)
@@ -244,6 +271,12 @@ def handler(
         except NotFoundError:
             # No issue found. It looks like its new issue:
             log.debug(f"Received message from '{recipient_email}': {text}\n")
+
+            # Find out who is on call while the ticket is made and stored. Only
+            # PagerDuty's roster is posted and not at all with USE_ATLASSIAN:
+            roster = None
+            if not settings.USE_ATLASSIAN:
+                roster = in_background(on_call_roster, source=PAGERDUTY)
             try:
                 ticket = create_ticket(
                     zendesk_client,
@@ -263,11 +296,14 @@ def handler(
                     "🤖 I'm unable to talk to Zendesk (API Error).",
                 )
                 log.exception("Zendesk API error: ")
+                action = "zendesk_error"
 
             else:
                 # Store all the details and notify:
                 log.debug("open ticket")
-                ZenSlackChat.open(channel_id, chat_id, ticket_id=ticket.id)
+                action = "new_issue"
+                issue = ZenSlackChat.open(channel_id, chat_id, ticket_id=ticket.id)
+                issue.remember_hashes({message_hash(text): chat_id})
                 message_issue_zendesk_url(
                     slack_client, zendesk_uri, ticket.id, chat_id, channel_id
                 )
@@ -282,9 +318,8 @@ def handler(
                 #         channel_id,
                 #     )
                 # else:
-                app_token = PagerDutyApp.client()
                 message_who_is_on_call(
-                    PagerDutyApp.on_call(app_token=app_token),
+                    result(roster, {}),
                     slack_client,
                     chat_id,
                     channel_id,
@@ -304,5 +339,8 @@ def handler(
         else:
             # No, we have a ticket already for this.
             log.info(f"The issue '{text}' is already in Zendesk '{chat_id}'")
+            action = "existing_issue"
+
+    EVENTS_HANDLED.inc(action=action)
 
     return True
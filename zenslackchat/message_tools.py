@@ -11,6 +11,7 @@ Oisin Mulvihill
 """
 
 import datetime
+import functools
 import hashlib
 import logging
 import re
@@ -123,8 +124,30 @@ def strip_zendesk_origin(text):
     return text
 
 
-def strip_formatting(text):
-    """Strip all formatting returning only text."""
+# Text without any of these can't contain markdown, html or the '|' in slack
+# links and is left as is by markdown_to_text() apart from blank lines:
+_MARKUP = re.compile(
+    r"[\\`*_{}\[\]<>|~&]"  # markdown, html entities and slack links
+    r"|^[-+#=]"  # lists, headings and rules
+    r"|[^\S\n ]"  # tabs, carriage returns and other whitespace
+    r"|^ | $"  # leading or trailing spaces
+    r"|^\d+\.",  # ordered lists
+    re.MULTILINE,
+)
+
+# e.g. https://QUAY.IO|QUAY.IO
+_SLACK_URL = re.compile(r"(http|https):(\/\/)(.*?)\|")
+
+# A modified version of that from https://emailregex.com/
+_SLACK_EMAIL = re.compile(r"([a-zA-Z0-9_.+-]+@[a-zA-Z0-9-]+\.[a-zA-Z0-9-.]+\|)")
+
+
+def markdown_to_text(text):
+    """Strip all formatting by converting markdown to html and then to text.
+
+    This is the slow general case for strip_formatting().
+
+    """
     # md -> html -> text since BeautifulSoup can extract text cleanly
     html = markdown(text)
 
@@ -134,18 +157,32 @@ def strip_formatting(text):
 
     # Remove the markdown URLs that may be present after conversion e.g.
     # text like https://QUAY.IO|QUAY.IO leaving QUAY.IO
-    text = re.sub(r"(http|https):(\/\/)(.*?)\|", "", text)
+    text = _SLACK_URL.sub("", text)
 
-    # Regex a modified version of that from https://emailregex.com/
     # replace
     #   MAILER-DAEMON@eu-west-2...com|MAILER-DAEMON@eu-west-2...com
     # with
     #   MAILER-DAEMON@eu-west-2...com
-    text = re.sub(r"([a-zA-Z0-9_.+-]+@[a-zA-Z0-9-]+\.[a-zA-Z0-9-.]+\|)", "", text)
+    text = _SLACK_EMAIL.sub("", text)
 
     return text
 
 
+@functools.lru_cache(maxsize=4096)
+def strip_formatting(text):
+    """Strip all formatting returning only text.
+
+    Most messages are plain text. These only have their blank lines removed
+    which is what markdown_to_text() would do, without the cost of it. The
+    results are memoized as the same messages are compared over and over.
+
+    """
+    if _MARKUP.search(text) is None:
+        return "\n".join(line for line in text.split("\n") if line)
+
+    return markdown_to_text(text)
+
+
 def compare_hash(text):
     return hashlib.sha1(text.encode()).hexdigest()
 
@@ -169,7 +206,25 @@ def truncate_email(content, characters=320):
     return email_sample
 
 
-def messages_for_slack(slack, zendesk):
+def message_hash(text):
+    """Return the compare_hash() of the normalized message text."""
+    # convert '... :palm_tree:​ ...' to its emoji character 🌴
+    # Slack seems to use the name whereas zendesk uses the actual emoji:
+    return compare_hash(strip(text))
+
+
+def message_hashes(slack):
+    """Return the message_hash() for the given slack messages.
+
+    :param slack: A list of slack messages.
+
+    :returns: A dict of hash to the message 'ts' or "" if not present.
+
+    """
+    return {message_hash(msg["text"]): msg.get("ts", "") for msg in slack}
+
+
+def messages_for_slack(slack, zendesk, known=None):
     """Work out which messages from zendesk need to be added to the slack
     conversation.
 
@@ -177,21 +232,16 @@ def messages_for_slack(slack, zendesk):
 
     :param zendesk: A list of zendesk comment message.
 
+    :param known: An optional set of message_hashes() already seen on slack.
+
     :returns: An empty list or list of messages to be added.
 
     """
     log = logging.getLogger(__name__)
 
-    lookup = {}
-    for msg in slack:
-        # text = msg['text']
-        # convert '... :palm_tree:​ ...' to its emoji character 🌴
-        # Slack seems to use the name whereas zendesk uses the actual emoji:
-        text = strip(msg["text"])
-        # log.debug(
-        #     f"Text to store for lookup:'{text}' hash:{compare_hash(text)}"
-        # )
-        lookup[compare_hash(text)] = 1
+    lookup = set(message_hashes(slack))
+    if known:
+        lookup |= known
 
     # remove api messages which come from slack
     for_slack = []
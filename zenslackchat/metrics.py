@@ -0,0 +1,700 @@
+"""
+Count what the bot does and export it in the Prometheus text format.
+
+A QueryCounter wraps the database connection for the duration of a handler
+call, celery task or request. Every query run in that time is counted. The
+totals are kept per name for this process (see snapshot()) and each run is
+logged, with a warning when a name goes over its entry in QUERY_BUDGETS. The
+same budgets are enforced by tests/test_query_budgets.py.
+
+The counters and histograms below are served from /metrics (see render()).
+With METRICS_BACKEND=redis (the default) each process adds its increments to
+a hash in redis every METRICS_FLUSH_SECONDS. That way the web threads and
+every celery worker process are counted together, whichever process is
+scraped. METRICS_BACKEND=local keeps them in this process only.
+
+"""
+import atexit
+import functools
+import json
+import logging
+import threading
+import time
+
+from asgiref.sync import iscoroutinefunction
+from asgiref.sync import markcoroutinefunction
+from django.conf import settings
+from django.db import connection
+
+from zenslackchat.tracing import span
+
+
+# Most queries each code path is expected to make, checked by the tests. New
+# and resolved issues also update DailyStats, which takes 2-3 queries or 5-6
+# for the first on the day:
+QUERY_BUDGETS = {
+    "message.handler": 8,
+    "zendesk.comments_from_zendesk": 4,
+    "zendesk.email_from_zendesk": 6,
+    "zenslackchat.daily_summary": 1,
+    "view:admin:zenslackchat_zenslackchat_changelist": 9,
+}
+
+DURATION_BUCKETS = (
+    0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0
+)
+
+METRICS_KEY = "zenslackchat-metrics"
+
+
+def sample_name(name, labels):
+    """Return e.g. 'name{a="1",b="2"}' for the (sorted) labels."""
+    if not labels:
+        return name
+
+    def escape(value):
+        return (
+            str(value).replace("\\", "\\\\").replace("\n", "\\n")
+            .replace('"', '\\"')
+        )
+
+    inner = ",".join(f'{key}="{escape(value)}"' for key, value in labels)
+    return f"{name}{{{inner}}}"
+
+
+def format_value(value):
+    if value == int(value):
+        return str(int(value))
+    return repr(float(value))
+
+
+class LocalBackend(object):
+    """Keeps the series in this process.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def inc(self, key, amount):
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def values(self):
+        with self._lock:
+            return dict(self._values)
+
+    def flush(self):
+        pass
+
+    def clear(self):
+        with self._lock:
+            self._values.clear()
+
+
+class RedisBackend(object):
+    """Adds this process's series to totals in redis shared by all processes.
+
+    Increments are gathered here and sent in one pipeline at most every
+    flush_seconds. If redis can't be reached they are kept for the next try.
+
+    """
+    def __init__(self, url, flush_seconds):
+        import redis
+
+        self._client = redis.Redis.from_url(url)
+        self._flush_seconds = flush_seconds
+        self._lock = threading.Lock()
+        self._pending = {}
+        self._flushed = time.monotonic()
+
+    def inc(self, key, amount):
+        with self._lock:
+            self._pending[key] = self._pending.get(key, 0) + amount
+            due = time.monotonic() - self._flushed >= self._flush_seconds
+
+        if due:
+            self.flush()
+
+    def flush(self):
+        log = logging.getLogger(__name__)
+
+        with self._lock:
+            pending, self._pending = self._pending, {}
+            self._flushed = time.monotonic()
+
+        if not pending:
+            return
+
+        try:
+            pipe = self._client.pipeline(transaction=False)
+            for key, amount in pending.items():
+                pipe.hincrbyfloat(METRICS_KEY, json.dumps(key), amount)
+            pipe.execute()
+
+        except:  # noqa: I'm logging rather than hidding.
+            log.exception("Unable to send metrics to redis: ")
+            with self._lock:
+                for key, amount in pending.items():
+                    self._pending[key] = self._pending.get(key, 0) + amount
+
+    def values(self):
+        self.flush()
+        returned = {}
+        for key, value in self._client.hgetall(METRICS_KEY).items():
+            family, name, labels = json.loads(key)
+            labels = tuple(tuple(label) for label in labels)
+            returned[(family, name, labels)] = float(value)
+
+        return returned
+
+    def clear(self):
+        with self._lock:
+            self._pending.clear()
+        self._client.delete(METRICS_KEY)
+
+
+class Exporter(object):
+    """The registered metrics and the backend their values are kept in.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._metrics = []
+        self._backend = None
+        self._backend_name = None
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    @property
+    def backend(self):
+        name = settings.METRICS_BACKEND
+        if name != self._backend_name:
+            with self._lock:
+                if name != self._backend_name:
+                    if name == "redis":
+                        self._backend = RedisBackend(
+                            settings.REDIS_URL, settings.METRICS_FLUSH_SECONDS
+                        )
+                    else:
+                        self._backend = LocalBackend()
+                    self._backend_name = name
+
+        return self._backend
+
+    def inc(self, key, amount):
+        """Add to a series. This never raises as it is called everywhere."""
+        try:
+            self.backend.inc(key, amount)
+
+        except:  # noqa: I'm logging rather than hidding.
+            logging.getLogger(__name__).exception(f"Unable to count {key}: ")
+
+    def flush(self):
+        if self._backend is not None:
+            self._backend.flush()
+
+    def clear(self):
+        self.backend.clear()
+
+    def values(self):
+        return self.backend.values()
+
+    def render(self):
+        """Return all the series in the Prometheus text format."""
+        values = self.values()
+        by_family = {}
+        for (family, name, labels), value in values.items():
+            by_family.setdefault(family, []).append((name, labels, value))
+
+        lines = []
+        for metric in self._metrics:
+            samples = metric.samples(values, by_family.get(metric.name, []))
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            for name, labels, value in samples:
+                lines.append(
+                    f"{sample_name(name, labels)} {format_value(value)}"
+                )
+
+        return "\n".join(lines) + "\n"
+
+
+exporter = Exporter()
+
+atexit.register(exporter.flush)
+
+
+class Counter(object):
+    """A total that only goes up e.g. events handled.
+    """
+    kind = "counter"
+
+    def __init__(self, name, help, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        exporter.register(self)
+
+    def labels(self, labels):
+        return tuple(sorted(labels.items()))
+
+    def inc(self, amount=1, **labels):
+        exporter.inc((self.name, self.name, self.labels(labels)), amount)
+
+    def samples(self, values, stored):
+        return sorted(stored, key=lambda sample: sample[1])
+
+
+class Histogram(Counter):
+    """Counts of values e.g. latency in seconds, by bucket upper bound.
+    """
+    kind = "histogram"
+
+    def __init__(self, name, help, labelnames=(), buckets=DURATION_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = buckets
+
+    def observe(self, value, **labels):
+        labels = self.labels(labels)
+        bucket = f"{self.name}_bucket"
+        # Buckets are cumulative, so every one the value fits in is counted:
+        for bound in self.buckets:
+            if value <= bound:
+                exporter.inc(
+                    (self.name, bucket, labels + (("le", repr(bound)),)), 1
+                )
+        exporter.inc((self.name, bucket, labels + (("le", "+Inf"),)), 1)
+        exporter.inc((self.name, f"{self.name}_sum", labels), value)
+        exporter.inc((self.name, f"{self.name}_count", labels), 1)
+
+    def samples(self, values, stored):
+        def order(sample):
+            name, labels, _ = sample
+            rest = tuple(label for label in labels if label[0] != "le")
+            le = dict(labels).get("le", "+Inf")
+            bound = float("inf") if le == "+Inf" else float(le)
+            return (rest, not name.endswith("_bucket"), name, bound)
+
+        return sorted(stored, key=order)
+
+
+class Gauge(Counter):
+    """A value that goes up and down e.g. messages waiting to be sent.
+
+    :param collect: Optional. If given the value is worked out when scraped
+    by calling collect with the stored values. It returns a list of (dict of
+    labels, value). Otherwise inc() and dec() keep the value.
+
+    """
+    kind = "gauge"
+
+    def __init__(self, name, help, labelnames=(), collect=None):
+        super().__init__(name, help, labelnames)
+        self.collect = collect
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+    def samples(self, values, stored):
+        log = logging.getLogger(__name__)
+
+        if self.collect is None:
+            return super().samples(values, stored)
+
+        try:
+            found = self.collect(values)
+
+        except:  # noqa: I'm logging rather than hidding.
+            log.exception(f"Unable to collect {self.name}: ")
+            found = []
+
+        return [
+            (self.name, self.labels(labels), value) for labels, value in found
+        ]
+
+
+EVENTS_RECEIVED = Counter(
+    "zenslackchat_events_received_total",
+    "Slack events given to the message handler.",
+)
+
+EVENTS_IGNORED = Counter(
+    "zenslackchat_events_ignored_total",
+    "Slack events the message handler ignored, by reason.",
+    ("reason",),
+)
+
+EVENTS_HANDLED = Counter(
+    "zenslackchat_events_handled_total",
+    "Slack events the message handler acted on, by what it did.",
+    ("action",),
+)
+
+DURATION = Histogram(
+    "zenslackchat_duration_seconds",
+    "How long handlers, views (incl. webhooks) and celery tasks took.",
+    ("name",),
+)
+
+DB_QUERIES = Counter(
+    "zenslackchat_db_queries_total",
+    "Database queries made by handlers, views and celery tasks.",
+    ("name",),
+)
+
+API_DURATION = Histogram(
+    "zenslackchat_api_duration_seconds",
+    "How long calls to Slack, Zendesk, PagerDuty and Confluence took.",
+    ("service", "method"),
+)
+
+API_ERRORS = Counter(
+    "zenslackchat_api_errors_total",
+    "Calls to Slack, Zendesk, PagerDuty and Confluence that failed.",
+    ("service", "method", "error"),
+)
+
+CACHE_REQUESTS = Counter(
+    "zenslackchat_cache_requests_total",
+    "Cache lookups by cache and result (hit, shared_hit or miss).",
+    ("cache", "result"),
+)
+
+
+def cache_hit_ratios(values):
+    """The hits (local or shared) over all lookups for each cache."""
+    totals = {}
+    for (family, _, labels), value in values.items():
+        if family == CACHE_REQUESTS.name:
+            labels = dict(labels)
+            found = totals.setdefault(labels["cache"], [0, 0])
+            found[1] += value
+            if labels["result"] != "miss":
+                found[0] += value
+
+    return [
+        (dict(cache=name), hits / lookups)
+        for name, (hits, lookups) in sorted(totals.items()) if lookups
+    ]
+
+
+CACHE_HIT_RATIO = Gauge(
+    "zenslackchat_cache_hit_ratio",
+    "The share of cache lookups that were hits.",
+    ("cache",),
+    collect=cache_hit_ratios,
+)
+
+
+def queue_length(client, queue):
+    """The messages waiting on a celery queue in the redis broker.
+
+    Kombu keeps each priority level in its own list next to the queue's.
+
+    """
+    names = [queue] + [f"{queue}\x06\x16{step}" for step in (3, 6, 9)]
+    pipe = client.pipeline(transaction=False)
+    for name in names:
+        pipe.llen(name)
+    return sum(pipe.execute())
+
+
+def celery_queue_lengths(values):
+    import redis
+
+    queues = ["celery"] + [
+        f"slack-events-{index}" for index in range(settings.SLACK_EVENT_QUEUES)
+    ]
+    client = redis.Redis.from_url(settings.CELERY_BROKER_URL)
+    try:
+        return [
+            (dict(queue=queue), queue_length(client, queue))
+            for queue in queues
+        ]
+
+    finally:
+        client.close()
+
+
+CELERY_QUEUE_LENGTH = Gauge(
+    "zenslackchat_celery_queue_length",
+    "Tasks waiting on each celery queue.",
+    ("queue",),
+    collect=celery_queue_lengths,
+)
+
+
+SLACK_QUEUED = Gauge(
+    "zenslackchat_slack_queued",
+    "Slack calls waiting for their turn or a rate limit, by method.",
+    ("method",),
+)
+
+SLACK_WAIT = Histogram(
+    "zenslackchat_slack_wait_seconds",
+    "How long Slack calls waited for their turn and the rate limits.",
+    ("method",),
+)
+
+SLACK_RATE_LIMITED = Counter(
+    "zenslackchat_slack_rate_limited_total",
+    "Slack calls refused with HTTP 429 and retried after Retry-After.",
+    ("method",),
+)
+
+
+ZENDESK_BUDGET_WAIT = Histogram(
+    "zenslackchat_zendesk_budget_wait_seconds",
+    "How long Zendesk calls waited for the shared rate budget, by priority.",
+    ("priority",),
+)
+
+ZENDESK_RATE_LIMITED = Counter(
+    "zenslackchat_zendesk_rate_limited_total",
+    "Zendesk calls refused with HTTP 429, by priority.",
+    ("priority",),
+)
+
+
+ASYNC_IN_FLIGHT = Gauge(
+    "zenslackchat_async_in_flight",
+    "Requests the async views are waiting on their handlers for, by view.",
+    ("view",),
+)
+
+ASYNC_BACKLOG = Gauge(
+    "zenslackchat_async_backlog",
+    "Events the async views acknowledged and are still handling, by view.",
+    ("view",),
+)
+
+
+def zendesk_rate_remaining(values):
+    from zenslackchat.zendesk_budget import budget
+
+    remaining, limit = budget.remaining()
+    found = []
+    if remaining is not None:
+        found.append((dict(kind="remaining"), remaining))
+    if limit is not None:
+        found.append((dict(kind="limit"), limit))
+    return found
+
+
+ZENDESK_RATE = Gauge(
+    "zenslackchat_zendesk_rate",
+    "Zendesk's per-minute API limit and the calls left this minute.",
+    ("kind",),
+    collect=zendesk_rate_remaining,
+)
+
+
+def render():
+    """Return every series in the Prometheus text format."""
+    return exporter.render()
+
+
+class ApiCall(object):
+    """Time an outbound call, count it if it fails and trace it as a span.
+
+    This is a context manager, or decorates a function to run each call to
+    it in a new ApiCall. Set error to count a failure that didn't raise.
+
+    """
+    def __init__(self, service, method):
+        self.service = service
+        self.method = method
+        self.error = None
+        self._span = None
+        self._started = None
+
+    def __call__(self, func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with ApiCall(self.service, self.method):
+                return func(*args, **kwargs)
+        return wrapper
+
+    def __enter__(self):
+        self._span = span(f"{self.service}.{self.method}")
+        self._span.__enter__()
+        self._started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        API_DURATION.observe(
+            time.perf_counter() - self._started,
+            service=self.service, method=self.method,
+        )
+        error = exc_type.__name__ if exc_type is not None else self.error
+        if error:
+            API_ERRORS.inc(service=self.service, method=self.method, error=error)
+
+        return self._span.__exit__(exc_type, exc, tb)
+
+
+def api_call(service, method):
+    """Time a call to service e.g. api_call('zendesk', 'get_ticket').
+    """
+    return ApiCall(service, method)
+
+
+class QueryStats(object):
+    """The queries counted for one name in this process.
+    """
+    def __init__(self):
+        self.calls = 0
+        self.queries = 0
+        self.max = 0
+        self.last = 0
+        self.over_budget = 0
+        self.seconds = 0.0
+
+    def as_dict(self):
+        return dict(
+            calls=self.calls,
+            queries=self.queries,
+            max=self.max,
+            last=self.last,
+            over_budget=self.over_budget,
+            seconds=self.seconds,
+        )
+
+
+class QueryMetrics(object):
+    """A thread safe store of QueryStats by name.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stats = {}
+
+    def record(self, name, queries, seconds):
+        """Add a run of the named code path.
+
+        :param name: e.g. 'message.handler'.
+
+        :param queries: How many queries the run made.
+
+        :param seconds: How long the run took.
+
+        """
+        log = logging.getLogger(__name__)
+
+        budget = QUERY_BUDGETS.get(name)
+        over = budget is not None and queries > budget
+
+        with self._lock:
+            stats = self._stats.setdefault(name, QueryStats())
+            stats.calls += 1
+            stats.queries += queries
+            stats.max = max(stats.max, queries)
+            stats.last = queries
+            stats.seconds += seconds
+            if over:
+                stats.over_budget += 1
+
+        DURATION.observe(seconds, name=name)
+        if queries:
+            DB_QUERIES.inc(queries, name=name)
+
+        if over:
+            log.warning(
+                f"{name} made {queries} queries, over its budget of {budget}"
+            )
+        else:
+            log.debug(f"{name} made {queries} queries in {seconds:.3f}s")
+
+    def snapshot(self):
+        """Return dict(name=dict(calls=.., queries=.., max=.., ...)).
+        """
+        with self._lock:
+            return {
+                name: stats.as_dict() for name, stats in self._stats.items()
+            }
+
+    def reset(self):
+        with self._lock:
+            self._stats.clear()
+
+
+metrics = QueryMetrics()
+
+
+class QueryCounter(object):
+    """Count the queries made on this thread's connection while running.
+
+    This can be used as a context manager or started and stopped by hand,
+    e.g. from celery's task_prerun and task_postrun signals.
+
+    """
+    def __init__(self, name):
+        self.name = name
+        self.queries = 0
+        self._started = None
+
+    def __call__(self, execute, sql, params, many, context):
+        self.queries += 1
+        return execute(sql, params, many, context)
+
+    def start(self):
+        self._started = time.perf_counter()
+        connection.execute_wrappers.append(self)
+
+    def stop(self):
+        if self in connection.execute_wrappers:
+            connection.execute_wrappers.remove(self)
+        metrics.record(
+            self.name, self.queries, time.perf_counter() - self._started
+        )
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+
+def count_queries(name):
+    """Decorate a function so its queries are counted under name.
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with QueryCounter(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+class QueryCountMiddleware(object):
+    """Count the queries made by each request by the name of its view.
+
+    Under ASGI the queries are made on other threads, where the async views
+    run their handlers, so requests are passed straight through.
+
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+
+        counter = QueryCounter("view:unresolved")
+        with counter:
+            response = self.get_response(request)
+            match = getattr(request, "resolver_match", None)
+            if match:
+                counter.name = f"view:{match.view_name}"
+
+        return response
+
+    async def __acall__(self, request):
+        return await self.get_response(request)
@@ -0,0 +1,50 @@
+# Generated by Django 4.2.19 on 2026-10-18 01:02
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("zenslackchat", "0010_auto_20210312_1119"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="zenslackchat",
+            name="slack_cursor",
+            field=models.CharField(blank=True, default="", max_length=20),
+        ),
+        migrations.AddField(
+            model_name="zenslackchat",
+            name="zendesk_cursor",
+            field=models.BigIntegerField(blank=True, null=True),
+        ),
+        migrations.CreateModel(
+            name="MessageHash",
+            fields=[
+                (
+                    "id",
+                    models.AutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("digest", models.CharField(max_length=40)),
+                (
+                    "issue",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="hashes",
+                        to="zenslackchat.zenslackchat",
+                    ),
+                ),
+            ],
+            options={
+                "unique_together": {("issue", "digest")},
+            },
+        ),
+    ]
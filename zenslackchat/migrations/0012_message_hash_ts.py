@@ -0,0 +1,18 @@
+# Generated by Django 4.2.19 on 2026-10-18 01:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("zenslackchat", "0011_sync_cursors"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="messagehash",
+            name="ts",
+            field=models.CharField(blank=True, default="", max_length=20),
+        ),
+    ]
@@ -0,0 +1,68 @@
+# Generated by Django 4.2.19 on 2026-10-18 02:05
+
+from django.db import migrations, models
+
+
+def clear_non_numeric_ticket_ids(apps, schema_editor):
+    """Trim the ticket IDs and clear any that aren't a number.
+
+    These can't be converted to an integer, and the ticket can't be looked up
+    in Zendesk by them either.
+
+    """
+    ZenSlackChat = apps.get_model("zenslackchat", "ZenSlackChat")
+
+    odd = ZenSlackChat.objects.exclude(ticket_id__regex=r"^[0-9]+$")
+    for issue in odd.only("ticket_id").iterator():
+        ticket_id = (issue.ticket_id or "").strip()
+        if not ticket_id.isdigit():
+            ticket_id = None
+
+        if ticket_id != issue.ticket_id:
+            issue.ticket_id = ticket_id
+            issue.save(update_fields=["ticket_id"])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("zenslackchat", "0012_message_hash_ts"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="zenslackchat",
+            name="ticket_id",
+            field=models.CharField(blank=True, max_length=20, null=True),
+        ),
+        migrations.RunPython(
+            clear_non_numeric_ticket_ids, migrations.RunPython.noop
+        ),
+        migrations.AlterField(
+            model_name="zenslackchat",
+            name="ticket_id",
+            field=models.BigIntegerField(blank=True, null=True),
+        ),
+        migrations.AddIndex(
+            model_name="zenslackchat",
+            index=models.Index(
+                fields=["ticket_id", "chat_id"], name="zenslackchat_ticket_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="zenslackchat",
+            index=models.Index(
+                condition=models.Q(("active", True)),
+                fields=["-opened"],
+                name="zenslackchat_open_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="zenslackchat",
+            index=models.Index(
+                condition=models.Q(("closed__isnull", False)),
+                fields=["closed"],
+                name="zenslackchat_closed_idx",
+            ),
+        ),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 4.2.19 on 2026-10-18 02:13
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("zenslackchat", "0013_ticket_id_indexes"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="DailyStats",
+            fields=[
+                (
+                    "id",
+                    models.AutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("day", models.DateField()),
+                ("channel_id", models.CharField(max_length=22)),
+                ("opened", models.PositiveIntegerField(default=0)),
+                ("closed", models.PositiveIntegerField(default=0)),
+                ("backlog", models.IntegerField(default=0)),
+                ("resolve_p50", models.FloatField(blank=True, null=True)),
+                ("resolve_p90", models.FloatField(blank=True, null=True)),
+            ],
+            options={
+                "verbose_name_plural": "daily stats",
+                "unique_together": {("channel_id", "day")},
+            },
+        ),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 4.2.19 on 2026-10-18 02:37
+
+from django.db import migrations, models
+import zenslackchat.models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("zenslackchat", "0014_daily_stats"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ArchivedChat",
+            fields=[
+                ("id", models.IntegerField(primary_key=True, serialize=False)),
+                ("channel_id", models.CharField(max_length=22)),
+                ("chat_id", models.CharField(max_length=20)),
+                ("ticket_id", models.BigIntegerField(blank=True, null=True)),
+                ("active", models.BooleanField(default=False)),
+                ("opened", models.DateTimeField()),
+                ("closed", models.DateTimeField(blank=True, null=True)),
+                ("zendesk_cursor", models.BigIntegerField(blank=True, null=True)),
+                (
+                    "slack_cursor",
+                    models.CharField(blank=True, default="", max_length=20),
+                ),
+                ("hashes", models.JSONField(blank=True, default=list)),
+                ("archived", models.DateTimeField(default=zenslackchat.models.utcnow)),
+            ],
+            options={
+                "indexes": [
+                    models.Index(
+                        fields=["ticket_id", "chat_id"], name="archivedchat_ticket_idx"
+                    )
+                ],
+                "unique_together": {("channel_id", "chat_id")},
+            },
+        ),
+    ]
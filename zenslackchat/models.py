@@ -1,18 +1,30 @@
 # -*- coding: utf-8 -*-
 import logging
+import math
+import threading
+import time
+from collections import defaultdict
 from datetime import datetime, timedelta, timezone
 from operator import itemgetter
 
 import requests
-import requests.adapters
+from dateutil.parser import parse
 from django.conf import settings
+from django.core.cache import cache
 from django.db import models
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
 from slack import WebClient
 from zenpy import Zenpy
 
 from zenslackchat import slack_api
+from zenslackchat.client_registry import registry
+from zenslackchat.metrics import api_call
+from zenslackchat.metrics import count_queries
 from zenslackchat.slack_api import post_message
-from zenslackchat.atlassian_api import call_atlassian
+from zenslackchat.tracing import traced
+from zenslackchat.zendesk_budget import BudgetAdapter
 
 
 def utcnow():
@@ -42,7 +54,7 @@ class ZenSlackChat(models.Model):
 
     # The ID of the linked issue in Zendesk:
     # e.g. 3451
-    ticket_id = models.CharField(max_length=20)
+    ticket_id = models.BigIntegerField(null=True, blank=True)
 
     # Set to True if the chat bot is monitoring this chat:
     active = models.BooleanField(default=True)
@@ -55,10 +67,94 @@ class ZenSlackChat(models.Model):
     # When the issue was resolved:
     closed = models.DateTimeField(null=True, blank=True)
 
+    # The ID of the last Zendesk comment synced to slack:
+    zendesk_cursor = models.BigIntegerField(null=True, blank=True)
+
+    # The 'ts' of the last slack reply seen when syncing from Zendesk:
+    slack_cursor = models.CharField(max_length=20, blank=True, default="")
+
     class Meta:
         unique_together = (("channel_id", "chat_id"),)
+        indexes = [
+            # get_by_ticket() and lookups by ticket_id alone:
+            models.Index(
+                fields=["ticket_id", "chat_id"], name="zenslackchat_ticket_idx"
+            ),
+            # open_issues() only wants the few active rows, newest first:
+            models.Index(
+                fields=["-opened"],
+                name="zenslackchat_open_idx",
+                condition=models.Q(active=True),
+            ),
+            # daily_summary() counts the issues closed on a day:
+            models.Index(
+                fields=["closed"],
+                name="zenslackchat_closed_idx",
+                condition=models.Q(closed__isnull=False),
+            ),
+        ]
+
+    def hash_index(self):
+        """Return the message hashes and slack message ts already seen.
+
+        :returns: (set of digests, set of slack 'ts')
+
+        A slack message whose 'ts' is known doesn't need to be hashed again.
+
+        """
+        digests, mirrored = set(), set()
+        for digest, ts in self.hashes.values_list("digest", "ts"):
+            digests.add(digest)
+            if ts:
+                mirrored.add(ts)
+
+        return digests, mirrored
+
+    @traced("db.ZenSlackChat.remember_hashes")
+    def remember_hashes(self, digests):
+        """Store message hashes seen in this conversation.
+
+        :param digests: A dict of message_tools.compare_hash() results to the
+        slack message 'ts' it came from or "" if not known.
+
+        Hashes already stored are ignored.
+
+        """
+        MessageHash.objects.bulk_create(
+            [
+                MessageHash(issue=self, digest=digest, ts=ts or "")
+                for digest, ts in digests.items()
+            ],
+            ignore_conflicts=True,
+        )
+
+    def advance_cursors(self, zendesk_cursor=None, slack_cursor=None):
+        """Move the sync cursors forward, never back.
+
+        :param zendesk_cursor: The optional ID of the newest comment synced.
+
+        :param slack_cursor: The optional 'ts' of the newest reply seen.
+
+        """
+        update_fields = []
+
+        if zendesk_cursor is not None and (
+            self.zendesk_cursor is None or zendesk_cursor > self.zendesk_cursor
+        ):
+            self.zendesk_cursor = zendesk_cursor
+            update_fields.append("zendesk_cursor")
+
+        if slack_cursor and (
+            not self.slack_cursor or float(slack_cursor) > float(self.slack_cursor)
+        ):
+            self.slack_cursor = slack_cursor
+            update_fields.append("slack_cursor")
+
+        if update_fields:
+            self.save(update_fields=update_fields)
 
     @classmethod
+    @traced("db.ZenSlackChat.open")
     def open(cls, channel_id, chat_id, ticket_id=None, opened=None):
         """Create a new issue for the chat bot to monitor.
 
@@ -72,6 +168,8 @@ class ZenSlackChat(models.Model):
 
         :returns: A ZenSlackChat instance.
 
+        The issue is counted in DailyStats.
+
         """
         kwargs = dict(channel_id=channel_id, chat_id=chat_id, ticket_id=ticket_id)
 
@@ -82,10 +180,12 @@ class ZenSlackChat(models.Model):
 
         issue = cls(**kwargs)
         issue.save()
+        DailyStats.record(DailyStats.record_opened, issue)
 
         return issue
 
     @classmethod
+    @traced("db.ZenSlackChat.get")
     def get(cls, channel_id, chat_id):
         """Get a specific conversation.
 
@@ -96,13 +196,16 @@ class ZenSlackChat(models.Model):
         :returns: A ZenSlackChat instance.
 
         If nothing is found for channel_id and chat_id then NotFoundError will
-        be raised.
+        be raised. An archived conversation is restored (see ArchivedChat).
 
         """
         try:
             found = cls.objects.get(channel_id=channel_id, chat_id=chat_id)
 
         except cls.DoesNotExist:
+            found = ArchivedChat.restore(channel_id=channel_id, chat_id=chat_id)
+
+        if found is None:
             raise NotFoundError(
                 f"Nothing found for channel_id:<{channel_id}> and "
                 f"chat_id:<{chat_id}>"
@@ -121,13 +224,21 @@ class ZenSlackChat(models.Model):
         :returns: A ZenSlackChat instance.
 
         If nothing is found for chat_id and ticket_id then NotFoundError will
-        be raised.
+        be raised. This includes a ticket_id that isn't a number. An archived
+        conversation is restored (see ArchivedChat).
 
         """
         try:
-            found = cls.objects.get(chat_id=chat_id, ticket_id=ticket_id)
+            lookup = dict(chat_id=chat_id, ticket_id=int(ticket_id))
+            found = cls.objects.get(**lookup)
+
+        except (TypeError, ValueError):
+            found = None
 
         except cls.DoesNotExist:
+            found = ArchivedChat.restore(**lookup)
+
+        if found is None:
             raise NotFoundError(
                 f"Nothing found for chat_id:<{chat_id}> and " f"ticket_id:<{ticket_id}>"
             )
@@ -135,6 +246,7 @@ class ZenSlackChat(models.Model):
         return found
 
     @classmethod
+    @traced("db.ZenSlackChat.resolve")
     def resolve(cls, channel_id, chat_id, closed=None):
         """Close the issue and stop the bot monitoring this chat.
 
@@ -147,10 +259,14 @@ class ZenSlackChat(models.Model):
         :returns: The resolved ZenSlackChat instance.
 
         The active flag will be cleared and the closed timestamp set. The bot
-        should stop monitoring this chat.
+        should stop monitoring this chat. The issue is counted in DailyStats.
+        An issue that is already resolved is left as it is.
 
         """
         issue = cls.get(channel_id, chat_id)
+        if not issue.active:
+            # Already resolved, keep when that was:
+            return issue
 
         issue.active = False
         if closed:
@@ -158,6 +274,7 @@ class ZenSlackChat(models.Model):
         else:
             issue.closed = utcnow()
         issue.save()
+        DailyStats.record(DailyStats.record_closed, issue)
 
         return issue
 
@@ -174,6 +291,7 @@ class ZenSlackChat(models.Model):
         return list(cls.objects.filter(active=True).order_by("-opened").all())
 
     @classmethod
+    @count_queries("zenslackchat.daily_summary")
     def daily_summary(cls, workspace_uri, when=None):
         """Generate the data for the daily report.
 
@@ -185,6 +303,9 @@ class ZenSlackChat(models.Model):
         just those for the yesterday. Only yesterday's closed tickets on are
         counted.
 
+        The open and the closed issues are recovered in one query, as plain
+        values rather than model instances.
+
         :returns: A dict(open=[..links to slack issues..], closed=<a count>)
 
         """
@@ -218,42 +339,44 @@ class ZenSlackChat(models.Model):
 
         returned = dict(open=[], closed=0)
 
-        for issue in cls.open_issues():
-            returned["open"].append(
-                slack_api.message_url(
-                    workspace_uri,
-                    issue.channel_id,
-                    issue.chat_id,
-                )
+        issues = (
+            cls.objects.filter(
+                models.Q(active=True) | models.Q(closed__range=(day_begin, day_end))
             )
+            .order_by("-opened")
+            .values_list("channel_id", "chat_id", "active", "closed")
+        )
+        for channel_id, chat_id, active, closed in issues.iterator():
+            if active:
+                returned["open"].append(
+                    slack_api.message_url(workspace_uri, channel_id, chat_id)
+                )
 
-        returned["closed"] = cls.objects.filter(
-            closed__range=(day_begin, day_end)
-        ).count()
+            if closed and day_begin <= closed <= day_end:
+                returned["closed"] += 1
 
         return returned
 
     @classmethod
-    def daily_report(cls, report):
-        """Generate the daily report text for the given report.
+    def daily_report_lines(cls, report):
+        """Generate the lines of the daily report text for the given report.
 
         :param report: The result of a cls.daily_summary call().
 
-        :returns: A plain text report that could be sent to interested parties.
+        :returns: A generator of the lines. The introduction for the Platform
+        bot is given as one block of lines.
 
         """
         closed = report["closed"]
 
         open = len(report["open"])
 
-        links = []
-        for link in report["open"]:
-            links.append(f"- {link}")
-        links = "\n".join(links)
-
         if settings.USE_ATLASSIAN:
-            on_call = call_atlassian()
-            report = f"""
+            # Imported here as zenslackchat.oncall uses these models:
+            from zenslackchat.oncall import on_call_roster
+
+            on_call = on_call_roster()
+            yield f"""
 Welcome to DBT Platform, this space is for raising any support requests or issues you encounter with the platform.
 
 Today's Primary/Secondary Support:
@@ -283,32 +406,397 @@ Platform Helper: 13.1.0
 ```
 
 If this relates to earlier issue, include a link to the previous ticket.
+""".strip()
+            yield ""
+            yield ""
+            yield "📊 Daily Platform Issue Report"
 
+        else:
+            yield "📊 Daily WebOps SRE Issue Report"
 
-📊 Daily Platform Issue Report
+        yield ""
+        yield f"Closed 🤘: {closed}"
+        yield ""
+        yield f"Unresolved 🔥: {open}"
 
-Closed 🤘: {closed}
+        for link in report["open"]:
+            yield f"- {link}"
 
-Unresolved 🔥: {open}
-{links}
+        yield ""
+        if settings.USE_ATLASSIAN:
+            yield "🤖 PlatformZenSlackChat"
 
-🤖 PlatformZenSlackChat
-        """.strip()
         else:
-            report = f"""
-📊 Daily WebOps SRE Issue Report
+            yield "Cheers,"
+            yield ""
+            yield "🤖 ZenSlackChat"
+
+    @classmethod
+    def daily_report(cls, report):
+        """Generate the daily report text for the given report.
+
+        :param report: The result of a cls.daily_summary call().
+
+        :returns: A plain text report that could be sent to interested parties.
+
+        """
+        return "\n".join(cls.daily_report_lines(report))
+
+    @classmethod
+    def daily_report_messages(cls, report):
+        """Split the daily report into messages Slack will take.
+
+        :param report: The result of a cls.daily_summary call().
+
+        :returns: A generator of the messages, each no longer than
+        DAILY_REPORT_MESSAGE_SIZE characters.
+
+        """
+        return slack_api.chunked(
+            cls.daily_report_lines(report), settings.DAILY_REPORT_MESSAGE_SIZE
+        )
+
+
+class MessageHash(models.Model):
+    """The hash of a message's normalized text seen in a conversation.
+
+    Messages are recorded as they are mirrored in either direction. This saves
+    normalizing and hashing the whole slack thread every time a comment is
+    synced from Zendesk.
+
+    """
+
+    issue = models.ForeignKey(
+        ZenSlackChat, on_delete=models.CASCADE, related_name="hashes"
+    )
+
+    # The message_tools.compare_hash() SHA1 hex digest:
+    digest = models.CharField(max_length=40)
+
+    # The slack message 'ts' the hash is for, if known:
+    ts = models.CharField(max_length=20, blank=True, default="")
+
+    class Meta:
+        unique_together = (("issue", "digest"),)
+
+
+class ArchivedChat(models.Model):
+    """A resolved conversation moved out of the ZenSlackChat table.
+
+    The bot looks up ZenSlackChat on every message, so resolved conversations
+    are moved here once they are ARCHIVE_AFTER_DAYS old (see
+    zenslackchat.archive) to keep that table and its indexes small. The row
+    keeps its ZenSlackChat id and its MessageHash rows go with it.
+
+    ZenSlackChat.get() and get_by_ticket() look here when a conversation
+    isn't found, and move it back if it is, as it has come to life again.
+
+    """
+
+    # The ZenSlackChat fields, moved as they are:
+    FIELDS = (
+        "id", "channel_id", "chat_id", "ticket_id", "active", "opened",
+        "closed", "zendesk_cursor", "slack_cursor"
+    )
+
+    id = models.IntegerField(primary_key=True)
+
+    channel_id = models.CharField(max_length=22)
+
+    chat_id = models.CharField(max_length=20)
+
+    ticket_id = models.BigIntegerField(null=True, blank=True)
+
+    active = models.BooleanField(default=False)
+
+    opened = models.DateTimeField()
+
+    closed = models.DateTimeField(null=True, blank=True)
+
+    zendesk_cursor = models.BigIntegerField(null=True, blank=True)
+
+    slack_cursor = models.CharField(max_length=20, blank=True, default="")
+
+    # The [digest, ts] of each of the conversation's MessageHash rows:
+    hashes = models.JSONField(default=list, blank=True)
+
+    # When it was moved here:
+    archived = models.DateTimeField(default=utcnow)
+
+    class Meta:
+        unique_together = (("channel_id", "chat_id"),)
+        indexes = [
+            models.Index(
+                fields=["ticket_id", "chat_id"], name="archivedchat_ticket_idx"
+            ),
+        ]
+
+    @classmethod
+    @traced("db.ArchivedChat.archive")
+    def archive(cls, before, size=500):
+        """Move a batch of the conversations resolved before the given time.
+
+        :param before: The UTC datetime resolved conversations must be older
+        than.
 
-Closed 🤘: {closed}
+        :param size: The most conversations to move.
 
-Unresolved 🔥: {open}
-{links}
+        :returns: The number moved, fewer than size when none are left.
+
+        """
+        with transaction.atomic():
+            issues = list(
+                ZenSlackChat.objects.filter(active=False, closed__lt=before)
+                .order_by("closed")
+                # Leave rows the bot is busy with for the next batch:
+                .select_for_update(skip_locked=True)[:size]
+            )
+            if not issues:
+                return 0
+
+            hashes = defaultdict(list)
+            for issue_id, digest, ts in MessageHash.objects.filter(
+                issue__in=issues
+            ).values_list("issue_id", "digest", "ts"):
+                hashes[issue_id].append([digest, ts])
+
+            cls.objects.bulk_create(
+                [
+                    cls(
+                        hashes=hashes[issue.id],
+                        **{name: getattr(issue, name) for name in cls.FIELDS},
+                    )
+                    for issue in issues
+                ]
+            )
+            ZenSlackChat.objects.filter(
+                id__in=[issue.id for issue in issues]
+            ).delete()
+
+        return len(issues)
+
+    @classmethod
+    def restore(cls, **lookup):
+        """Move the archived conversation back to ZenSlackChat.
+
+        :param lookup: The fields to find it by e.g. channel_id and chat_id.
+
+        :returns: The ZenSlackChat instance or None if it isn't archived.
+
+        """
+        if not cls.objects.filter(**lookup).exists():
+            return None
 
-Cheers,
+        with transaction.atomic():
+            # Another process may have just restored it:
+            archived = cls.objects.select_for_update().filter(**lookup).first()
+            if archived is None:
+                return ZenSlackChat.objects.filter(**lookup).first()
+
+            issue = ZenSlackChat(
+                **{name: getattr(archived, name) for name in cls.FIELDS}
+            )
+            issue.save(force_insert=True)
+            MessageHash.objects.bulk_create(
+                [
+                    MessageHash(issue=issue, digest=digest, ts=ts)
+                    for digest, ts in archived.hashes
+                ]
+            )
+            archived.delete()
+
+        return issue
+
+
+class DailyStats(models.Model):
+    """The issues opened and closed on each support channel per (UTC) day.
+
+    ZenSlackChat.open() and ZenSlackChat.resolve() keep the rows up to date
+    as they go, so reports and dashboards can read a row per day rather than
+    counting the whole history of issues. "manage.py daily_stats" rebuilds
+    or checks them from the issues.
+
+    A row only exists for days something was opened or closed.
+
+    """
+
+    day = models.DateField()
+
+    channel_id = models.CharField(max_length=22)
 
-🤖 ZenSlackChat
-        """.strip()
+    # Issues opened and closed on the day:
+    opened = models.PositiveIntegerField(default=0)
+    closed = models.PositiveIntegerField(default=0)
 
-        return report
+    # Issues still open at the end of the day:
+    backlog = models.IntegerField(default=0)
+
+    # The median and 90th percentile seconds taken to resolve the issues
+    # closed on the day, None if nothing was closed:
+    resolve_p50 = models.FloatField(null=True, blank=True)
+    resolve_p90 = models.FloatField(null=True, blank=True)
+
+    class Meta:
+        unique_together = (("channel_id", "day"),)
+        verbose_name_plural = "daily stats"
+
+    @classmethod
+    def row(cls, channel_id, day):
+        """Make sure the channel has a row for the day.
+
+        A new row starts with the backlog of the row before it.
+
+        """
+        backlog = (
+            cls.objects.filter(channel_id=channel_id, day__lt=day)
+            .order_by("-day")
+            .values_list("backlog", flat=True)
+            .first()
+        )
+        cls.objects.bulk_create(
+            [cls(channel_id=channel_id, day=day, backlog=backlog or 0)],
+            # Another process may have just made it:
+            ignore_conflicts=True,
+        )
+
+    @staticmethod
+    def record(update, issue):
+        """Call update(issue), logging rather than raising any failure.
+
+        The issue matters more than its stats, which "manage.py daily_stats"
+        can put right.
+
+        """
+        log = logging.getLogger(__name__)
+
+        try:
+            update(issue)
+
+        except:  # noqa: I'm logging rather than hidding.
+            log.exception(f"Unable to update the daily stats for {issue.chat_id}: ")
+
+    @classmethod
+    def record_opened(cls, issue):
+        """Count the newly opened issue."""
+        day = issue.opened.astimezone(timezone.utc).date()
+        today = cls.objects.filter(channel_id=issue.channel_id, day=day)
+
+        if not today.update(opened=models.F("opened") + 1):
+            cls.row(issue.channel_id, day)
+            today.update(opened=models.F("opened") + 1)
+
+        cls.objects.filter(channel_id=issue.channel_id, day__gte=day).update(
+            backlog=models.F("backlog") + 1
+        )
+
+    @classmethod
+    def record_closed(cls, issue):
+        """Count the newly resolved issue and update the day's resolve times.
+        """
+        day = issue.closed.astimezone(timezone.utc).date()
+        today = cls.objects.filter(channel_id=issue.channel_id, day=day)
+
+        # Only the issues closed on the day are needed for these:
+        p50, p90 = resolve_percentiles(
+            closed - opened
+            for opened, closed in ZenSlackChat.objects.filter(
+                channel_id=issue.channel_id,
+                closed__range=day_range(day),
+            ).values_list("opened", "closed")
+        )
+        changes = dict(
+            closed=models.F("closed") + 1, resolve_p50=p50, resolve_p90=p90
+        )
+
+        if not today.update(**changes):
+            cls.row(issue.channel_id, day)
+            today.update(**changes)
+
+        cls.objects.filter(channel_id=issue.channel_id, day__gte=day).update(
+            backlog=models.F("backlog") - 1
+        )
+
+    @classmethod
+    def compute(cls, issues):
+        """Work out the rows from scratch.
+
+        :param issues: (channel_id, opened, closed) for every issue.
+
+        :returns: A dict of (channel_id, day) to unsaved DailyStats.
+
+        """
+        found = {}
+        durations = defaultdict(list)
+
+        def stats(channel_id, when):
+            key = (channel_id, when.astimezone(timezone.utc).date())
+            if key not in found:
+                found[key] = cls(channel_id=key[0], day=key[1])
+            return found[key]
+
+        for channel_id, opened, closed in issues:
+            stats(channel_id, opened).opened += 1
+            if closed:
+                row = stats(channel_id, closed)
+                row.closed += 1
+                durations[(row.channel_id, row.day)].append(closed - opened)
+
+        backlogs = defaultdict(int)
+        for key in sorted(found):
+            row = found[key]
+            backlogs[row.channel_id] += row.opened - row.closed
+            row.backlog = backlogs[row.channel_id]
+            row.resolve_p50, row.resolve_p90 = resolve_percentiles(
+                durations[key]
+            )
+
+        return found
+
+
+def day_range(day):
+    """Return the first and last moment of the UTC day."""
+    begin = datetime(day.year, day.month, day.day, tzinfo=timezone.utc)
+    return begin, begin + timedelta(days=1) - timedelta(microseconds=1)
+
+
+def percentiles(values, percents):
+    """Return the percentiles of the values or a None for each if empty.
+
+    :param values: The numbers in any order.
+
+    :param percents: The percentiles wanted, from 0 to 100.
+
+    Between two values the result is interpolated, as numpy.percentile() does
+    by default, so the 50th is the median. The DailyStats and the analytics
+    (see zenslackchat/analytics.py) both use this so they agree.
+
+    """
+    values = sorted(values)
+    if not values:
+        return [None] * len(percents)
+
+    found = []
+    for percent in percents:
+        rank = (len(values) - 1) * percent / 100
+        below = math.floor(rank)
+        above = min(below + 1, len(values) - 1)
+        found.append(
+            values[below] + (values[above] - values[below]) * (rank - below)
+        )
+
+    return found
+
+
+def resolve_percentiles(durations):
+    """Return the (median, 90th percentile) seconds or (None, None).
+
+    :param durations: The timedelta each issue took to be resolved.
+
+    """
+    p50, p90 = percentiles(
+        (duration.total_seconds() for duration in durations), (50, 90)
+    )
+    return p50, p90
 
 
 class SlackApp(models.Model):
@@ -325,7 +813,16 @@ class SlackApp(models.Model):
 
     @classmethod
     def client(cls):
-        """Returns a Slack web client ready for use.
+        """Returns the Slack web client for this process.
+
+        The client is built once and reused until a new SlackApp is saved.
+
+        """
+        return registry.get("slack", cls.build_client)
+
+    @classmethod
+    def build_client(cls):
+        """Returns a new Slack web client ready for use.
 
         This recovers the latest SlackApp instance and uses its
         bot_access_token field for the web client.
@@ -338,11 +835,16 @@ class SlackApp(models.Model):
                 f"Bot Access Token:{app.bot_access_token}"
             )
 
-        return WebClient(token=app.bot_access_token)
+        return WebClient(token=app.bot_access_token, base_url=settings.SLACK_API_URL)
+
 
+class CustomHeaderAdapter(BudgetAdapter):
+    """Allow custom request headers for Zenpy requests.
 
-class CustomHeaderAdapter(requests.adapters.HTTPAdapter):
-    """Allow custom request headers for Zenpy requests."""
+    Requests are also kept within the shared Zendesk rate budget (see
+    zenslackchat.zendesk_budget).
+
+    """
 
     def add_headers(self, request, **kwargs):
         """Add in custom X-On-Behalf-Of for zenslackchat.
@@ -373,7 +875,17 @@ class ZendeskApp(models.Model):
 
     @classmethod
     def client(cls):
-        """Returns a Zenpy client instance ready for use.
+        """Returns the Zenpy client instance for this process.
+
+        The client and its keep-alive HTTP session are built once and reused
+        until a new ZendeskApp is saved.
+
+        """
+        return registry.get("zendesk", cls.build_client)
+
+    @classmethod
+    def build_client(cls):
+        """Returns a new Zenpy client instance ready for use.
 
         This recovers the latest ZendeskApp instance and uses its access_token
         field for the token.
@@ -389,6 +901,8 @@ class ZendeskApp(models.Model):
         session = requests.Session()
         adapter = CustomHeaderAdapter(**Zenpy.http_adapter_kwargs())
         session.mount("https://", adapter)
+        # The load test fakes (ZENPY_FORCE_SCHEME=http) use the same adapter:
+        session.mount("http://", adapter)
 
         return Zenpy(
             subdomain=settings.ZENDESK_SUBDOMAIN,
@@ -397,6 +911,15 @@ class ZendeskApp(models.Model):
         )
 
 
+@receiver(post_save, sender=SlackApp)
+@receiver(post_delete, sender=SlackApp)
+@receiver(post_save, sender=ZendeskApp)
+@receiver(post_delete, sender=ZendeskApp)
+def invalidate_clients(sender, **kwargs):
+    """Rebuild clients everywhere when the OAuth tokens change."""
+    registry.invalidate()
+
+
 class PagerDutyApp(models.Model):
     """Used to store Pager Duty OAuth client / app details after successfull
     completion of the OAuth process.
@@ -408,13 +931,20 @@ class PagerDutyApp(models.Model):
     scope = models.CharField(max_length=50)
     created_at = models.DateTimeField(default=utcnow)
 
-    @classmethod
-    def client(cls):
-        """Returns a client instance ready for use.
+    # Token requests and API calls share one keep-alive session per process.
+    session = requests.Session()
 
-        :returns: The APISession instance for pager duty.
+    TOKEN_KEY = "pagerduty-token"
 
-        If the OAuth app is not yet set up then None will be returned.
+    REFRESH_LOCK_KEY = "pagerduty-token-refresh"
+
+    @classmethod
+    @api_call("pagerduty", "request_token")
+    def request_token(cls):
+        """Request a new client_credentials token from PagerDuty.
+
+        :returns: The token response dict with access_token, token_type and
+        expires_in fields.
 
         """
         log = logging.getLogger(__name__)
@@ -426,7 +956,7 @@ class PagerDutyApp(models.Model):
             "grant_type": "client_credentials",
         }
 
-        token_request = requests.post(
+        token_request = cls.session.post(
             settings.PD_TOKEN_END_POINT,
             data=pager_duty_params,
             headers={"Content-Type": "application/x-www-form-urlencoded"},
@@ -439,18 +969,94 @@ class PagerDutyApp(models.Model):
 
         return token_request.json()
 
+    @classmethod
+    def store_token(cls, token):
+        """Share the token with all processes until shortly before it expires.
+
+        :returns: The cached dict(token=<token response>, expires_at=<epoch>)
+
+        """
+        lifetime = int(token.get("expires_in", 3600))
+        timeout = lifetime - settings.PAGERDUTY_TOKEN_EXPIRY_MARGIN
+        cached = dict(token=token, expires_at=time.time() + lifetime)
+        if timeout > 0:
+            cache.set(cls.TOKEN_KEY, cached, timeout=timeout)
+
+        return cached
+
+    @classmethod
+    def refresh_token(cls):
+        """Request and store a new token, logging rather than raising errors.
+
+        This is run in the background when the current token is close to
+        expiry. The refresh lock stops every process doing the same.
+
+        """
+        log = logging.getLogger(__name__)
+
+        try:
+            cls.store_token(cls.request_token())
+            log.debug("PagerDuty token refreshed.")
+
+        except:  # noqa: I'm logging rather than hidding.
+            log.exception("PagerDuty token refresh failed: ")
+
+        finally:
+            cache.delete(cls.REFRESH_LOCK_KEY)
+
+    @classmethod
+    @traced("pagerduty.client")
+    def client(cls):
+        """Returns a token ready for use.
+
+        :returns: The token response dict for pager duty.
+
+        The token is requested once and shared through the cache by all
+        processes until PAGERDUTY_TOKEN_EXPIRY_MARGIN seconds before it
+        expires. Within PAGERDUTY_TOKEN_REFRESH_AHEAD seconds of that a
+        replacement is requested in the background while the current one is
+        still used.
+
+        """
+        log = logging.getLogger(__name__)
+
+        try:
+            cached = cache.get(cls.TOKEN_KEY)
+
+        except:  # noqa: I'm logging rather than hidding.
+            log.exception("Unable to recover the PagerDuty token from cache: ")
+            return cls.request_token()
+
+        if cached is None:
+            log.debug("No PagerDuty token cached, requesting a new one.")
+            return cls.store_token(cls.request_token())["token"]
+
+        remaining = cached["expires_at"] - time.time()
+        margin = settings.PAGERDUTY_TOKEN_EXPIRY_MARGIN
+        refresh_at = margin + settings.PAGERDUTY_TOKEN_REFRESH_AHEAD
+        if remaining < refresh_at and cache.add(
+            cls.REFRESH_LOCK_KEY, 1, timeout=60
+        ):
+            log.debug(f"PagerDuty token expires in {remaining:.0f}s, refreshing.")
+            threading.Thread(target=cls.refresh_token, daemon=True).start()
+
+        return cached["token"]
+
     @classmethod
     def get(cls, app_token, path, query={}):
         log = logging.getLogger(__name__)
 
-        api_url = f"https://api.pagerduty.com/{path}"
+        api_url = f"{settings.PAGERDUTY_API_URL.rstrip('/')}/{path}"
 
         headers = {
             "Authorization": f"{app_token['token_type'].title()} {app_token['access_token']}",
             "Accept": "application/vnd.pagerduty+json;version=2",
         }
 
-        response = requests.get(api_url, headers=headers, params=query)
+        with api_call("pagerduty", path) as call:
+            response = cls.session.get(api_url, headers=headers, params=query)
+            if response.status_code != 200:
+                call.error = f"HTTP {response.status_code}"
 
         if response.status_code != 200:
             log.debug(f"PageDuty Error: {response.status_code} {response.reason}")
@@ -464,6 +1070,20 @@ class PagerDutyApp(models.Model):
 
         :returns: dict(primary='First Lastname', secondary='First Lastname')
 
+        """
+        on_call, _ = cls.on_call_until(app_token)
+
+        return on_call
+
+    @classmethod
+    def on_call_until(cls, app_token):
+        """Return the primary and secondary on call and when they hand over.
+
+        :returns: (on_call, until)
+
+        The on_call is as returned by on_call(). The until is the earliest UTC
+        datetime either of them stops being on call, or None if not known.
+
         """
 
         policy_id = settings.PAGERDUTY_ESCALATION_POLICY_ID
@@ -475,12 +1095,16 @@ class PagerDutyApp(models.Model):
         data = cls.get(app_token=app_token, path="oncalls", query=query_params)
 
         if not data:
-            return {}
+            return {}, None
         # level 1 is the person on call, 2 is the secondary backup
-        priority = sorted(data["oncalls"], key=itemgetter("escalation_level"))
-        primary, secondary = [i["user"]["summary"] for i in priority][:2]
+        priority = sorted(data["oncalls"], key=itemgetter("escalation_level"))[:2]
+        primary, secondary = [i["user"]["summary"] for i in priority]
+
+        # Permanent on call entries have no end:
+        ends = [parse(i["end"]) for i in priority if i.get("end")]
+        until = min(ends) if ends else None
 
-        return dict(primary=primary, secondary=secondary)
+        return dict(primary=primary, secondary=secondary), until
 
 
 class OutOfHoursInformation(models.Model):
@@ -596,6 +1220,7 @@ class OutOfHoursInformation(models.Model):
         return oohi
 
     @classmethod
+    @traced("out_of_hours.inform")
     def inform_if_out_of_hours(cls, now, chat_id, channel_id, slack_client):
         """Inform the slack channel about outside hour contact details.
 
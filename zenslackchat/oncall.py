@@ -0,0 +1,146 @@
+"""
+Who is on call, remembered until the next hand over.
+
+Every new issue and daily report needs the primary and secondary on call. This
+only changes when the rota hands over, so the result is kept in the django
+cache (redis) until then. A celery beat task keeps it warm. If PagerDuty or
+Confluence cannot be reached the last known roster is used instead.
+
+Each source is cached under its own key. The daily report reads Confluence
+when USE_ATLASSIAN is set, while new issues only ever post the PagerDuty
+roster (see message_who_is_on_call).
+
+"""
+import logging
+from datetime import datetime, time, timedelta, timezone
+
+from django.conf import settings
+from django.core.cache import cache
+
+from zenslackchat.atlassian_api import rotation_calendar
+from zenslackchat.metrics import CACHE_REQUESTS
+from zenslackchat.models import PagerDutyApp
+from zenslackchat.tracing import traced
+
+
+PAGERDUTY = "pagerduty"
+
+CONFLUENCE = "confluence"
+
+ROSTER_KEY = "on-call-roster:{}"
+
+LAST_KNOWN_KEY = "on-call-roster-last-known:{}"
+
+
+def default_source():
+    """Return CONFLUENCE if USE_ATLASSIAN is set, otherwise PAGERDUTY."""
+    return CONFLUENCE if settings.USE_ATLASSIAN else PAGERDUTY
+
+
+@traced("oncall.fetch_roster")
+def fetch_roster(now, source=None):
+    """Recover who is on call from PagerDuty or Confluence.
+
+    :param now: The UTC datetime now.
+
+    :param source: PAGERDUTY or CONFLUENCE (default is default_source()).
+
+    :returns: (roster, until)
+
+    The roster is dict(primary='...', secondary='...') or {} if not known. The
+    until is the UTC datetime of the next hand over or None.
+
+    """
+    if source is None:
+        source = default_source()
+
+    if source == CONFLUENCE:
+        calendar = rotation_calendar()
+        primary, secondary = calendar.on_call(now)
+        roster = dict(primary=primary, secondary=secondary)
+        until = calendar.hand_over(now)
+        if until is None:
+            # The rota is by day, so this is right until midnight at least.
+            until = datetime.combine(
+                now.date() + timedelta(days=1), time.min, tzinfo=timezone.utc
+            )
+
+    else:
+        app_token = PagerDutyApp.client()
+        roster, until = PagerDutyApp.on_call_until(app_token=app_token)
+
+    return roster, until
+
+
+@traced("oncall.on_call_roster")
+def on_call_roster(refresh=False, now=None, source=None):
+    """Return the primary and secondary on call.
+
+    :param refresh: True to ignore the cached roster e.g. when pre-warming.
+
+    :param now: The optional UTC datetime (default is UTC now).
+
+    :param source: PAGERDUTY or CONFLUENCE (default is default_source()).
+
+    :returns: dict(primary='...', secondary='...') or {} if never known.
+
+    The roster is cached until the next hand over, but for no longer than
+    ONCALL_ROSTER_MAX_AGE seconds as the rota can be changed by hand.
+
+    """
+    log = logging.getLogger(__name__)
+
+    if now is None:
+        now = datetime.now(timezone.utc)
+
+    if source is None:
+        source = default_source()
+
+    roster_key = ROSTER_KEY.format(source)
+    last_known_key = LAST_KNOWN_KEY.format(source)
+
+    if not refresh:
+        try:
+            cached = cache.get(roster_key)
+
+        except:  # noqa: I'm logging rather than hidding.
+            log.exception("Unable to recover the on call roster from cache: ")
+            cached = None
+
+        if cached is not None:
+            CACHE_REQUESTS.inc(cache="oncall_roster", result="hit")
+            return cached
+
+        CACHE_REQUESTS.inc(cache="oncall_roster", result="miss")
+
+    try:
+        roster, until = fetch_roster(now, source)
+
+    except:  # noqa: I'm logging rather than hidding.
+        log.exception("Unable to recover who is on call: ")
+        roster, until = {}, None
+
+    if not roster or not roster.get("primary"):
+        log.warning("Who is on call is not known, using the last known roster.")
+        try:
+            return cache.get(last_known_key, {})
+
+        except:  # noqa: I'm logging rather than hidding.
+            log.exception("Unable to recover the last known on call roster: ")
+            return {}
+
+    timeout = settings.ONCALL_ROSTER_MAX_AGE
+    if until is not None:
+        timeout = min(timeout, (until - now).total_seconds())
+    # Don't thrash on an end time we have just passed:
+    timeout = max(int(timeout), 60)
+
+    log.debug(f"On call {roster} cached for {timeout}s (hand over {until})")
+    try:
+        cache.set(roster_key, roster, timeout=timeout)
+        cache.set(last_known_key, roster, timeout=None)
+
+    except:  # noqa: I'm logging rather than hidding.
+        log.exception("Unable to store the on call roster in cache: ")
+
+    return roster
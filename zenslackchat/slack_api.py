@@ -10,6 +10,8 @@ Oisin Mulvihill
 """
 import logging
 
+from zenslackchat.slack_dispatcher import dispatcher
+
 
 def message_url(workspace_uri, channel, message_id):
     """Return a direct link to the message that can be stored in zendesk.
@@ -33,13 +35,15 @@ def url_to_chat_id(slack_url):
     """
     # Recover the last element in URL and convert to chat_id. handle trailing /
     try:
-        chat_id = [part for part in slack_url.split('/') if part][-1]
+        chat_id = [
+            part.strip() for part in slack_url.split('/') if part.strip()
+        ][-1]
 
     except IndexError:
         # empty string given, just return it
         return slack_url
 
-    chat_id = chat_id.lower().strip()
+    chat_id = chat_id.lower()
 
     # convert to chat_id stripping the trailing p
     chat_id = chat_id[1:] if chat_id[0] == 'p' else chat_id
@@ -50,6 +54,47 @@ def url_to_chat_id(slack_url):
     return chat_id
 
 
+def chunked(pieces, limit):
+    """Join the pieces of text into messages of no more than limit characters.
+
+    :param pieces: The lines (or blocks of lines) of the text, in order.
+
+    :param limit: The most characters in each message.
+
+    The pieces are joined with a new line as they would be in one long
+    message, so joining the messages with a new line gives the same text. A
+    piece longer than limit is split to fit. Blank pieces are kept, a message
+    may start with one, but no message is empty. Blank pieces that would be a
+    message on their own are dropped.
+
+    :returns: A generator of the messages.
+
+    """
+    # None until a piece is added, as a blank piece is still a line:
+    chunk = None
+    for piece in pieces:
+        while len(piece) > limit:
+            if chunk:
+                yield chunk
+            chunk = None
+            yield piece[:limit]
+            piece = piece[limit:]
+
+        if chunk is None:
+            chunk = piece
+
+        elif len(chunk) + 1 + len(piece) <= limit:
+            chunk = f"{chunk}\n{piece}"
+
+        else:
+            if chunk:
+                yield chunk
+            chunk = piece
+
+    if chunk:
+        yield chunk
+
+
 def create_thread(client, channel_id, message):
     """Create a parent message which will be the thread for further comms.
 
@@ -65,9 +110,8 @@ def create_thread(client, channel_id, message):
     log = logging.getLogger(__name__)
 
     log.debug(f"channel:<{channel_id}> message:<{message}>")
-    response = client.chat_postMessage(
-        channel=channel_id,
-        text=message,
+    response = dispatcher.call(
+        client, 'chat_postMessage', channel_id, text=message
     )
 
     chat_id = response['message']['ts']
@@ -83,6 +127,9 @@ def post_message(client, chat_id, channel_id, message):
 
     This is also a handy function to aid mocking in tests.
 
+    Messages are sent through the dispatcher so they stay within Slack's
+    rate limits and arrive in the thread in the order they were posted.
+
     """
     log = logging.getLogger(__name__)
 
@@ -90,8 +137,6 @@ def post_message(client, chat_id, channel_id, message):
         f"chat_id:<{chat_id}> channel:<{channel_id}> message:<{message}>"
     )
 
-    return client.chat_postMessage(
-        channel=channel_id,
-        text=message,
-        thread_ts=chat_id
+    return dispatcher.call(
+        client, 'chat_postMessage', channel_id, thread_ts=chat_id, text=message
     )
@@ -0,0 +1,302 @@
+"""
+Send Slack API calls within Slack's rate limits.
+
+Slack allows roughly one chat.postMessage a second per channel (with short
+bursts) and a few hundred a minute per method across the workspace. Going
+over gets an HTTP 429 with a Retry-After header, which used to lose the post.
+
+Every write goes through SlackDispatcher.call(). This waits for a token from
+the method's bucket and the channel's bucket, makes the call and, if Slack
+still answers 429, sleeps for Retry-After and tries again. Calls for the same
+thread (or top level messages in the same channel) go out one at a time in the
+order they were made, so replies can't overtake each other while waiting.
+
+The buckets are per process. The event queue workers and the web process each
+get the full rate, so lower SLACK_CHANNEL_RATE when running several. A 429 is
+shared through the django cache so the other processes also hold off the
+channel for Retry-After.
+
+"""
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from slack.errors import SlackApiError
+
+from zenslackchat.metrics import api_call
+from zenslackchat.metrics import SLACK_QUEUED
+from zenslackchat.metrics import SLACK_RATE_LIMITED
+from zenslackchat.metrics import SLACK_WAIT
+from zenslackchat.tracing import span
+
+
+class TokenBucket(object):
+    """Hands out tokens at rate per second, saving up to burst of them.
+
+    :param rate: Tokens per second or None for no limit.
+
+    :param burst: The most tokens that can be saved up.
+
+    :param clock: Returns the time in seconds (time.monotonic by default).
+
+    """
+    def __init__(self, rate, burst=1, clock=time.monotonic):
+        self.rate = rate
+        self.burst = burst
+        self.clock = clock
+        self.tokens = burst
+        self.updated = clock()
+        self.paused_until = 0
+
+    def reserve(self):
+        """Take a token and return the seconds to wait before using it.
+
+        Tokens can be taken before they are available, so callers wait in
+        the order they reserved.
+
+        """
+        now = self.clock()
+        wait = 0
+        if self.rate:
+            self.tokens = min(
+                self.burst, self.tokens + (now - self.updated) * self.rate
+            )
+            self.updated = now
+            self.tokens -= 1
+            wait = max(0, -self.tokens / self.rate)
+
+        return max(wait, self.paused_until - now)
+
+    def pause(self, seconds):
+        """Hand out nothing for the next seconds e.g. for a Retry-After."""
+        self.paused_until = max(self.paused_until, self.clock() + seconds)
+
+
+def retry_after(error):
+    """Return the seconds Slack asked us to wait or None if not a 429.
+
+    :param error: The SlackApiError raised by the web client.
+
+    """
+    response = getattr(error, 'response', None)
+    if getattr(response, 'status_code', None) != 429:
+        return None
+
+    headers = getattr(response, 'headers', None) or {}
+    try:
+        return max(0, int(headers.get('Retry-After', 1)))
+
+    except (TypeError, ValueError):
+        return 1
+
+
+class SlackDispatcher(object):
+    """Rate limit, order and retry the Slack calls made by this process.
+
+    :param sleep: Called to wait (time.sleep by default).
+
+    :param clock: Returns the time in seconds (time.monotonic by default).
+
+    """
+    def __init__(self, sleep=time.sleep, clock=time.monotonic):
+        self.sleep = sleep
+        self.clock = clock
+        self._cond = threading.Condition()
+        self._buckets = {}
+        # (issued, serving) ticket numbers for each thread with calls queued:
+        self._lanes = {}
+        self._queued = {}
+        self._stats = dict(
+            calls=0, rate_limited=0, waited_seconds=0.0, max_wait_seconds=0.0
+        )
+
+    def bucket(self, key):
+        """Return the TokenBucket for ('method', name) or ('channel', id)."""
+        found = self._buckets.get(key)
+        if found is None:
+            if not settings.SLACK_RATE_LIMITS:
+                found = TokenBucket(None, clock=self.clock)
+            elif key[0] == 'method':
+                found = TokenBucket(
+                    settings.SLACK_METHOD_RATE / 60.0,
+                    burst=settings.SLACK_METHOD_BURST,
+                    clock=self.clock,
+                )
+            else:
+                found = TokenBucket(
+                    settings.SLACK_CHANNEL_RATE,
+                    burst=settings.SLACK_CHANNEL_BURST,
+                    clock=self.clock,
+                )
+            self._buckets[key] = found
+
+        return found
+
+    def shared_pause(self, channel):
+        """Seconds left on a Retry-After another process got for the channel.
+        """
+        log = logging.getLogger(__name__)
+
+        try:
+            until = cache.get(f"slack-retry-after:{channel}")
+
+        except:  # noqa: I'm logging rather than hidding.
+            log.exception("Unable to recover the shared Retry-After: ")
+            until = None
+
+        return max(0, until - time.time()) if until else 0
+
+    def share_pause(self, channel, seconds):
+        log = logging.getLogger(__name__)
+
+        try:
+            cache.set(
+                f"slack-retry-after:{channel}", time.time() + seconds,
+                timeout=int(seconds) + 1
+            )
+
+        except:  # noqa: I'm logging rather than hidding.
+            log.exception("Unable to share the Retry-After: ")
+
+    def wait_turn(self, lane):
+        """Block until the calls queued before ours on the lane are done."""
+        with self._cond:
+            issued, serving = self._lanes.get(lane, (0, 0))
+            self._lanes[lane] = (issued + 1, serving)
+            while self._lanes[lane][1] != issued:
+                self._cond.wait()
+
+    def end_turn(self, lane):
+        with self._cond:
+            issued, serving = self._lanes[lane]
+            if serving + 1 == issued:
+                del self._lanes[lane]
+            else:
+                self._lanes[lane] = (issued, serving + 1)
+            self._cond.notify_all()
+
+    def throttle(self, method, channel):
+        """Wait for a token from the method and channel, return the wait."""
+        with self._cond:
+            wait = max(
+                self.bucket(('method', method)).reserve(),
+                self.bucket(('channel', channel)).reserve(),
+            )
+        wait = max(wait, self.shared_pause(channel))
+        if wait > 0:
+            with span("slack.rate_limit_wait", seconds=round(wait, 3)):
+                self.sleep(wait)
+
+        return wait
+
+    def back_off(self, method, channel, seconds):
+        """Hold off the method and channel here and elsewhere for seconds."""
+        SLACK_RATE_LIMITED.inc(method=method)
+        with self._cond:
+            self._stats['rate_limited'] += 1
+            self.bucket(('method', method)).pause(seconds)
+            self.bucket(('channel', channel)).pause(seconds)
+        self.share_pause(channel, seconds)
+
+    def call(self, client, method, channel, thread_ts=None, **kwargs):
+        """Make the Slack call once it is this thread's turn and within limits.
+
+        :param client: The Slack web client to use.
+
+        :param method: The client method e.g. 'chat_postMessage'.
+
+        :param channel: The channel ID, passed on to the call.
+
+        :param thread_ts: Optional. The thread the call is for, passed on to
+        the call. Calls for the same thread are made in order.
+
+        :param kwargs: Passed on to the call.
+
+        :returns: The Slack response.
+
+        If Slack still returns a 429 it is retried after Retry-After up to
+        SLACK_RATE_RETRIES times, then the SlackApiError is raised.
+
+        """
+        log = logging.getLogger(__name__)
+
+        if thread_ts is not None:
+            kwargs['thread_ts'] = thread_ts
+        lane = (channel, thread_ts)
+        started = attempted = self.clock()
+        self._enqueue(method, channel, 1)
+        try:
+            self.wait_turn(lane)
+            try:
+                retries = 0
+                while True:
+                    self.throttle(method, channel)
+                    attempted = self.clock()
+                    try:
+                        with api_call("slack", method):
+                            response = getattr(client, method)(
+                                channel=channel, **kwargs
+                            )
+                        break
+
+                    except SlackApiError as error:
+                        seconds = retry_after(error)
+                        if seconds is None:
+                            raise
+                        self.back_off(method, channel, seconds)
+                        retries += 1
+                        too_long = seconds > settings.SLACK_RETRY_AFTER_MAX
+                        if retries > settings.SLACK_RATE_RETRIES or too_long:
+                            log.error(
+                                f"Slack {method} to {channel} still rate "
+                                f"limited after {retries} tries."
+                            )
+                            raise
+                        log.warning(
+                            f"Slack {method} to {channel} rate limited, "
+                            f"retrying after {seconds}s."
+                        )
+
+            finally:
+                self.end_turn(lane)
+
+        finally:
+            self._enqueue(method, channel, -1)
+            waited = attempted - started
+            SLACK_WAIT.observe(waited, method=method)
+            with self._cond:
+                self._stats['calls'] += 1
+                self._stats['waited_seconds'] += waited
+                self._stats['max_wait_seconds'] = max(
+                    self._stats['max_wait_seconds'], waited
+                )
+
+        return response
+
+    def _enqueue(self, method, channel, amount):
+        SLACK_QUEUED.inc(amount, method=method)
+        with self._cond:
+            self._queued[channel] = self._queued.get(channel, 0) + amount
+            if not self._queued[channel]:
+                del self._queued[channel]
+
+    def stats(self):
+        """Return the calls queued by channel, made, rate limited and waits.
+        """
+        with self._cond:
+            return dict(self._stats, queued=dict(self._queued))
+
+    def reset(self):
+        """Forget the buckets and stats e.g. after the settings change."""
+        with self._cond:
+            self._buckets.clear()
+            self._queued.clear()
+            self._stats.update(
+                calls=0, rate_limited=0, waited_seconds=0.0,
+                max_wait_seconds=0.0
+            )
+
+
+dispatcher = SlackDispatcher()
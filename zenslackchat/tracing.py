@@ -0,0 +1,223 @@
+"""
+Time each stage of handling an event and the outbound calls it makes.
+
+A trace is started around the message handler (when TRACING_ENABLED=1) and
+each stage or outbound call inside it is a span. When the trace finishes it is
+logged as one line and kept in a ring buffer of the last TRACE_BUFFER_SIZE
+traces in this process. The buffer is viewable in the admin under "Recent
+traces" (see ZenSlackChatAdmin.traces_view).
+
+When tracing is disabled, or there is no trace running, span() returns a
+shared do nothing span. The only cost is a ContextVar lookup.
+
+"""
+import collections
+import contextvars
+import functools
+import logging
+import threading
+import time
+from datetime import datetime, timezone
+
+
+_current = contextvars.ContextVar("zenslackchat-span", default=None)
+
+
+class NoSpan(object):
+    """Stands in for a span when nothing is being traced.
+    """
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    def annotate(self, **attrs):
+        pass
+
+
+NO_SPAN = NoSpan()
+
+
+class Span(object):
+    """A timed stage, its attributes and the spans made inside it.
+    """
+    __slots__ = (
+        "name", "attrs", "parent", "children", "started", "offset",
+        "duration", "error", "_begin", "_token",
+    )
+
+    def __init__(self, name, parent=None, attrs=None):
+        self.name = name
+        self.attrs = attrs or {}
+        self.parent = parent
+        self.children = []
+        self.started = None
+        self.offset = 0.0
+        self.duration = None
+        self.error = None
+        self._begin = None
+        self._token = None
+
+    @property
+    def offset_ms(self):
+        return self.offset * 1000
+
+    @property
+    def duration_ms(self):
+        return (self.duration or 0) * 1000
+
+    def root(self):
+        span = self
+        while span.parent is not None:
+            span = span.parent
+        return span
+
+    def annotate(self, **attrs):
+        self.attrs.update(attrs)
+
+    def __enter__(self):
+        self._begin = time.perf_counter()
+        if self.parent is None:
+            self.started = datetime.now(timezone.utc)
+        else:
+            self.offset = self._begin - self.root()._begin
+        self._token = _current.set(self)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.duration = time.perf_counter() - self._begin
+        _current.reset(self._token)
+        if exc_type is not None:
+            self.error = f"{exc_type.__name__}: {exc}"
+
+        if self.parent is None:
+            finished(self)
+        else:
+            self.parent.children.append(self)
+
+        return False
+
+    def walk(self, depth=0):
+        """Yield (depth, span) for this span and everything inside it."""
+        yield depth, self
+        for child in self.children:
+            yield from child.walk(depth + 1)
+
+    def as_dict(self):
+        return dict(
+            name=self.name,
+            attrs=self.attrs,
+            started=self.started.isoformat() if self.started else None,
+            offset_ms=round(self.offset_ms, 3),
+            duration_ms=round(self.duration_ms, 3),
+            error=self.error,
+            children=[child.as_dict() for child in self.children],
+        )
+
+    def summary(self):
+        """One line of each span and how long it took in milliseconds."""
+        parts = []
+        for depth, span in self.walk():
+            error = " !" if span.error else ""
+            parts.append(
+                f"{'.' * depth}{span.name}={span.duration_ms:.1f}"
+                f"{error}"
+            )
+        return " ".join(parts)
+
+
+class TraceBuffer(object):
+    """A thread safe ring buffer of the most recent finished traces.
+    """
+    def __init__(self, size):
+        self._lock = threading.Lock()
+        self._traces = collections.deque(maxlen=size)
+
+    def resize(self, size):
+        with self._lock:
+            if size != self._traces.maxlen:
+                self._traces = collections.deque(self._traces, maxlen=size)
+
+    def add(self, trace):
+        with self._lock:
+            self._traces.append(trace)
+
+    def recent(self):
+        """Return the traces newest first."""
+        with self._lock:
+            return list(reversed(self._traces))
+
+    def clear(self):
+        with self._lock:
+            self._traces.clear()
+
+
+traces = TraceBuffer(200)
+
+
+def finished(trace):
+    """Log a finished trace and keep it in the ring buffer."""
+    from django.conf import settings
+
+    traces.resize(settings.TRACE_BUFFER_SIZE)
+    traces.add(trace)
+    logging.getLogger(__name__).info(f"trace {trace.summary()}")
+
+
+def current():
+    """Return the running span or NO_SPAN."""
+    return _current.get() or NO_SPAN
+
+
+def annotate(**attrs):
+    """Add attributes to the running span, if there is one."""
+    current().annotate(**attrs)
+
+
+def span(name, **attrs):
+    """Time a stage of the running trace.
+
+    :param name: e.g. 'zendesk.get_ticket'.
+
+    :param attrs: Any details worth recording with it.
+
+    :returns: A context manager. This does nothing if there is no trace.
+
+    """
+    parent = _current.get()
+    if parent is None:
+        return NO_SPAN
+
+    return Span(name, parent, attrs)
+
+
+def trace(name, **attrs):
+    """Start a new trace if tracing is enabled.
+
+    Inside a running trace this is the same as span().
+
+    """
+    from django.conf import settings
+
+    if _current.get() is not None:
+        return span(name, **attrs)
+
+    if not settings.TRACING_ENABLED:
+        return NO_SPAN
+
+    return Span(name, None, attrs)
+
+
+def traced(name, root=False):
+    """Decorate a function to run it in a span (or a trace if root=True).
+    """
+    start = trace if root else span
+
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with start(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
@@ -1,28 +1,42 @@
 # -*- coding: utf-8 -*-
+from django.conf import settings
 from django.contrib.auth import views as auth_views
 from django.urls import path
 
 from . import eventsview, views, zendesk_webhooks
 
+if settings.SERVE_ASGI:
+    from . import async_views
+
+    slack_events = async_views.slack_events
+    comments_webhook = async_views.comments_webhook
+    email_webhook = async_views.email_webhook
+
+else:
+    slack_events = eventsview.Events.as_view()
+    comments_webhook = zendesk_webhooks.CommentsWebHook.as_view()
+    email_webhook = zendesk_webhooks.EmailWebHook.as_view()
+
 urlpatterns = [
     path("", views.index, name="index"),
     path("accounts/login/", auth_views.LoginView.as_view(), name="login"),
     path("accounts/logout/", auth_views.LogoutView.as_view(), name="logout"),
     path("slack/oauth/", views.slack_oauth, name="slack_oauth"),
-    path("slack/events/", eventsview.Events.as_view(), name="slack_events"),
+    path("slack/events/", slack_events, name="slack_events"),
     path("zendesk/oauth/", views.zendesk_oauth, name="zendesk_oauth"),
     path(
         "zendesk/webhook/",
-        zendesk_webhooks.CommentsWebHook.as_view(),
+        comments_webhook,
         name="zenslackchat_comments",
     ),
     path(
         "zendesk/email/webhook/",
-        zendesk_webhooks.EmailWebHook.as_view(),
+        email_webhook,
         name="zenslackchat_emails",
     ),
     # path('pagerduty/oauth/', views.pagerduty_oauth, name='pagerduty_oauth'),
     path("trigger/report/daily", views.trigger_daily_report, name="daily_report"),
+    path("export/", views.export_conversations, name="export"),
     path("confluence/start_oauth/", views.start_oauth, name="start_oauth"),
     path("callback/", views.callback, name="callback"),
     path("confluence/fetch_page/", views.fetch_page, name="fetch_page"),
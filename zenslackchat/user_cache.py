@@ -0,0 +1,205 @@
+"""
+Cache the Slack user details the message handler needs.
+
+Every message needs the author's real name and email, which costs a Slack
+users_info call. The same people post all day so the results are kept in a
+bounded LRU in each process, and optionally in the shared django cache (redis)
+so other processes can use them too. Entries expire after a time to live.
+
+When Slack sends us a user_change event the user's version is bumped in the
+django cache. Every process checks the version of a user it holds at most
+every SLACK_USER_CACHE_CHECK_SECONDS, and drops the entry if it changed. This
+reaches the celery workers too when the events are processed there.
+
+"""
+import logging
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import cache
+
+from zenslackchat.metrics import CACHE_REQUESTS
+from zenslackchat.metrics import api_call
+
+
+def version_key(user_id):
+    return f"slack-user-version:{user_id}"
+
+
+def profile_from_user(user):
+    """Keep only the parts of a Slack user object the bot uses.
+
+    :param user: The 'user' dict from a users_info response.
+
+    :returns: dict(real_name='...', profile=None | dict(email='...'))
+
+    """
+    profile = user.get("profile")
+    if profile:
+        profile = dict(email=profile.get("email", ""))
+
+    return dict(real_name=user["real_name"], profile=profile)
+
+
+class UserProfileCache(object):
+    """A thread safe LRU + TTL cache of Slack user profiles.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self.hits = 0
+        self.shared_hits = 0
+        self.misses = 0
+
+    def _shared_key(self, user_id):
+        return f"slack-user:{user_id}"
+
+    def _version(self, user_id):
+        """Return the user's shared version, 0 if never changed or unknown."""
+        log = logging.getLogger(__name__)
+
+        try:
+            return cache.get(version_key(user_id), 0)
+
+        except:  # noqa: I'm logging rather than hidding.
+            log.exception(f"Unable to recover user <{user_id}> version: ")
+            return 0
+
+    def _local_get(self, user_id, now):
+        with self._lock:
+            found = self._entries.get(user_id)
+        if found is None:
+            return None
+
+        expires, profile, version, checked = found
+        due = now - checked >= settings.SLACK_USER_CACHE_CHECK_SECONDS
+        if expires > now and due:
+            # Has a user_change been seen by another process?
+            if self._version(user_id) == version:
+                checked = now
+            else:
+                expires = now
+
+        with self._lock:
+            if self._entries.get(user_id) is not found:
+                # Replaced or dropped meanwhile, look again next time:
+                return None
+
+            if expires <= now:
+                del self._entries[user_id]
+                return None
+
+            self._entries[user_id] = (expires, profile, version, checked)
+            self._entries.move_to_end(user_id)
+            self.hits += 1
+            return profile
+
+    def _local_set(self, user_id, profile, version, now):
+        with self._lock:
+            self._entries[user_id] = (
+                now + settings.SLACK_USER_CACHE_TTL, profile, version, now
+            )
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > settings.SLACK_USER_CACHE_SIZE:
+                self._entries.popitem(last=False)
+
+    def get(self, slack_client, user_id):
+        """Return the profile for the Slack user, calling Slack on a miss.
+
+        :param slack_client: The slack web client instance.
+
+        :param user_id: The Slack user id e.g. UGF7MRWMS
+
+        :returns: See profile_from_user().
+
+        """
+        log = logging.getLogger(__name__)
+        now = time.monotonic()
+
+        profile = self._local_get(user_id, now)
+        if profile is not None:
+            CACHE_REQUESTS.inc(cache="slack_user", result="hit")
+            return profile
+
+        # Read before the profile, so a change made meanwhile is noticed:
+        version = self._version(user_id)
+
+        if settings.SLACK_USER_CACHE_SHARED:
+            try:
+                profile = cache.get(self._shared_key(user_id))
+
+            except:  # noqa: I'm logging rather than hidding.
+                log.exception(f"Unable to recover user <{user_id}> from cache: ")
+
+            if profile is not None:
+                with self._lock:
+                    self.shared_hits += 1
+                CACHE_REQUESTS.inc(cache="slack_user", result="shared_hit")
+                self._local_set(user_id, profile, version, now)
+                return profile
+
+        with self._lock:
+            self.misses += 1
+        CACHE_REQUESTS.inc(cache="slack_user", result="miss")
+        log.debug(f"Recovering profile for user <{user_id}>")
+        with api_call("slack", "users_info"):
+            resp = slack_client.users_info(user=user_id)
+        profile = profile_from_user(resp.data["user"])
+        self._local_set(user_id, profile, version, now)
+
+        if settings.SLACK_USER_CACHE_SHARED:
+            try:
+                cache.set(
+                    self._shared_key(user_id),
+                    profile,
+                    timeout=settings.SLACK_USER_CACHE_TTL
+                )
+
+            except:  # noqa: I'm logging rather than hidding.
+                log.exception(f"Unable to store user <{user_id}> in cache: ")
+
+        return profile
+
+    def invalidate(self, user_id):
+        """Forget the user e.g. when they change their name or email.
+
+        Other processes drop the user when they next check its version.
+
+        """
+        log = logging.getLogger(__name__)
+
+        with self._lock:
+            self._entries.pop(user_id, None)
+
+        try:
+            if settings.SLACK_USER_CACHE_SHARED:
+                cache.delete(self._shared_key(user_id))
+            cache.add(version_key(user_id), 0, timeout=None)
+            cache.incr(version_key(user_id))
+
+        except:  # noqa: I'm logging rather than hidding.
+            log.exception(f"Unable to remove user <{user_id}> from cache: ")
+
+    def clear(self):
+        """Forget all users held in this process and reset the counters.
+        """
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.shared_hits = 0
+            self.misses = 0
+
+    def stats(self):
+        """Return the hit and miss counters for this process.
+        """
+        return dict(
+            size=len(self._entries),
+            hits=self.hits,
+            shared_hits=self.shared_hits,
+            misses=self.misses,
+        )
+
+
+profiles = UserProfileCache()
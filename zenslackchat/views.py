@@ -6,7 +6,9 @@ import requests
 from django.conf import settings
 from django.contrib import messages
 from django.contrib.auth.decorators import login_required
+from django.contrib.auth.decorators import permission_required
 from django.http import HttpResponse, JsonResponse
+from django.http import HttpResponseBadRequest, StreamingHttpResponse
 from django.shortcuts import redirect
 from django.template import loader
 from rest_framework import status
@@ -14,8 +16,8 @@ from rest_framework.response import Response
 from urllib.parse import urlencode
 from webapp.celery import run_daily_summary
 from zenslackchat.models import SlackApp, ZendeskApp
-from bs4 import BeautifulSoup
-from datetime import datetime
+from zenslackchat.atlassian_api import get_oncall_support
+from zenslackchat import export
 
 
 def slack_oauth(request):
@@ -150,36 +152,6 @@ def zendesk_oauth(request):
 
 #     return HttpResponse("PagerDutyApp Added OK")
 
-def get_oncall_support(content):
-    """Extract today's Primary and Secondary on-call support from an HTML table."""
-    soup = BeautifulSoup(content, "html.parser")
-
-    today = datetime.today()
-    primary, secondary = None, None
-
-    # Loop through table rows
-    for row in soup.find_all("tr"):
-        cols = row.find_all("td")
-        if len(cols) >= 5:  # Ensure it has necessary columns
-            date_range = cols[0].get_text(strip=True)
-
-            try:
-                # Extract start and end dates
-                start_date_str, end_date_str = date_range.split(" - ")
-                start_date = datetime.strptime(start_date_str, "%d/%m/%y")
-                end_date = datetime.strptime(end_date_str, "%d/%m/%y")
-
-                # Check if today falls within the date range
-                if start_date <= today <= end_date:
-                    primary = cols[1].get_text(strip=True)
-                    secondary = cols[3].get_text(strip=True)
-                    break  # Stop once today's entry is found
-
-            except ValueError:
-                continue  # Skip invalid date formats
-
-    return primary, secondary
-
 
 # Only for dev
 # os.environ["OAUTHLIB_INSECURE_TRANSPORT"] = "1"
@@ -290,6 +262,51 @@ def trigger_daily_report(request):
     return redirect("/")
 
 
+@login_required
+@permission_required("zenslackchat.view_zenslackchat", raise_exception=True)
+def export_conversations(request):
+    """Download the conversations as CSV or NDJSON.
+
+    The query string can give format (csv or ndjson, csv by default), since
+    and until (ISO dates or datetimes of when opened) and channel. The rows
+    are sent a page at a time as they are read (see zenslackchat.export).
+
+    """
+    log = logging.getLogger(__name__)
+
+    format = request.GET.get("format", "csv")
+    if format not in export.FORMATS:
+        return HttpResponseBadRequest(
+            f"Unknown format '{format}'.", content_type="text/plain"
+        )
+
+    try:
+        since = export.parse_when(request.GET.get("since"))
+        until = export.parse_when(request.GET.get("until"))
+
+    except ValueError as error:
+        return HttpResponseBadRequest(str(error), content_type="text/plain")
+
+    filters = dict(
+        since=since,
+        until=until,
+        channel_id=request.GET.get("channel"),
+        size=settings.EXPORT_PAGE_SIZE,
+    )
+    log.info(f"Exporting conversations as {format} for <{request.user}>")
+
+    # Under ASGI a sync stream would be read into memory before being sent:
+    stream = export.astream if settings.SERVE_ASGI else export.stream
+    response = StreamingHttpResponse(
+        stream(format, **filters), content_type=export.FORMATS[format]
+    )
+    response["Content-Disposition"] = (
+        f'attachment; filename="conversations.{format}"'
+    )
+
+    return response
+
+
 # Restrict scope down to what I can interact with..
 ZENDESK_REQUESTED_SCOPES = "%20".join(
     (
@@ -14,6 +14,9 @@ from zenpy.lib import exception
 from zenpy.lib.api_objects import Ticket
 from zenpy.lib.api_objects import Comment
 
+from zenslackchat.metrics import api_call
+from zenslackchat.zendesk_budget import CREATE, priority
+
 
 def zendesk_ticket_url(zendesk_ticket_uri, ticket_id):
     """Return the link that can be stored in zendesk.
@@ -25,6 +28,7 @@ def zendesk_ticket_url(zendesk_ticket_uri, ticket_id):
     return '/'.join([zendesk_ticket_uri.rstrip('/'), str(ticket_id)])
 
 
+@api_call("zendesk", "get_ticket")
 def get_ticket(client, ticket_id):
     """Recover the ticket by it's ID in zendesk.
 
@@ -48,6 +52,8 @@ def get_ticket(client, ticket_id):
     return returned
 
 
+@api_call("zendesk", "create_ticket")
+@priority(CREATE)
 def create_ticket(
     client, chat_id, user_id, group_id, recipient_email, subject,
     slack_message_url
@@ -70,6 +76,9 @@ def create_ticket(
 
     :returns: A Zenpy.Ticket instance.
 
+    Ticket creation is made at CREATE priority so it may use the Zendesk
+    rate budget kept back from the webhook syncs.
+
     """
     log = logging.getLogger(__name__)
 
@@ -106,6 +115,7 @@ def create_ticket(
     return ticket_audit.ticket
 
 
+@api_call("zendesk", "add_comment")
 def add_comment(client, ticket, comment):
     """Add a new comment to an existing ticket.
 
@@ -134,6 +144,7 @@ def add_comment(client, ticket, comment):
     return ticket
 
 
+@api_call("zendesk", "close_ticket")
 def close_ticket(client, ticket_id):
     """Close a ticket in zendesk.
 
@@ -156,3 +167,51 @@ def close_ticket(client, ticket_id):
         log.debug(f'Closed ticket:<{ticket.id}> for ticket_id:<{ticket_id}>')
 
     return ticket
+
+
+@api_call("zendesk", "comments_since")
+def comments_since(client, ticket_id, after_id=None):
+    """Recover the comments on a ticket newer than a given comment.
+
+    :param client: The Zendesk web client to use.
+
+    :param ticket_id: The Zendesk Ticket ID.
+
+    :param after_id: The optional ID of the last comment already seen.
+
+    :returns: A list of Zenpy Comment instances oldest first.
+
+    Without after_id this returns all comments. Otherwise the comments are
+    requested newest first and only the pages up to after_id are fetched.
+
+    """
+    log = logging.getLogger(__name__)
+
+    if after_id is None:
+        return list(client.tickets.comments(ticket=ticket_id))
+
+    # Zenpy's tickets.comments() doesn't allow the sort to be given. With
+    # cursor pagination Zendesk sorts by "sort" and ignores "sort_order":
+    api = client.tickets
+    newest_first = api._get(api._build_url(api.endpoint.comments(
+        ticket_id, cursor_pagination=True, sort='-created_at'
+    )))
+
+    returned = []
+    previous_id = None
+    for comment in newest_first:
+        if comment.id > after_id:
+            returned.append(comment)
+
+        elif previous_id is not None and comment.id < previous_id:
+            # Only stop once I know I'm going newest first, otherwise keep
+            # going through them all.
+            break
+
+        previous_id = comment.id
+
+    log.debug(
+        f'{len(returned)} comment(s) after:<{after_id}> on ticket:<{ticket_id}>'
+    )
+
+    return sorted(returned, key=lambda comment: comment.id)
@@ -6,6 +6,7 @@ from rest_framework.views import APIView
 from rest_framework.response import Response
 
 from webapp import settings
+from zenslackchat.client_registry import LazyClient
 from zenslackchat.models import SlackApp
 from zenslackchat.models import ZendeskApp
 
@@ -27,24 +28,36 @@ class BaseWebHook(APIView):
         will be logged instead. This is to prevent Zendesk from think our end
         point is broken and not sending any further events.
 
+        The clients are only built if handle_event actually uses them.
+
+        """
+        status_code, body = self.receive(request.data)
+        return Response(body, status=status_code)
+
+    def receive(self, data, dispatch=None):
+        """Check the token and handle the POSTed data.
+
+        :param dispatch: Called with the data once the token has been checked,
+        by default self.dispatch_event. The async version of the view (see
+        zenslackchat.async_views) passes its own to respond before the data
+        is handled.
+
+        :returns: (HTTP status code, response body or None)
+
         """
         log = logging.getLogger(__name__)
-        response = Response('OK, Thanks', status=200)
+        returned = (status.HTTP_200_OK, 'OK, Thanks')
 
         if settings.DEBUG:
-            log.debug(f'Raw POSTed data:\n{pprint.pformat(request.data)}')
+            log.debug(f'Raw POSTed data:\n{pprint.pformat(data)}')
 
         try:
-            token = request.data.get(
+            token = data.get(
                 'token', '<token not set in webhook request body JSON>'
             )
 
             if token == settings.ZENDESK_WEBHOOK_TOKEN:
-                self.handle_event(
-                    request.data,
-                    slack_client=SlackApp.client(),
-                    zendesk_client=ZendeskApp.client()
-                )
+                (dispatch or self.dispatch_event)(data)
 
             else:
                 log.error(
@@ -58,13 +71,31 @@ class BaseWebHook(APIView):
                         f"match ours '{settings.ZENDESK_WEBHOOK_TOKEN}'"
                     )
 
-                response = Response(status=status.HTTP_403_FORBIDDEN)
+                returned = (status.HTTP_403_FORBIDDEN, None)
 
         except: # noqa: I'm logging rather than hidding.
             # I need to respond OK or I won't receive further events.
             log.exception('Failed handling webhook because:')
 
-        return response
+        return returned
+
+    def dispatch_event(self, data):
+        """Call handle_event with our clients, logging any exception.
+
+        :param data: The POSTed dict of fields.
+
+        """
+        log = logging.getLogger(__name__)
+
+        try:
+            self.handle_event(
+                data,
+                slack_client=LazyClient(SlackApp.client),
+                zendesk_client=LazyClient(ZendeskApp.client)
+            )
+
+        except: # noqa: I'm logging rather than hidding.
+            log.exception('Failed handling webhook because:')
 
     def handle_event(self, event, slack_client, zendesk_client):
         """Over-ridden to implement event handling.
@@ -0,0 +1,221 @@
+"""
+Share Zendesk's per-minute API quota between every web and worker process.
+
+Zendesk returns the account's limit and the calls left this minute in the
+X-Rate-Limit and X-Rate-Limit-Remaining headers (ratelimit-* on newer
+endpoints). RateBudget.record() keeps these in the django cache (redis), so
+every process sees the same count. Before each request RateBudget.admit()
+takes one from it.
+
+Calls are made at a priority, set with priority() around them. Ticket
+creation (CREATE), and setting up an issue for an emailed ticket, may use the
+whole quota. INTERACTIVE calls, the default, leave ZENDESK_RESERVE_INTERACTIVE
+of it for ticket creation and BACKGROUND calls (the comment webhooks) leave
+ZENDESK_RESERVE_BACKGROUND of it. A call without enough budget waits for the minute to reset, but not for
+longer than ZENDESK_BUDGET_MAX_WAIT seconds.
+
+A 429 holds off every process for its Retry-After. Zenpy itself then sleeps
+and retries the call.
+
+"""
+import contextlib
+import contextvars
+import logging
+import time
+
+import requests.adapters
+from django.conf import settings
+from django.core.cache import cache
+
+from zenslackchat.metrics import ZENDESK_BUDGET_WAIT
+from zenslackchat.metrics import ZENDESK_RATE_LIMITED
+
+
+CREATE = "create"
+INTERACTIVE = "interactive"
+BACKGROUND = "background"
+
+LIMIT_KEY = "zendesk-rate:limit"
+REMAINING_KEY = "zendesk-rate:remaining"
+PAUSED_KEY = "zendesk-rate:paused-until"
+
+_priority = contextvars.ContextVar("zendesk_priority", default=INTERACTIVE)
+
+
+@contextlib.contextmanager
+def priority(level):
+    """Make the Zendesk calls inside at CREATE, INTERACTIVE or BACKGROUND.
+
+    This can also be used to decorate a function.
+
+    """
+    token = _priority.set(level)
+    try:
+        yield level
+
+    finally:
+        _priority.reset(token)
+
+
+def current_priority():
+    return _priority.get()
+
+
+def reserved(level, limit):
+    """The calls a minute kept back from the level for higher priorities."""
+    share = {
+        CREATE: 0,
+        INTERACTIVE: settings.ZENDESK_RESERVE_INTERACTIVE,
+        BACKGROUND: settings.ZENDESK_RESERVE_BACKGROUND,
+    }[level]
+    return int(limit * share)
+
+
+def header(headers, *names):
+    """Return the first of the headers found as an int or None."""
+    for name in names:
+        value = headers.get(name)
+        if value is not None:
+            try:
+                return int(float(value))
+
+            except ValueError:
+                pass
+
+    return None
+
+
+class RateBudget(object):
+    """The Zendesk calls left this minute, shared through the django cache.
+
+    :param sleep: Called to wait (time.sleep by default).
+
+    :param clock: Returns the time in seconds (time.time by default). This is
+    compared between processes so it must be the wall clock.
+
+    """
+    def __init__(self, sleep=time.sleep, clock=time.time):
+        self.sleep = sleep
+        self.clock = clock
+
+    def take(self, level):
+        """Take a call from the budget.
+
+        :returns: 0 if the call can go ahead, otherwise the seconds to wait
+        before trying again.
+
+        """
+        now = self.clock()
+        paused_until = cache.get(PAUSED_KEY)
+        if paused_until and paused_until > now:
+            return paused_until - now
+
+        try:
+            remaining = cache.decr(REMAINING_KEY)
+
+        except ValueError:
+            # Nothing is known until Zendesk answers, or the minute reset.
+            return 0
+
+        limit = cache.get(LIMIT_KEY) or 0
+        if remaining >= reserved(level, limit):
+            return 0
+
+        # Give it back for the higher priority calls:
+        cache.incr(REMAINING_KEY)
+        return settings.ZENDESK_BUDGET_POLL
+
+    def admit(self, level=None):
+        """Wait until the call can be made within the budget.
+
+        :param level: Optional. The priority, by default the current one.
+
+        :returns: The seconds waited.
+
+        """
+        log = logging.getLogger(__name__)
+
+        level = level or current_priority()
+        started = self.clock()
+        deadline = started + settings.ZENDESK_BUDGET_MAX_WAIT
+        while True:
+            try:
+                wait = self.take(level)
+
+            except:  # noqa: I'm logging rather than hidding.
+                log.exception("Unable to check the Zendesk rate budget: ")
+                wait = 0
+
+            if not wait:
+                break
+
+            now = self.clock()
+            if now >= deadline:
+                log.warning(
+                    f"Making a {level} Zendesk call after waiting "
+                    f"{now - started:.1f}s for the rate budget."
+                )
+                break
+
+            self.sleep(min(wait, deadline - now))
+
+        waited = self.clock() - started
+        ZENDESK_BUDGET_WAIT.observe(waited, priority=level)
+        return waited
+
+    def record(self, response):
+        """Update the shared budget from a Zendesk response's headers."""
+        log = logging.getLogger(__name__)
+
+        headers = response.headers
+        limit = header(headers, 'X-Rate-Limit', 'ratelimit-limit')
+        remaining = header(
+            headers, 'X-Rate-Limit-Remaining', 'ratelimit-remaining'
+        )
+        # Zendesk counts calls per minute on the clock unless told otherwise:
+        reset = header(headers, 'ratelimit-reset') or (
+            60 - int(self.clock() % 60)
+        )
+
+        try:
+            if limit is not None:
+                cache.set(LIMIT_KEY, limit, timeout=None)
+
+            if response.status_code == 429:
+                retry_after = header(headers, 'Retry-After') or 60
+                log.warning(f"Zendesk rate limited for {retry_after}s.")
+                ZENDESK_RATE_LIMITED.inc(priority=current_priority())
+                cache.set(
+                    PAUSED_KEY, self.clock() + retry_after,
+                    timeout=retry_after + 1
+                )
+                # The next answer after the pause gives the new count:
+                cache.delete(REMAINING_KEY)
+
+            elif remaining is not None:
+                cache.set(REMAINING_KEY, remaining, timeout=max(reset, 1))
+
+        except:  # noqa: I'm logging rather than hidding.
+            log.exception("Unable to record the Zendesk rate budget: ")
+
+    def remaining(self):
+        """Return (calls left this minute, limit) with None if not known."""
+        return cache.get(REMAINING_KEY), cache.get(LIMIT_KEY)
+
+
+budget = RateBudget()
+
+
+class BudgetAdapter(requests.adapters.HTTPAdapter):
+    """Keep each Zenpy request within the shared Zendesk rate budget."""
+
+    def send(self, request, **kwargs):
+        if settings.ZENDESK_BUDGET:
+            budget.admit()
+
+        response = super().send(request, **kwargs)
+
+        if settings.ZENDESK_BUDGET:
+            budget.record(response)
+
+        return response
@@ -8,12 +8,20 @@ Oisin Mulvihill
 """
 import logging
 
+from zenslackchat.metrics import api_call
+from zenslackchat.metrics import count_queries
 from zenslackchat.models import ZenSlackChat
 from zenslackchat.models import NotFoundError
 from zenslackchat.slack_api import post_message
+from zenslackchat.zendesk_api import comments_since
+from zenslackchat.message_tools import message_hash
+from zenslackchat.message_tools import message_hashes
 from zenslackchat.message_tools import messages_for_slack
+from zenslackchat.zendesk_budget import BACKGROUND, priority
 
 
+@count_queries("zendesk.comments_from_zendesk")
+@priority(BACKGROUND)
 def comments_from_zendesk(event, slack_client, zendesk_client):
     """Handle the raw event from a Zendesk webhook and return without error.
 
@@ -39,24 +47,49 @@ def comments_from_zendesk(event, slack_client, zendesk_client):
         )
         return []
 
-    # Recover all messages from the slack conversation:
-    resp = slack_client.conversations_replies(
-        channel=issue.channel_id, ts=chat_id
-    )
-    slack = [message for message in resp.data['messages']]
+    # Recover only the slack replies since the last sync. The parent message
+    # is always returned so filter out what's been seen:
+    cursor = issue.slack_cursor
+    kwargs = dict(channel=issue.channel_id, ts=chat_id)
+    if cursor:
+        kwargs['oldest'] = cursor
+    with api_call("slack", "conversations_replies"):
+        resp = slack_client.conversations_replies(**kwargs)
+    slack = [
+        message for message in resp.data['messages']
+        if not cursor or float(message['ts']) > float(cursor)
+    ]
 
-    # Recover all comments on this ticket:
+    # Recover only the comments added to the ticket since the last sync:
     zendesk = [
         comment.to_dict()
-        for comment in zendesk_client.tickets.comments(ticket=ticket_id)
+        for comment in comments_since(
+            zendesk_client, ticket_id, issue.zendesk_cursor
+        )
     ]
 
-    # Work out what needs to be posted to slack:
-    for_slack = messages_for_slack(slack, zendesk)
+    # Work out what needs to be posted to slack. Only new slack replies the
+    # bot hasn't mirrored need to be normalized, the rest are in the index:
+    known, mirrored = issue.hash_index()
+    seen = message_hashes(
+        [message for message in slack if message['ts'] not in mirrored]
+    )
+    for_slack = messages_for_slack([], zendesk, known=known | set(seen))
 
     # Update the slack conversation:
     for message in for_slack:
         msg = f"(Zendesk): {message['body']}"
-        post_message(slack_client, chat_id, issue.channel_id, msg)
+        resp = post_message(slack_client, chat_id, issue.channel_id, msg)
+        seen[message_hash(msg)] = resp['ts']
+
+    issue.remember_hashes(seen)
+    issue.advance_cursors(
+        zendesk_cursor=max(
+            [comment['id'] for comment in zendesk], default=None
+        ),
+        slack_cursor=max(
+            [message['ts'] for message in slack], default=None, key=float
+        ),
+    )
 
     return for_slack
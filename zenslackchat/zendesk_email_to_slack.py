@@ -10,18 +10,22 @@ Oisin Mulvihill
 import logging
 
 from webapp import settings
+from zenslackchat.follow_ups import in_background, result
 from zenslackchat.message_tools import message_issue_zendesk_url, message_who_is_on_call
-from zenslackchat.models import PagerDutyApp, SlackApp, ZendeskApp, ZenSlackChat
+from zenslackchat.metrics import api_call, count_queries
+from zenslackchat.models import ZenSlackChat
+from zenslackchat.oncall import PAGERDUTY, on_call_roster
 from zenslackchat.slack_api import create_thread, message_url
 from zenslackchat.zendesk_api import add_comment, get_ticket
+from zenslackchat.zendesk_budget import CREATE, priority
 
 
+@count_queries("zendesk.email_from_zendesk")
+@priority(CREATE)
 def email_from_zendesk(event, slack_client, zendesk_client):
     """Open a ZenSlackChat issue and link it to the existing Zendesk Ticket."""
     log = logging.getLogger(__name__)
 
-    zendesk = ZendeskApp.client()
-    slack = SlackApp.client()
     ticket_id = event["ticket_id"]
     channel_id = settings.SRE_SUPPORT_CHANNEL
     user_id = settings.ZENDESK_USER_ID
@@ -29,9 +33,15 @@ def email_from_zendesk(event, slack_client, zendesk_client):
     zendesk_ticket_uri = settings.ZENDESK_TICKET_URI
     slack_workspace_uri = settings.SLACK_WORKSPACE_URI
 
+    # Find out who is on call while the issue is set up. Only
+    # PagerDuty's roster is posted and not at all with USE_ATLASSIAN:
+    roster = None
+    if not settings.USE_ATLASSIAN:
+        roster = in_background(on_call_roster, source=PAGERDUTY)
+
     # Recover the zendesk issue the email has already created:
     log.debug(f"Recovering ticket from Zendesk:<{ticket_id}>")
-    ticket = get_ticket(zendesk, ticket_id)
+    ticket = get_ticket(zendesk_client, ticket_id)
 
     # We need to create a new thread for this on the slack channel.
     # We will then add the usual message to this new thread.
@@ -39,7 +49,7 @@ def email_from_zendesk(event, slack_client, zendesk_client):
     # Include descrition as next comment before who is on call to slack
     # to give SREs more context:
     message = f"(From Zendesk Email): {ticket.subject}"
-    chat_id = create_thread(slack, channel_id, message)
+    chat_id = create_thread(slack_client, channel_id, message)
 
     # Assign the ticket to ZenSlackChat group and user so comments will
     # come back to us on slack.
@@ -49,7 +59,8 @@ def email_from_zendesk(event, slack_client, zendesk_client):
     ticket.group_id = group_id
     # Set to route comments back from zendesk to slack:
     ticket.external_id = chat_id
-    zendesk.tickets.update(ticket)
+    with api_call("zendesk", "update_ticket"):
+        zendesk_client.tickets.update(ticket)
 
     # Store the zendesk ticket in our db and notify:
     ZenSlackChat.open(channel_id, chat_id, ticket_id=ticket.id)
@@ -57,11 +68,7 @@ def email_from_zendesk(event, slack_client, zendesk_client):
         slack_client, zendesk_ticket_uri, ticket_id, chat_id, channel_id
     )
 
-    app_token = PagerDutyApp.client()
-
-    message_who_is_on_call(
-        PagerDutyApp.on_call(app_token=app_token), slack_client, chat_id, channel_id
-    )
+    message_who_is_on_call(result(roster, {}), slack_client, chat_id, channel_id)
 
     # Indicate on the existing Zendesk ticket that the SRE team now knows
     # about this issue.